@@ -0,0 +1,457 @@
+# -*- coding: utf-8 -*-
+# SCFBuild is released under the GNU General Public License v3.
+# See LICENSE.txt in the project root directory.
+'''
+Baking of the color SVG transform into the coordinates of the content
+
+Instead of wrapping the content in a <g transform>, the glyph transform and
+the transforms of the elements are applied to the path data, basic shapes,
+stroke widths and user space gradients, so the renderer has no matrix to
+apply on every draw. Content that can't be rewritten, such as images, text,
+use references, clip paths, masks, filters, markers, dashed strokes or arcs
+under a non-uniform scale, raises BakeError.
+'''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import logging
+import math
+import re
+
+from . import svg_path
+from .minify import DEFAULT_PRECISION, XLINK_NS, split_tag
+from .svg_path import format_number, parse_transform
+
+logger = logging.getLogger(__name__)
+
+CONTAINER_ELEMENTS = frozenset(['g'])
+SHAPE_ELEMENTS = frozenset(['path', 'rect', 'circle', 'ellipse', 'line',
+                            'polygon', 'polyline'])
+# Elements that are not drawn where they are defined. Gradients are
+# rewritten for the shapes using them, anything else in defs can only be
+# used by content that raises BakeError.
+SKIPPED_ELEMENTS = frozenset(['defs', 'linearGradient', 'radialGradient',
+                              'metadata', 'title', 'desc'])
+GRADIENT_ELEMENTS = frozenset(['linearGradient', 'radialGradient'])
+# Properties with content that would need its own rewrite.
+UNSUPPORTED_PROPERTIES = ('clip-path', 'mask', 'filter', 'marker',
+                          'marker-start', 'marker-mid', 'marker-end',
+                          'vector-effect')
+# Inherited properties used to rewrite the shapes.
+INHERITED_PROPERTIES = ('fill', 'stroke', 'stroke-width', 'stroke-dasharray')
+GEOMETRY_ATTRIBS = ('x', 'y', 'width', 'height', 'cx', 'cy', 'r', 'rx', 'ry')
+
+LENGTH_RE = re.compile(r'^(' + svg_path.NUMBER + r')(px)?$')
+URL_RE = re.compile(r'^url\(\s*[\'"]?#([^\'")\s]+)[\'"]?\s*\)')
+
+
+class BakeError(Exception):
+    pass
+
+
+def parse_length(value):
+    """
+    Parse a length in user units, other units and percentages need the
+    viewport and are not supported.
+    """
+    match = LENGTH_RE.match(value.strip())
+    if match is None:
+        raise BakeError('Unsupported length: {}'.format(value))
+    return float(match.group(1))
+
+
+def get_length(element, name, default=None):
+    value = element.get(name)
+    if value is None:
+        if default is None:
+            raise BakeError('Missing {} of {}'.format(
+                name, split_tag(element.tag)[1]))
+        return default
+    return parse_length(value)
+
+
+def get_property(element, name):
+    """
+    Get a presentation attribute, the style attribute overrides it.
+    """
+    value = element.get(name)
+    for declaration in element.get('style', '').split(';'):
+        (key, _, style_value) = declaration.partition(':')
+        if key.strip() == name:
+            value = style_value.strip()
+    return value
+
+
+def set_property(element, name, value):
+    """
+    Set a presentation attribute, or the style declaration if there is one.
+    """
+    declarations = element.get('style', '').split(';')
+    for index, declaration in enumerate(declarations):
+        if declaration.partition(':')[0].strip() == name:
+            declarations[index] = '{}:{}'.format(name, value)
+            element.set('style', ';'.join(declarations))
+            return
+    element.set(name, value)
+
+
+def is_close(a, b):
+    return abs(a - b) <= 1e-9 * max(1.0, abs(a), abs(b))
+
+
+def is_axis_aligned(transform):
+    """
+    Does the transform only scale and translate?
+    """
+    return is_close(transform.xy, 0) and is_close(transform.yx, 0)
+
+
+def get_uniform_scale(transform):
+    """
+    Get the scale factor of a transform that keeps circles circles, None
+    for a non-uniform scale or skew.
+    """
+    (a, b, c, d) = transform[:4]
+    if not is_close(a * a + b * b, c * c + d * d) or \
+            not is_close(a * c + b * d, 0):
+        return None
+    return math.sqrt(abs(a * d - b * c))
+
+
+def transform_path(segments, transform):
+    """
+    Apply a transform to the segments of parse_path(). Relative commands
+    stay relative, H and V become lines when the transform rotates or
+    skews.
+    """
+    axis_aligned = is_axis_aligned(transform)
+    (x, y) = (start_x, start_y) = (0, 0)
+    transformed = []
+    for index, (command, args) in enumerate(segments):
+        if index == 0 and command == 'm':
+            # A relative moveto at the start is absolute.
+            command = 'M'
+        upper = command.upper()
+        absolute = command == upper
+        if upper == 'Z':
+            transformed.append((command, []))
+            (x, y) = (start_x, start_y)
+            continue
+
+        if upper in 'HV':
+            value = args[0]
+            if upper == 'H':
+                end = (value if absolute else x + value, y)
+            else:
+                end = (x, value if absolute else y + value)
+            if axis_aligned and upper == 'H':
+                offset = transform.dx if absolute else 0
+                transformed.append((command, [transform.xx * value + offset]))
+            elif axis_aligned:
+                offset = transform.dy if absolute else 0
+                transformed.append((command, [transform.yy * value + offset]))
+            elif absolute:
+                transformed.append(('L', list(transform.transformPoint(end))))
+            else:
+                transformed.append(('l', list(transform.transformVector(
+                    (end[0] - x, end[1] - y)))))
+            (x, y) = end
+            continue
+
+        if upper == 'A':
+            scale = get_uniform_scale(transform)
+            if scale is None:
+                raise BakeError('Arc with a non-uniform transform')
+            (rx, ry, rotation, large_arc, sweep) = args[:5]
+            angle = math.degrees(math.atan2(transform.xy, transform.xx))
+            if transform.xx * transform.yy - transform.xy * transform.yx < 0:
+                # Mirrored
+                rotation = angle - rotation
+                sweep = 1 - sweep
+            else:
+                rotation = angle + rotation
+            new_args = [rx * scale, ry * scale, rotation % 360, large_arc,
+                        sweep]
+            points = [args[5:]]
+        else:
+            new_args = []
+            points = [args[i:i + 2] for i in range(0, len(args), 2)]
+
+        for point in points:
+            if absolute:
+                new_args.extend(transform.transformPoint(point))
+            else:
+                new_args.extend(transform.transformVector(point))
+        transformed.append((command, new_args))
+        if absolute:
+            (x, y) = points[-1]
+        else:
+            (x, y) = (x + points[-1][0], y + points[-1][1])
+        if upper == 'M':
+            (start_x, start_y) = (x, y)
+    return transformed
+
+
+def set_path(element, segments, transform, precision):
+    """
+    Replace a basic shape with a path of the transformed segments.
+    """
+    for name in GEOMETRY_ATTRIBS:
+        element.attrib.pop(name, None)
+    (namespace, _) = split_tag(element.tag)
+    element.tag = 'path' if namespace is None else \
+        '{%s}path' % namespace
+    element.set('d', svg_path.format_path(
+        transform_path(segments, transform), precision))
+
+
+def ellipse_segments(cx, cy, rx, ry):
+    # Quarter arcs, the center of a half arc is lost when the end points
+    # are rounded.
+    return [('M', [cx + rx, cy]),
+            ('A', [rx, ry, 0, 0, 1, cx, cy + ry]),
+            ('A', [rx, ry, 0, 0, 1, cx - rx, cy]),
+            ('A', [rx, ry, 0, 0, 1, cx, cy - ry]),
+            ('A', [rx, ry, 0, 0, 1, cx + rx, cy]),
+            ('Z', [])]
+
+
+def bake_rect(element, transform, precision):
+    x = get_length(element, 'x', 0)
+    y = get_length(element, 'y', 0)
+    width = get_length(element, 'width')
+    height = get_length(element, 'height')
+    # A missing corner radius is the same as the other.
+    rx = element.get('rx', element.get('ry', '0'))
+    ry = element.get('ry', rx)
+    rx = min(parse_length(rx), width / 2)
+    ry = min(parse_length(ry), height / 2)
+
+    if is_axis_aligned(transform):
+        (x0, y0) = transform.transformPoint((x, y))
+        (x1, y1) = transform.transformPoint((x + width, y + height))
+        element.set('x', format_number(min(x0, x1), precision))
+        element.set('y', format_number(min(y0, y1), precision))
+        element.set('width', format_number(abs(x1 - x0), precision))
+        element.set('height', format_number(abs(y1 - y0), precision))
+        if rx > 0 and ry > 0:
+            element.set('rx', format_number(abs(transform.xx) * rx,
+                                            precision))
+            element.set('ry', format_number(abs(transform.yy) * ry,
+                                            precision))
+        return
+
+    # Rotated or skewed
+    if rx > 0 and ry > 0:
+        segments = [
+            ('M', [x + rx, y]), ('H', [x + width - rx]),
+            ('A', [rx, ry, 0, 0, 1, x + width, y + ry]),
+            ('V', [y + height - ry]),
+            ('A', [rx, ry, 0, 0, 1, x + width - rx, y + height]),
+            ('H', [x + rx]),
+            ('A', [rx, ry, 0, 0, 1, x, y + height - ry]),
+            ('V', [y + ry]),
+            ('A', [rx, ry, 0, 0, 1, x + rx, y]), ('Z', [])]
+    else:
+        segments = [('M', [x, y]), ('H', [x + width]),
+                    ('V', [y + height]), ('H', [x]), ('Z', [])]
+    set_path(element, segments, transform, precision)
+
+
+def bake_ellipse(element, tag, transform, precision):
+    cx = get_length(element, 'cx', 0)
+    cy = get_length(element, 'cy', 0)
+    if tag == 'circle':
+        rx = ry = get_length(element, 'r', 0)
+    else:
+        rx = get_length(element, 'rx')
+        ry = get_length(element, 'ry')
+
+    if not is_axis_aligned(transform):
+        set_path(element, ellipse_segments(cx, cy, rx, ry), transform,
+                 precision)
+        return
+
+    (cx, cy) = transform.transformPoint((cx, cy))
+    element.set('cx', format_number(cx, precision))
+    element.set('cy', format_number(cy, precision))
+    rx *= abs(transform.xx)
+    ry *= abs(transform.yy)
+    if tag == 'circle' and is_close(rx, ry):
+        element.set('r', format_number(rx, precision))
+        return
+    if tag == 'circle':
+        # A circle under a non-uniform scale
+        del element.attrib['r']
+        (namespace, _) = split_tag(element.tag)
+        element.tag = 'ellipse' if namespace is None else \
+            '{%s}ellipse' % namespace
+    element.set('rx', format_number(rx, precision))
+    element.set('ry', format_number(ry, precision))
+
+
+def bake_shape(element, tag, transform, inherited, precision):
+    if tag == 'path':
+        segments = svg_path.parse_path(element.get('d', ''))
+        element.set('d', svg_path.format_path(
+            transform_path(segments, transform), precision))
+    elif tag == 'rect':
+        bake_rect(element, transform, precision)
+    elif tag in ('circle', 'ellipse'):
+        bake_ellipse(element, tag, transform, precision)
+    elif tag == 'line':
+        for x_name, y_name in (('x1', 'y1'), ('x2', 'y2')):
+            point = transform.transformPoint(
+                (get_length(element, x_name, 0),
+                 get_length(element, y_name, 0)))
+            element.set(x_name, format_number(point[0], precision))
+            element.set(y_name, format_number(point[1], precision))
+    else:
+        numbers = [float(number) for number in
+                   svg_path.NUMBER_RE.findall(element.get('points', ''))]
+        transformed = []
+        for index in range(0, len(numbers) - 1, 2):
+            transformed.extend(transform.transformPoint(
+                numbers[index:index + 2]))
+        element.set('points', svg_path.join_numbers(
+            [format_number(number, precision) for number in transformed]))
+
+    if inherited.get('stroke', 'none') == 'none':
+        return
+    # The stroke width is in the user space of the shape.
+    scale = get_uniform_scale(transform)
+    if scale is None:
+        raise BakeError('Stroke with a non-uniform transform')
+    if inherited.get('stroke-dasharray', 'none') != 'none':
+        raise BakeError('Dashed stroke')
+    width = parse_length(inherited.get('stroke-width', '1'))
+    set_property(element, 'stroke-width', format_number(width * scale,
+                                                        precision))
+
+
+def bake_element(element, transform, inherited, references, precision):
+    for child in element:
+        if not isinstance(child.tag, str):
+            continue
+        (_, tag) = split_tag(child.tag)
+        if tag in SKIPPED_ELEMENTS:
+            continue
+        if tag not in CONTAINER_ELEMENTS and tag not in SHAPE_ELEMENTS:
+            raise BakeError('Unsupported element: {}'.format(tag))
+        for name in UNSUPPORTED_PROPERTIES:
+            if get_property(child, name) not in (None, 'none'):
+                raise BakeError('Unsupported {}'.format(name))
+        if get_property(child, 'transform') != child.get('transform'):
+            raise BakeError('Transform in a style attribute')
+
+        child_transform = transform
+        if child.get('transform') is not None:
+            child_transform = transform.transform(
+                parse_transform(child.get('transform')))
+            del child.attrib['transform']
+
+        child_inherited = dict(inherited)
+        for name in INHERITED_PROPERTIES:
+            value = get_property(child, name)
+            if value is not None and value != 'inherit':
+                child_inherited[name] = value
+
+        if tag in CONTAINER_ELEMENTS:
+            bake_element(child, child_transform, child_inherited, references,
+                         precision)
+            continue
+
+        bake_shape(child, tag, child_transform, child_inherited, precision)
+        for name in ('fill', 'stroke'):
+            match = URL_RE.match(child_inherited.get(name, ''))
+            if match:
+                references.setdefault(match.group(1), []).append(
+                    child_transform)
+
+
+def bake_gradient(gradient, tag, transform, precision):
+    units = gradient.get('gradientUnits', 'objectBoundingBox')
+    if units != 'userSpaceOnUse':
+        # The bounding box of the baked shape is the transformed bounding
+        # box, unless the transform rotates, skews or mirrors.
+        if not is_axis_aligned(transform) or transform.xx < 0 or \
+                transform.yy < 0:
+            raise BakeError('Bounding box gradient with a rotation')
+        return
+
+    matrix = transform.transform(
+        parse_transform(gradient.get('gradientTransform', '')))
+    scale = get_uniform_scale(matrix)
+    if scale is None:
+        # Linear gradients would not stay perpendicular and radial ones
+        # would not stay circles, keep the coordinates.
+        gradient.set('gradientTransform', 'matrix({})'.format(
+            ' '.join(format_number(value) for value in matrix)))
+        return
+    gradient.attrib.pop('gradientTransform', None)
+
+    if tag == 'linearGradient':
+        # The default x2 is 100% of the viewport.
+        points = [('x1', 'y1', 0, 0), ('x2', 'y2', None, 0)]
+        lengths = []
+    else:
+        points = [('cx', 'cy', None, None)]
+        if 'fx' in gradient.attrib or 'fy' in gradient.attrib:
+            points.append(('fx', 'fy', get_length(gradient, 'cx'),
+                           get_length(gradient, 'cy')))
+        lengths = [('r', None), ('fr', 0)]
+
+    for x_name, y_name, x_default, y_default in points:
+        point = matrix.transformPoint(
+            (get_length(gradient, x_name, x_default),
+             get_length(gradient, y_name, y_default)))
+        gradient.set(x_name, format_number(point[0], precision))
+        gradient.set(y_name, format_number(point[1], precision))
+    for name, default in lengths:
+        value = get_length(gradient, name, default)
+        if value or name in gradient.attrib:
+            gradient.set(name, format_number(value * scale, precision))
+
+
+def bake_gradients(svg_root, references, precision):
+    """
+    Rewrite the gradients used by the baked shapes.
+    """
+    elements = dict((element.get('id'), element)
+                    for element in svg_root.iter() if element.get('id'))
+    for element_id, transforms in references.items():
+        gradient = elements.get(element_id)
+        if gradient is None:
+            continue
+        (_, tag) = split_tag(gradient.tag)
+        if tag not in GRADIENT_ELEMENTS:
+            raise BakeError('Fill or stroke with a {}'.format(tag))
+        if gradient.get('{%s}href' % XLINK_NS) or gradient.get('href'):
+            raise BakeError('Gradient referencing another gradient')
+        transform = transforms[0]
+        for other in transforms[1:]:
+            if not all(is_close(a, b) for a, b in zip(transform, other)):
+                raise BakeError('Gradient used with different transforms')
+        bake_gradient(gradient, tag, transform, precision)
+
+
+def bake_transform(svg_root, transform, precision=DEFAULT_PRECISION):
+    """
+    Apply a fontTools Transform to the content of the SVG root in place,
+    the coordinates are rounded to precision decimal places. Raises
+    BakeError if the content can't be rewritten, the SVG is then partly
+    changed.
+    """
+    inherited = {}
+    for name in INHERITED_PROPERTIES:
+        value = get_property(svg_root, name)
+        if value is not None:
+            inherited[name] = value
+    references = {}
+    try:
+        bake_element(svg_root, transform, inherited, references, precision)
+    except ValueError as e:
+        # Invalid path data or transform
+        raise BakeError(str(e))
+    bake_gradients(svg_root, references, precision)
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+# SCFBuild is released under the GNU General Public License v3.
+# See LICENSE.txt in the project root directory.
+'''
+Build several fonts from one manifest, sharing the work they have in common
+
+The manifest is a YAML build configuration with a list of fonts. The
+settings of each font are merged over the shared configuration:
+
+    glyph_svg_dir: svg/glyphs
+    color_svg_dir: svg/color
+    fonts:
+      - output_file: build/Emoji.ttf
+        table_name:
+          family: Emoji
+      - output_file: build/EmojiShifted.ttf
+        color_transform: translate(0 -1700) scale(2.048)
+'''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import copy
+import json
+import logging
+import multiprocessing
+
+from . import ligatures
+from . import util
+from .builder import Builder, outline_backend
+from .cache import open_cache
+from .sources import SourceFinder
+from .svg_index import SvgIndex
+
+logger = logging.getLogger(__name__)
+
+# Values of these keys are merged with the shared values instead of
+# replacing them.
+MERGED_KEYS = frozenset(['table_name'])
+
+
+def merge_conf(conf, font_conf):
+    """
+    Create the configuration of one font of the batch.
+    """
+    merged = copy.deepcopy(conf)
+    for key, value in font_conf.items():
+        if key in MERGED_KEYS and isinstance(value, dict):
+            merged.setdefault(key, {}).update(value)
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+
+def fork_context():
+    """
+    The fork start method lets the workers use the prepared cache and SVG
+    index without pickling them. None where it isn't available.
+    """
+    try:
+        return multiprocessing.get_context('fork')
+    except (AttributeError, ValueError):
+        return None
+
+
+class Batch(object):
+
+    def __init__(self, confs):
+        self.builders = [Builder(conf) for conf in confs]
+        self.cache = None
+
+    def prepare(self):
+        """
+        Share one cache, and an SVG index and sequence trie for each
+        distinct setting, between all fonts. Create the outlines for each
+        distinct outline setting once.
+        """
+        conf = dict(self.builders[0].conf, cache_memory=True)
+        self.cache = open_cache(conf)
+        indexes = {}
+        tries = {}
+        for builder in self.builders:
+            builder.cache = self.cache
+            builder.prune_cache = False
+            finder = SourceFinder(builder.conf)
+            key = json.dumps(finder.options())
+            if key not in indexes:
+                indexes[key] = SvgIndex(builder.conf, self.cache)
+            builder.svg_index = indexes[key]
+            key = json.dumps(builder.conf.get('emoji_sequences'))
+            if key not in tries:
+                tries[key] = ligatures.create_sequence_trie(builder.conf)
+            builder.sequence_trie = tries[key]
+
+        done = set()
+        for builder in self.builders:
+            if builder.conf.get('input_file'):
+                # Rebuilt from the outlines of an existing font
+                continue
+            key = (id(builder.svg_index),
+                   builder.conf.get('backend', util.DEFAULT_BACKEND),
+                   builder.conf['glyph_svg_dir'],
+                   builder.conf.get('glyph_translate_x'),
+                   builder.conf.get('glyph_translate_y'))
+            if key in done:
+                continue
+            done.add(key)
+            builder.prepare()
+            glyph_filepaths = builder.svg_index.filepaths(
+                builder.conf['glyph_svg_dir'])
+            if any(builder.svg_index.get(filepath).codepoint is None
+                   for filepath in glyph_filepaths):
+                # The builds report the invalid filenames.
+                continue
+            logger.info("Creating shared glyph outlines for %s",
+                        builder.conf['output_file'])
+            # The glyphs are drawn into a scratch font, the builds find the
+            # outlines in the cache.
+            outlines = outline_backend(builder.conf)
+            outlines.add_glyphs(
+                outlines.create_font(builder.conf), glyph_filepaths,
+                builder.conf, self.cache, builder.svg_index)
+
+    def run(self, jobs=1):
+        """
+        Build every font, with up to jobs fonts in parallel. Returns 0 if
+        all builds succeed.
+        """
+        self.prepare()
+
+        context = fork_context()
+        jobs = min(jobs, len(self.builders))
+        if jobs > 1 and context is None:
+            logger.warning("Parallel batch builds need the fork start "
+                           "method, building one font at a time")
+        if jobs > 1 and context is not None:
+            logger.info("Building %d fonts with %d jobs",
+                        len(self.builders), jobs)
+            global _batch
+            _batch = self
+            pool = context.Pool(processes=jobs)
+            try:
+                results = pool.map(_run_worker, range(len(self.builders)), 1)
+            finally:
+                pool.close()
+                pool.join()
+                _batch = None
+        else:
+            results = [_run_builder(builder) for builder in self.builders]
+
+        for builder in self.builders:
+            builder.svg_index.save()
+        self.cache.prune()
+        failed = len([result for result in results if result != 0])
+        if failed:
+            logger.error("%d of %d fonts failed to build", failed,
+                         len(results))
+            return 1
+        logger.info("Built %d fonts", len(results))
+        return 0
+
+
+def _run_builder(builder):
+    logger.info("Building %s", builder.conf['output_file'])
+    return builder.run()
+
+
+# The batch being built, inherited by the forked workers.
+_batch = None
+
+
+def _run_worker(index):
+    builder = _batch.builders[index]
+    # Worker processes can't start their own outline pools.
+    builder.conf['jobs'] = 1
+    return _run_builder(builder)
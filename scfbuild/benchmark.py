@@ -0,0 +1,423 @@
+# -*- coding: utf-8 -*-
+# SCFBuild is released under the GNU General Public License v3.
+# See LICENSE.txt in the project root directory.
+'''
+Build benchmark with a synthetic SVG corpus
+
+The stages of a build are timed separately and written to a JSON file to
+compare results across commits. Without the FontForge module the outline
+stages are skipped and the color stages run on a stand-in font, unless the
+fonttools backend is used.
+'''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import io
+import json
+import logging
+import math
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import timeit
+
+from . import __version__
+from . import util
+from .unicode import ZWJ_INT
+
+logger = logging.getLogger(__name__)
+
+STAGES = ('xref', 'create_font', 'add_glyphs', 'generate', 'add_ligatures',
+          'add_color_svg', 'add_name_table', 'save')
+
+# Private Use Area, never conflicts with real characters.
+FIRST_CODEPOINT = 0xe000
+SVG_SIZE = 36
+
+COLORS = ('#ffcc4d', '#664500', '#f4900c', '#dd2e44', '#55acee', '#77b255',
+          '#9266cc', '#292f33', '#ccd6dd', '#ffffff')
+
+
+def generate_corpus(corpus_dir, count=100, complexity=20, gradient_ratio=0.3,
+                    ligature_ratio=0.2, zwj_ratio=0.5, seed=1):
+    """
+    Write count synthetic glyphs to corpus_dir/glyphs and corpus_dir/color.
+    complexity is the number of curve segments per path, gradient_ratio
+    the share of color paths filled with a gradient, ligature_ratio the
+    share of glyphs that are ligatures and zwj_ratio the share of
+    ligatures that are ZWJ sequences. The same arguments always create the
+    same files.
+    """
+    rand = random.Random(seed)
+    glyph_dir = os.path.join(corpus_dir, 'glyphs')
+    color_dir = os.path.join(corpus_dir, 'color')
+    for svg_dir in (glyph_dir, color_dir):
+        if not os.path.isdir(svg_dir):
+            os.makedirs(svg_dir)
+
+    ligature_count = int(round(count * ligature_ratio))
+    codepoint_count = max(2, count - ligature_count)
+    codepoints = [FIRST_CODEPOINT + i for i in range(codepoint_count)]
+
+    names = ['{:x}'.format(codepoint) for codepoint in codepoints]
+    zwj_count = int(round(ligature_count * zwj_ratio))
+    ligatures = set()
+    while len(ligatures) < ligature_count:
+        components = tuple(rand.sample(codepoints, rand.randint(2, 4)))
+        if len(ligatures) < zwj_count:
+            joined = []
+            for codepoint in components:
+                joined.extend([codepoint, ZWJ_INT])
+            components = tuple(joined[:-1])
+        ligatures.add(components)
+    for components in sorted(ligatures):
+        names.append('-'.join('{:x}'.format(c) for c in components))
+
+    for name in names:
+        write_file(os.path.join(glyph_dir, name + '.svg'),
+                   create_glyph_svg(rand, complexity))
+        write_file(os.path.join(color_dir, name + '.svg'),
+                   create_color_svg(rand, complexity, gradient_ratio))
+
+    logger.info("Generated %d glyphs (%d ligatures) in %s",
+                len(names), len(ligatures), corpus_dir)
+    return (glyph_dir, color_dir)
+
+
+def create_path(rand, complexity):
+    """
+    Create a closed path of cubic curves around the center of the SVG.
+    """
+    center = SVG_SIZE / 2
+    radius = rand.uniform(4, center - 1)
+    points = []
+    for i in range(complexity * 3 + 1):
+        angle = 2 * math.pi * i / (complexity * 3)
+        r = radius * rand.uniform(0.7, 1.0)
+        points.append((center + r * math.cos(angle),
+                       center + r * math.sin(angle)))
+
+    d = ['M{:.3f} {:.3f}'.format(*points[0])]
+    for i in range(complexity):
+        d.append('C' + ' '.join('{:.3f} {:.3f}'.format(*point)
+                                for point in points[i * 3 + 1:i * 3 + 4]))
+    d.append('Z')
+    return ''.join(d)
+
+
+def create_glyph_svg(rand, complexity):
+    return ('<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {0} {0}">'
+            '<path d="{1}"/></svg>').format(SVG_SIZE,
+                                            create_path(rand, complexity))
+
+
+def create_color_svg(rand, complexity, gradient_ratio):
+    defs = []
+    paths = []
+    for i in range(max(1, complexity // 10)):
+        if rand.random() < gradient_ratio:
+            gradient_id = 'g{}'.format(i)
+            defs.append(
+                '<linearGradient id="{}" x1="0" y1="0" x2="1" y2="1">'
+                '<stop offset="0" stop-color="{}"/>'
+                '<stop offset="1" stop-color="{}"/>'
+                '</linearGradient>'.format(gradient_id, rand.choice(COLORS),
+                                           rand.choice(COLORS)))
+            fill = 'url(#{})'.format(gradient_id)
+        else:
+            fill = rand.choice(COLORS)
+        paths.append('<path fill="{}" d="{}"/>'.format(
+            fill, create_path(rand, complexity)))
+
+    return ('<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {0} {0}">'
+            '<defs>{1}</defs>{2}</svg>').format(SVG_SIZE, ''.join(defs),
+                                                ''.join(paths))
+
+
+def write_file(filepath, text):
+    f = io.open(filepath, 'wt', encoding='utf-8')
+    f.write(text)
+    f.close()
+
+
+def have_fontforge():
+    try:
+        import fontforge  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def create_standin_font(builder):
+    """
+    Create a font with an empty glyph for each regular SVG, and the glyphs
+    create_font() of the outline backends adds, for timing the color
+    stages without FontForge.
+    """
+    from fontTools.fontBuilder import FontBuilder
+    from fontTools.pens.ttGlyphPen import TTGlyphPen
+
+    from .ftools import glyph_name
+    from .unicode import VS16_INT
+
+    # The same glyphs and widths as create_font(), ZWJ sequences need the
+    # ZWJ and VS16 glyphs.
+    width_space = builder.conf.get('width_space', util.DEFAULT_GLYPH_WIDTH)
+    glyphs = [('.notdef', None, 0),
+              ('.null', 0x0, util.DEFAULT_GLYPH_WIDTH),
+              ('CR', 0xD, util.DEFAULT_GLYPH_WIDTH),
+              ('space', 0x20, width_space),
+              (glyph_name(ZWJ_INT), ZWJ_INT, 0),
+              (glyph_name(VS16_INT), VS16_INT, 0)]
+    for filepath in builder.svg_index.filepaths(builder.conf['glyph_svg_dir']):
+        svg_info = builder.svg_index.get(filepath)
+        if svg_info.codepoint == -1:
+            glyphs.append((svg_info.name, None, util.FONT_EM))
+        else:
+            glyphs.append((glyph_name(svg_info.codepoint), svg_info.codepoint,
+                           util.FONT_EM))
+
+    glyph_order = [name for name, _, _ in glyphs]
+    font_builder = FontBuilder(util.FONT_EM, isTTF=True)
+    font_builder.setupGlyphOrder(glyph_order)
+    font_builder.setupCharacterMap(dict(
+        (codepoint, name) for name, codepoint, _ in glyphs
+        if codepoint is not None))
+    empty = TTGlyphPen(None).glyph()
+    font_builder.setupGlyf(dict((name, empty) for name in glyph_order))
+    font_builder.setupHorizontalMetrics(
+        dict((name, (width, 0)) for name, _, width in glyphs))
+    font_builder.setupHorizontalHeader()
+    font_builder.setupPost()
+    return font_builder.font
+
+
+def time_stage(results, stage, func, *args):
+    start = timeit.default_timer()
+    value = func(*args)
+    results[stage].append(timeit.default_timer() - start)
+    return value
+
+
+def run_benchmark(conf, repeat=3):
+    """
+    Run the build stages repeat times. Returns {stage: [seconds, ...]},
+    stages that could not run have an empty list.
+    """
+    from .builder import Builder
+    from .xref import create_xref
+
+    backend = conf.get('backend', util.DEFAULT_BACKEND)
+    fontforge = backend == 'fontforge' and have_fontforge()
+    if backend == 'fontforge' and not fontforge:
+        logger.warning("FontForge not found, skipping the outline stages")
+
+    results = dict((stage, []) for stage in STAGES)
+    for i in range(repeat):
+        tmp_dir = tempfile.mkdtemp()
+        conf['output_file'] = os.path.join(tmp_dir, 'benchmark.ttf')
+        try:
+            builder = Builder(conf)
+            builder.prepare()
+            builder.xref = time_stage(results, 'xref', create_xref,
+                                      builder.svg_index, conf,
+                                      builder.sequence_trie)
+            if fontforge:
+                from . import fforge
+                ff_font = time_stage(results, 'create_font',
+                                     fforge.create_font, conf)
+                time_stage(results, 'add_glyphs', fforge.add_glyphs, ff_font,
+                           builder.svg_index.filepaths(conf['glyph_svg_dir']),
+                           conf, builder.cache, builder.svg_index)
+                tmp_file = os.path.join(tmp_dir, 'tmp.ttf')
+                time_stage(results, 'generate', ff_font.generate, tmp_file)
+                builder.font = builder.open_intermediate_font(tmp_file)
+            elif backend == 'fonttools':
+                from . import ftools
+                outline_font = time_stage(results, 'create_font',
+                                          ftools.create_font, conf)
+                time_stage(results, 'add_glyphs', ftools.add_glyphs,
+                           outline_font,
+                           builder.svg_index.filepaths(conf['glyph_svg_dir']),
+                           conf, builder.cache, builder.svg_index)
+                builder.font = time_stage(results, 'generate',
+                                          outline_font.generate)
+            else:
+                builder.font = create_standin_font(builder)
+
+            time_stage(results, 'add_ligatures', builder.add_ligatures)
+            time_stage(results, 'add_color_svg', builder.add_color_svg)
+            time_stage(results, 'add_name_table', builder.add_name_table)
+            time_stage(results, 'save', builder.save)
+            builder.font.close()
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        logger.info("Finished run %d of %d", i + 1, repeat)
+
+    return results
+
+
+def summarize(results):
+    summary = {}
+    for stage, times in results.items():
+        if not times:
+            summary[stage] = None
+            continue
+        times = sorted(times)
+        middle = len(times) // 2
+        median = times[middle] if len(times) % 2 else \
+            (times[middle - 1] + times[middle]) / 2
+        summary[stage] = {'min': times[0], 'median': median}
+    return summary
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.STDOUT).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='SCFBuild benchmark with a synthetic SVG corpus')
+    parser.add_argument('-o', '--output',
+                        dest='output',
+                        default='benchmark.json',
+                        help='JSON results file. default: benchmark.json')
+    parser.add_argument('--corpus',
+                        dest='corpus',
+                        metavar='DIR',
+                        help='directory for the generated corpus, reused if '
+                        'it exists. default: a temp directory')
+    parser.add_argument('-n', '--count',
+                        dest='count',
+                        type=int,
+                        default=100,
+                        help='number of glyphs. default: 100')
+    parser.add_argument('--complexity',
+                        dest='complexity',
+                        type=int,
+                        default=20,
+                        help='curve segments per path. default: 20')
+    parser.add_argument('--gradients',
+                        dest='gradient_ratio',
+                        type=float,
+                        default=0.3,
+                        metavar='RATIO',
+                        help='share of color paths with a gradient. '
+                        'default: 0.3')
+    parser.add_argument('--ligatures',
+                        dest='ligature_ratio',
+                        type=float,
+                        default=0.2,
+                        metavar='RATIO',
+                        help='share of glyphs that are ligatures. '
+                        'default: 0.2')
+    parser.add_argument('--zwj',
+                        dest='zwj_ratio',
+                        type=float,
+                        default=0.5,
+                        metavar='RATIO',
+                        help='share of ligatures that are ZWJ sequences. '
+                        'default: 0.5')
+    parser.add_argument('--seed',
+                        dest='seed',
+                        type=int,
+                        default=1,
+                        help='random seed of the corpus. default: 1')
+    parser.add_argument('-r', '--repeat',
+                        dest='repeat',
+                        type=int,
+                        default=3,
+                        help='number of timed builds. default: 3')
+    parser.add_argument('-b', '--backend',
+                        dest='backend',
+                        choices=util.BACKENDS,
+                        help='outline backend to benchmark. default: '
+                        + util.DEFAULT_BACKEND)
+    parser.add_argument('-c', '--yaml-conf',
+                        dest='yaml_conf',
+                        help='yaml build configuration for the benchmark '
+                        'builds. The build cache is disabled unless set.')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    conf = {}
+    if args.yaml_conf:
+        import yaml
+        f = open(args.yaml_conf)
+        conf = yaml.safe_load(f) or {}
+        f.close()
+    if args.backend:
+        conf['backend'] = args.backend
+    conf.setdefault('cache', False)
+    conf.setdefault('verbose', False)
+    conf.setdefault('table_name', {})
+    for key, value in (('family', 'Benchmark'), ('subfamily', 'Regular'),
+                       ('version', '1.0')):
+        conf['table_name'].setdefault(key, value)
+
+    corpus = {
+        'count': args.count,
+        'complexity': args.complexity,
+        'gradient_ratio': args.gradient_ratio,
+        'ligature_ratio': args.ligature_ratio,
+        'zwj_ratio': args.zwj_ratio,
+        'seed': args.seed,
+    }
+
+    corpus_dir = args.corpus or tempfile.mkdtemp()
+    try:
+        glyph_dir = os.path.join(corpus_dir, 'glyphs')
+        color_dir = os.path.join(corpus_dir, 'color')
+        if not os.path.isdir(glyph_dir):
+            generate_corpus(corpus_dir, **corpus)
+        conf['glyph_svg_dir'] = glyph_dir
+        conf['color_svg_dir'] = color_dir
+
+        results = run_benchmark(conf, args.repeat)
+    finally:
+        if not args.corpus:
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    import fontTools
+    report = {
+        'scfbuild_version': __version__,
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'fonttools': fontTools.version,
+        'fontforge': have_fontforge(),
+        'backend': conf.get('backend', util.DEFAULT_BACKEND),
+        'corpus': corpus,
+        'repeat': args.repeat,
+        'times': results,
+        'summary': summarize(results),
+    }
+    f = open(args.output, 'w')
+    json.dump(report, f, indent=2, sort_keys=True)
+    f.close()
+
+    for stage in STAGES:
+        if report['summary'][stage] is None:
+            print("{:16} skipped".format(stage))
+        else:
+            print("{:16} {:9.4f}s median {:9.4f}s min".format(
+                stage, report['summary'][stage]['median'],
+                report['summary'][stage]['min']))
+    print("Results written to {}".format(args.output))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
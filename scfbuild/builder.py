@@ -6,21 +6,38 @@
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
+import collections
+import copy
+import io
 import logging
 import os
+import shutil
 import sys
 import tempfile
-import time
-from distutils.version import LooseVersion
+import timeit
 import xml.etree.ElementTree as ET
 
 import fontTools
-from fontTools.ttLib import TTFont
+from fontTools.misc.transform import Transform
+from fontTools.ttLib import TTFont, woff2
+from fontTools.ttLib.sfnt import SFNTReader, SFNTWriter
 from fontTools.ttLib.tables.S_V_G_ import table_S_V_G_
 from fontTools.ttLib.tables._n_a_m_e import NameRecord, table__n_a_m_e
 
-from . import fforge
+from . import bake
+from . import colr
+from . import ligatures
+from . import minify
+from . import render_cost
+from . import reproducible
+from . import svg_table as svg_table_util
 from . import util
+from .cache import (COLR_LAYERS, RENDER_COSTS, SVG_DOCS, make_key,
+                    open_cache)
+from .metrics import DEFAULT_SLOWEST, Metrics
+from .svg_index import SvgIndex
+from .svg_path import parse_transform
+from .xref import create_xref
 from .util import FONT_EM, SVG_TRANSFORM_SCALE
 from .constants import name_record as NR
 
@@ -28,149 +45,696 @@ logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
 # Support for SVG tables was added to fontTools in version 2.5
-if LooseVersion('2.5') > LooseVersion(fontTools.version):
+if util.parse_version(fontTools.version) < (2, 5):
     logger.exception("The FontTools module version must be 2.5 or higher.")
     sys.exit(1)
 # todo: Check FontForge version
 
 
+XLINK_NS = "http://www.w3.org/1999/xlink"
+
+
 class NoCodePointsException(Exception):
     pass
 
 
+def write_flavor(data, f, flavor):
+    """
+    Write the compiled font data as WOFF or WOFF2 to the file object. The
+    raw table data is copied, the tables are not decompiled again.
+    """
+    reader = SFNTReader(io.BytesIO(data))
+    writer = SFNTWriter(f, len(reader.tables), reader.sfntVersion, flavor)
+    for tag in sorted(reader.keys()):
+        writer[tag] = reader[tag]
+    writer.close()
+    reader.close()
+
+
+def outline_backend(conf):
+    """
+    Import the module that creates the glyph outlines. The backends are
+    only needed for the glyphs, so the other stages can be used without
+    them.
+    """
+    if conf.get('backend', util.DEFAULT_BACKEND) == 'fonttools':
+        from . import ftools
+        return ftools
+    from . import fforge
+    return fforge
+
+
+def compile_font(font):
+    """
+    Compile a fontTools font to the data of a TTF file.
+    """
+    buf = io.BytesIO()
+    font.save(buf)
+    return buf.getvalue()
+
+
+def write_outputs(data, outputs):
+    """
+    Write the compiled font data to each (output_type, filepath).
+    """
+    for output_type, filepath in outputs:
+        logger.info("Saving output file: %s", filepath)
+        f = open(filepath, 'wb')
+        try:
+            if output_type == 'ttf':
+                f.write(data)
+            else:
+                write_flavor(data, f, output_type)
+        finally:
+            f.close()
+
+
 class Builder(object):
 
     def __init__(self, conf=None):
         self.conf = conf
         self.uids_for_glyph_names = None
+        self.cache = None
+        self.svg_index = None
+        self.sequence_trie = None
+        self.xref = None
+        # A batch shares the cache and prunes it after all builds.
+        self.prune_cache = True
+        self.minified_size = [0, 0]
+        # [baked, total] color SVGs with --bake-transform
+        self.baked_count = [0, 0]
+        self.metrics = Metrics()
 
         if self.conf['verbose']:
             logging.getLogger().setLevel(logging.DEBUG)
 
     def run(self):
+        output_types = util.get_output_types(self.conf)
+        if 'woff2' in output_types and not woff2.haveBrotli:
+            logger.error("The brotli module is required for WOFF2 output.")
+            return 1
+
+        self.metrics = Metrics(self.conf.get('profile_dir'),
+                               self.conf.get('metrics_slowest',
+                                             DEFAULT_SLOWEST))
+        with self.metrics.stage('prepare'):
+            self.prepare()
+            logger.info("Input hash: %s",
+                        reproducible.input_hash(self.conf, self.svg_index))
+
+        input_file = self.conf.get('input_file')
+        if input_file:
+            logger.info("Reading input font: %s", input_file)
+            with self.metrics.stage('read'):
+                self.font = self.open_intermediate_font(input_file)
+            if 'COLR' in self.font:
+                logger.error("The input font has COLR glyphs, its layer "
+                             "glyphs can't be replaced. Build it without "
+                             "--input.")
+                return 1
+
+        # Stop before the outlines are created if a color SVG has no glyph.
+        with self.metrics.stage('xref'):
+            self.xref = create_xref(self.svg_index, self.conf,
+                                    self.sequence_trie,
+                                    self.font if input_file else None)
+        errors = self.xref.errors()
+        if errors:
+            for error in errors:
+                logger.error(error)
+            logger.error("Found %d errors in the SVG files", len(errors))
+            return 1
+
+        if self.conf.get('render_budget') or self.conf.get('render_report'):
+            with self.metrics.stage('render_cost'):
+                if not self.check_render_cost():
+                    return 1
+
+        if input_file:
+            # The outlines and ligatures of the input font are kept.
+            self.add_tables_and_save(with_ligatures=False)
+            self.font.close()
+        else:
+            self.build_outlines()
+
+        self.svg_index.save()
+        if self.cache is not None and self.prune_cache:
+            self.cache.prune()
+
+        if self.conf.get('metrics_json'):
+            self.metrics.write_json(self.conf['metrics_json'])
+
+        logger.info("Done!")
+        # 0 for success
+        return 0
+
+    def build_outlines(self):
+        """
+        Create a new font with the regular glyphs, then add the tables and
+        save it.
+        """
+        backend = self.conf.get('backend', util.DEFAULT_BACKEND)
+        outlines = outline_backend(self.conf)
+
         logger.info("Creating a new font")
-        ff_font = fforge.create_font(self.conf)
+        with self.metrics.stage('create_font'):
+            font = outlines.create_font(self.conf)
 
         # Find and add regular glyphs
-        svg_filepaths = util.get_svg_filepaths(self.conf['glyph_svg_dir'])
+        svg_filepaths = self.svg_index.filepaths(self.conf['glyph_svg_dir'])
         # TODO: Validate regular SVGs
-        logger.info("Adding glyphs and ligatures")
-        fforge.add_glyphs(ff_font, svg_filepaths, self.conf)
+        logger.info("Adding glyphs")
+        with self.metrics.stage('add_glyphs'):
+            outlines.add_glyphs(font, svg_filepaths, self.conf, self.cache,
+                                self.svg_index, self.metrics)
+
+        if backend == 'fonttools':
+            # The font is compiled in memory, there is no intermediate file.
+            logger.info("Generating font")
+            with self.metrics.stage('generate'):
+                self.font = font.generate()
+            del font
+            self.add_tables_and_save()
+        else:
+            self.generate_with_fontforge(font)
 
-        tmp_dir = tempfile.mkdtemp()
+    def generate_with_fontforge(self, ff_font):
+        """
+        Generate the FontForge font to a temp file and read it back.
+        """
+        # The temp dir can be set to a tmpfs to keep the intermediate font
+        # in memory.
+        tmp_dir = tempfile.mkdtemp(dir=self.conf.get('tmp_dir'))
         tmp_file = os.path.join(tmp_dir, "tmp.ttf")
         logger.debug("Using temp file: %s", tmp_file)
 
-        # TODO: Validate ligature tables to avoid warning during generate
-        # "Lookup subtable contains unused glyph NAME making the whole subtable invalid"
-        logger.info("Generating intermediate font file")
-        ff_font.generate(tmp_file)
-        del ff_font
-
-        logger.info("Reading intermediate font file")
-        self.font = TTFont(tmp_file)
+        try:
+            logger.info("Generating intermediate font file")
+            with self.metrics.stage('generate'):
+                ff_font.generate(tmp_file)
+            del ff_font
+
+            logger.info("Reading intermediate font file")
+            with self.metrics.stage('read'):
+                self.font = self.open_intermediate_font(tmp_file)
+            self.add_tables_and_save()
+            # The lazy font reads from the temp file until it is saved.
+            self.font.close()
+        finally:
+            # Cleaning Up
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def add_tables_and_save(self, with_ligatures=True):
+        if with_ligatures:
+            logger.info("Adding ligatures")
+            with self.metrics.stage('add_ligatures'):
+                self.add_ligatures()
+        if self.conf.get('remove_unused', False):
+            # Before the color glyphs, so they use the new glyph IDs.
+            logger.info("Removing unused glyphs")
+            with self.metrics.stage('remove_unused'):
+                self.remove_unused()
         logger.info("Adding SVGinOT SVG files")
         # TODO: Validate color SVGs
-        self.add_color_svg()
-        self.add_name_table()
-        logger.info("Saving output file: %s", self.conf['output_file'])
-        self.font.save(self.conf['output_file'])
+        with self.metrics.stage('add_color_svg'):
+            self.add_color_svg()
+        with self.metrics.stage('add_name_table'):
+            self.add_name_table()
+            reproducible.set_timestamps(self.font, self.conf)
+        with self.metrics.stage('save'):
+            data = self.save()
+        if self.conf.get('subsets') or self.conf.get('subset_frequency'):
+            logger.info("Saving subsets")
+            with self.metrics.stage('subset'):
+                self.save_subsets(data)
+        if isinstance(self.font.tables.get('SVG '),
+                      svg_table_util.SpooledSVGTable):
+            self.font['SVG '].close()
+
+    def prepare(self):
+        """
+        Open the build cache and index the SVG files. Repeated builds with
+        the same Builder keep both and only index the files that changed.
+        """
+        if self.svg_index is None:
+            self.cache = open_cache(self.conf)
+            self.svg_index = SvgIndex(self.conf, self.cache)
+            self.sequence_trie = ligatures.create_sequence_trie(self.conf)
+        # The glyph IDs change with the font.
+        self.uids_for_glyph_names = None
 
-        # Cleaning Up
-        os.remove(tmp_file)
-        os.rmdir(tmp_dir)
+        logger.info("Indexing SVG files")
+        # An input font already has the regular glyphs.
+        self.svg_index.scan([self.conf[key] for key in
+                             ('glyph_svg_dir', 'color_svg_dir')
+                             if key in self.conf])
 
-        logger.info("Done!")
-        # 0 for success
-        return 0
+    def save(self):
+        """
+        Save the font as every configured output type. The tables are
+        compiled once, the WOFF/WOFF2 files are written from that data.
+        """
+        output_types = util.get_output_types(self.conf)
+        outputs = util.get_output_filepaths(self.conf['output_file'],
+                                            output_types)
 
-    def add_color_svg(self):
-        svg_files = util.get_svg_filepaths(self.conf['color_svg_dir'])
-        svg_list = []
+        data = compile_font(self.font)
 
-        # Set default namespace (avoids "ns0:svg")
-        ET.register_namespace("", "http://www.w3.org/2000/svg")
+        write_outputs(data, outputs)
+        return data
 
-        for filepath in svg_files:
-            glyph_id = self.get_glyph_id(filepath)
+    def save_subsets(self, data):
+        """
+        Save the Unicode range subsets of the compiled font data and their
+        CSS file.
+        """
+        from . import subset
 
-            svg_tree = ET.parse(filepath)
-            svg_root = svg_tree.getroot()
-            # Add Glyph ID as SVG root id, required by SVGinOT spec.
-            svg_root.set('id', "glyph{}".format(glyph_id))
-
-            # Remove the viewBox/height/width attributes since they are
-            # processed inconsistently by Gecko and Edge renderers.
-            try:
-                del svg_root.attrib['viewBox']
-            except KeyError:
-                pass
-
-            try:
-                del svg_root.attrib['height']
-            except KeyError:
-                pass
-
-            try:
-                del svg_root.attrib['width']
-            except KeyError:
-                pass
-
-            # Add the transform to size the SVG to the FONT_EM
-            svg_transform = self.create_color_transform(filepath)
-            logger.debug("Set SVG transform: {}".format(svg_transform))
-
-            svg_transform_attrib = {"transform": svg_transform}
-            # Create a new group tag to apply the transform to
-            new_svg_group = ET.Element('g', svg_transform_attrib)
-            # Copy all SVG root children to the new group
-            for child in svg_root:
-                new_svg_group.append(child)
-
-            # Backup the root attribs, clear the children, and apply attribs
-            svg_root_attrib = svg_root.items()
-            svg_root.clear()
-            for name, value in svg_root_attrib:
-                svg_root.set(name, value)
-
-            # Append the new group.
-            svg_root.append(new_svg_group)
-
-            data = ET.tostring(svg_root, encoding='UTF-8')
-            logger.debug("Glyph ID: %d Adding SVG: %s", glyph_id, filepath)
-            svg_list.append([data, glyph_id, glyph_id])
+        svg_table = None
+        if 'SVG ' in self.font:
+            svg_table = self.font['SVG ']
+        subset.save_subsets(data, self.conf, svg_table, write_outputs)
 
-        svg_table = table_S_V_G_()
-        # The SVG table must be sorted by glyph_id
-        svg_table.docList = sorted(svg_list, key=lambda table: table[1])
-        svg_table.colorPalettes = None
-        self.font['SVG '] = svg_table
+    def open_intermediate_font(self, filepath):
+        """
+        Open the FontForge generated font, or the --input font, without
+        decompiling any tables.
+        """
+        # Tables are only decompiled when they are accessed, everything else
+        # is copied to the output as raw bytes on save(). FontForge already
+        # calculated the bounding boxes, recalculating them would decompile
+        # every glyph through the maxp and head tables.
+        return TTFont(filepath, lazy=True, recalcBBoxes=False)
+
+    def check_render_cost(self):
+        """
+        Estimate the render cost of the color SVGs, print the most
+        expensive and check them against the budget. Returns False if the
+        build should stop.
+        """
+        costs = [(filepath, self.get_render_cost(filepath)) for filepath
+                 in self.svg_index.filepaths(self.conf['color_svg_dir'])]
+
+        count = self.conf.get('render_report')
+        if count:
+            if count is True:
+                count = render_cost.DEFAULT_REPORT_COUNT
+            render_cost.print_report(costs, count)
+
+        messages = render_cost.check_budget(
+            costs, self.conf.get('render_budget') or {})
+        if self.conf.get('render_budget_action',
+                         render_cost.DEFAULT_BUDGET_ACTION) == 'fail':
+            for message in messages:
+                logger.error(message)
+            if messages:
+                logger.error("Color SVGs are over the render budget")
+                return False
+        else:
+            for message in messages:
+                logger.warning(message)
+        return True
+
+    def get_render_cost(self, filepath):
+        cache_key = None
+        if self.cache is not None:
+            cache_key = make_key(RENDER_COSTS, self.svg_index.digest(filepath))
+            cached = self.cache.get_json(RENDER_COSTS, cache_key)
+            if cached is not None:
+                return render_cost.RenderCost(**cached)
+
+        cost = render_cost.analyze_file(filepath)
+        if self.cache is not None:
+            self.cache.set_json(RENDER_COSTS, cache_key,
+                                dict(cost._asdict()))
+        return cost
+
+    def add_ligatures(self):
+        """
+        Compile the substitutions of all ligature glyphs into the GSUB table
+        in one pass.
+        """
+        if self.uids_for_glyph_names is None:
+            self.uids_for_glyph_names = self.get_uids_for_glyph_names()
 
-    def get_glyph_id(self, filepath):
+        names = []
+        for filepath in self.svg_index.filepaths(self.conf['glyph_svg_dir']):
+            svg_info = self.svg_index.get(filepath)
+            if svg_info.codepoint == -1:
+                names.append(svg_info.name)
+
+        substitutions = ligatures.build_ligatures(
+            names, self.uids_for_glyph_names, self.sequence_trie)
+        if substitutions:
+            self.font['GSUB'] = ligatures.build_gsub(substitutions)
+        elif 'GSUB' in self.font:
+            del self.font['GSUB']
+        logger.info("Added %d substitutions for %d ligature glyphs",
+                    len(substitutions), len(names))
+
+    def remove_unused(self):
         """
-        Find a Glyph ID for the filename in filepath
+        Remove the glyphs that can't be reached from the cmap or through
+        the ligatures, and the color SVGs of removed glyphs. The glyph IDs
+        are renumbered.
         """
+        from . import subset
+
+        if 'SVG ' in self.font:
+            # The table of an --input font is replaced by add_color_svg().
+            del self.font['SVG ']
+        subset.quiet_subsetter(self.conf)
+        ligature_count = subset.count_ligatures(self.font)
+        # The subsetter needs the compiled tables.
+        data = compile_font(self.font)
+        self.font.close()
+
+        (self.font, removed) = subset.remove_unused(data)
+        for name in removed:
+            logger.debug("Removed unused glyph %s", name)
+        if self.uids_for_glyph_names is None:
+            self.uids_for_glyph_names = self.get_uids_for_glyph_names()
+        for filepath in self.xref.remove_missing(self.font,
+                                                 self.uids_for_glyph_names):
+            logger.info("Skipping the color SVG of a removed glyph: %s",
+                        filepath)
+
+        logger.info("Removed %d unused glyphs and %d ligatures, saved %d "
+                    "bytes", len(removed),
+                    ligature_count - subset.count_ligatures(self.font),
+                    len(data) - len(compile_font(self.font)))
+
+    def add_color_svg(self):
         if self.uids_for_glyph_names is None:
             self.uids_for_glyph_names = self.get_uids_for_glyph_names()
+        glyph_ids_by_file = self.xref.glyph_ids(self.font,
+                                                self.uids_for_glyph_names)
+        # Without the color SVGs of removed glyphs
+        svg_files = [filepath for filepath in
+                     self.svg_index.filepaths(self.conf['color_svg_dir'])
+                     if filepath in glyph_ids_by_file]
+        dedupe = self.conf.get('svg_dedupe', True)
+
+        color_format = self.conf.get('color_format',
+                                     util.DEFAULT_COLOR_FORMAT)
+        if color_format != 'svg':
+            svg_files = self.add_colr(svg_files, glyph_ids_by_file,
+                                      color_format)
+            if not svg_files:
+                if 'SVG ' in self.font:
+                    del self.font['SVG ']
+                return
+
+        # Group the glyphs with byte-identical SVG files, so each group is
+        # stored as one document.
+        groups = collections.OrderedDict()
+        for filepath in svg_files:
+            glyph_id = glyph_ids_by_file[filepath]
+            digest = self.svg_index.digest(filepath)
+            key = digest if dedupe else filepath
+            if key not in groups:
+                groups[key] = (filepath, digest, [])
+            groups[key][2].append(glyph_id)
+            logger.debug("Glyph ID: %d Adding SVG: %s", glyph_id, filepath)
+        for _, _, glyph_ids in groups.values():
+            glyph_ids.sort()
+
+        stream = self.conf.get('svg_stream', False)
+        if stream:
+            # Create the documents in glyph ID order, so they are written
+            # to the spool file in the order of the table.
+            groups = collections.OrderedDict(
+                sorted(groups.items(), key=lambda item: item[1][2][0]))
+
+        self.minified_size = [0, 0]
+        self.baked_count = [0, 0]
+        if self.conf.get('svg_pack', False):
+            documents = self.create_packed_documents(groups)
+        else:
+            documents = self.create_documents(groups)
+
+        compress = self.conf.get('svg_compress', False)
+        if stream:
+            svg_table = svg_table_util.SpooledSVGTable(
+                self.conf.get('tmp_dir'), compress)
+            count = 0
+            for data, glyph_ids in documents:
+                svg_table.add_document(data, glyph_ids)
+                count += 1
+            if compress:
+                logger.info("Compressed SVG documents from %d to %d bytes",
+                            svg_table.size, svg_table.compressed_size)
+        else:
+            documents = list(documents)
+            count = len(documents)
+            svg_table = table_S_V_G_()
+            svg_table.docList = svg_table_util.create_doc_list(documents,
+                                                               compress)
+            svg_table.colorPalettes = None
+
+        if self.conf.get('svg_minify', 0):
+            logger.info("Minified SVG documents from %d to %d bytes, "
+                        "saved %d bytes", self.minified_size[0],
+                        self.minified_size[1],
+                        self.minified_size[0] - self.minified_size[1])
+        if self.baked_count[1]:
+            logger.info("Baked the transform into %d of %d color SVGs, the "
+                        "others keep a transform group", self.baked_count[0],
+                        self.baked_count[1])
+        logger.info("Added %d SVG documents for %d glyphs in %d records",
+                    count, len(svg_files), len(svg_table.docList))
+        self.font['SVG '] = svg_table
+
+    def add_colr(self, svg_files, glyph_ids_by_file, color_format):
+        """
+        Add the color SVGs that can be converted as COLR glyphs. Returns the
+        SVG files that can't, to be added to the SVG table.
+        """
+        color_glyphs = colr.ColorGlyphs()
+        glyph_order = self.font.getGlyphOrder()
+        fallback = []
+        for filepath in svg_files:
+            start = timeit.default_timer()
+            layers = self.get_color_layers(filepath, color_format)
+            if layers is None:
+                fallback.append(filepath)
+            else:
+                color_glyphs.add_glyph(
+                    glyph_order[glyph_ids_by_file[filepath]], layers)
+            self.metrics.glyph('add_color_svg', filepath,
+                               timeit.default_timer() - start)
+
+        if color_glyphs.color_glyphs:
+            color_glyphs.build(self.font)
+        logger.info("Added %d COLR glyphs with %d layer glyphs and %d "
+                    "colors, %d glyphs use the SVG table",
+                    len(color_glyphs.color_glyphs),
+                    len(color_glyphs.layer_glyphs),
+                    len(color_glyphs.palette), len(fallback))
+        return fallback
+
+    def get_color_layers(self, filepath, color_format):
+        """
+        Convert a color SVG to COLR layers, None if it can't be converted.
+        """
+        transform = self.create_color_transform(filepath)
+        cache_key = None
+        if self.cache is not None:
+            cache_key = make_key(COLR_LAYERS, self.svg_index.digest(filepath),
+                                 transform, color_format)
+            cached = self.cache.get_json(COLR_LAYERS, cache_key)
+            if cached is not None:
+                return cached['layers']
+
+        # SVG (y down) to font (y up) units
+        font_transform = Transform(1, 0, 0, -1, 0, 0).transform(
+            parse_transform(transform))
+        try:
+            layers = colr.convert_svg(ET.parse(filepath).getroot(),
+                                      font_transform,
+                                      color_format == 'colrv1')
+        except colr.UnsupportedSvgError as e:
+            logger.debug("Using SVG for %s: %s", filepath, e)
+            layers = None
+        if self.cache is not None:
+            self.cache.set_json(COLR_LAYERS, cache_key, {'layers': layers})
+        return layers
+
+    def create_documents(self, groups):
+        """
+        Create one document for each group of glyphs with the same SVG.
+        Yields (data, glyph_ids) as each one is created.
+        """
+        for filepath, digest, glyph_ids in groups.values():
+            start = timeit.default_timer()
+            data = None
+            if self.cache is not None:
+                cache_key = make_key(SVG_DOCS, digest, glyph_ids,
+                                     util.get_color_transform(self.conf),
+                                     self.conf.get('svg_minify', 0),
+                                     self.conf.get('svg_precision'),
+                                     self.conf.get('svg_bake_transform',
+                                                   False))
+                data = self.cache.get(SVG_DOCS, cache_key)
+
+            if data is None:
+                data = self.create_svg_document(filepath, glyph_ids)
+                if self.cache is not None:
+                    self.cache.set(SVG_DOCS, cache_key, data)
+
+            self.metrics.glyph('add_color_svg', filepath,
+                               timeit.default_timer() - start)
+            yield (data, glyph_ids)
+
+    def create_packed_documents(self, groups):
+        """
+        Pack the color SVGs of consecutive glyph IDs into multi-glyph
+        documents with shared definitions. Yields each (data, glyph_ids)
+        when the document is full.
+        """
+        glyphs = []
+        for filepath, _, glyph_ids in groups.values():
+            for glyph_id in glyph_ids:
+                # glyph_ids[0] is the glyph with the same SVG drawn first.
+                glyphs.append((glyph_id, filepath, glyph_ids[0]))
+        glyphs.sort()
+
+        packer = svg_table_util.DocumentPacker(
+            self.conf.get('svg_pack_max_size',
+                          svg_table_util.DEFAULT_PACK_MAX_SIZE))
+        for glyph_id, filepath, source_id in glyphs:
+            if packer.can_reference(glyph_id, source_id):
+                packer.add_reference(glyph_id, source_id)
+            else:
+                start = timeit.default_timer()
+                packer.add_glyph(glyph_id,
+                                 self.create_svg_glyph(filepath, [glyph_id]))
+                self.metrics.glyph('add_color_svg', filepath,
+                                   timeit.default_timer() - start)
+            for document in packer.pop_documents():
+                yield document
+        for document in packer.finish():
+            yield document
+
+    def create_svg_document(self, filepath, glyph_ids):
+        """
+        Create the serialized SVGinOT document for a color SVG used by one
+        or more glyphs.
+        """
+        svg_root = self.create_svg_glyph(filepath, glyph_ids)
+        new_svg_group = svg_root[0]
+
+        if len(glyph_ids) == 1:
+            # Add Glyph ID as SVG root id, required by SVGinOT spec.
+            svg_root.set('id', "glyph{}".format(glyph_ids[0]))
+        else:
+            # Shared documents identify each glyph by a child element.
+            svg_root.attrib.pop('id', None)
+
+            # The first glyph is the group, the others reference it.
+            first_id = "glyph{}".format(glyph_ids[0])
+            new_svg_group.set('id', first_id)
+            for glyph_id in glyph_ids[1:]:
+                ET.SubElement(svg_root, 'use', {
+                    'id': "glyph{}".format(glyph_id),
+                    '{%s}href' % XLINK_NS: '#' + first_id,
+                })
+
+        return ET.tostring(svg_root, encoding='UTF-8')
+
+    def create_svg_glyph(self, filepath, glyph_ids):
+        """
+        Parse and process a color SVG. Returns the SVG root element with a
+        single group child that sizes the content to the FONT_EM.
+        """
+        # Set default namespace (avoids "ns0:svg")
+        ET.register_namespace("", "http://www.w3.org/2000/svg")
+        ET.register_namespace("xlink", XLINK_NS)
 
-        (codepoint, filename) = util.codepoint_from_filepath(filepath)
+        svg_tree = ET.parse(filepath)
+        svg_root = svg_tree.getroot()
 
-        # Check for a regular glyph first
+        # Remove the viewBox/height/width attributes since they are
+        # processed inconsistently by Gecko and Edge renderers.
         try:
-            glyph_name = self.uids_for_glyph_names[codepoint]
+            del svg_root.attrib['viewBox']
         except KeyError:
-            # If that doesn't work check for a Ligature Glyph
-            glyph_id = self.font.getGlyphID(filename)
+            pass
 
-            if glyph_id == -1:
-                logger.warning("No Glyph ID found for: %s (Note: A regular "
-                               "glyph is required for each color glyph)", filepath)
+        try:
+            del svg_root.attrib['height']
+        except KeyError:
+            pass
 
-            logger.debug("Found Ligature Glyph: %s", filename)
-            return glyph_id
+        try:
+            del svg_root.attrib['width']
+        except KeyError:
+            pass
+
+        self.minify_svg(svg_root, glyph_ids)
+
+        # Add the transform to size the SVG to the FONT_EM
+        svg_transform = self.create_color_transform(filepath)
+        logger.debug("Set SVG transform: {}".format(svg_transform))
+
+        svg_transform_attrib = {"transform": svg_transform}
+        if self.conf.get('svg_bake_transform', False):
+            baked_root = self.bake_svg(filepath, svg_root, svg_transform)
+            if baked_root is not None:
+                svg_root = baked_root
+                svg_transform_attrib = {}
+        # Create a new group tag to apply the transform to
+        new_svg_group = ET.Element('g', svg_transform_attrib)
+        # Copy all SVG root children to the new group
+        for child in svg_root:
+            new_svg_group.append(child)
+
+        # Backup the root attribs, clear the children, and apply attribs
+        svg_root_attrib = svg_root.items()
+        svg_root.clear()
+        for name, value in svg_root_attrib:
+            svg_root.set(name, value)
+
+        # Append the new group.
+        svg_root.append(new_svg_group)
+
+        return svg_root
+
+    def bake_svg(self, filepath, svg_root, svg_transform):
+        """
+        Apply the color transform to the coordinates of the SVG content.
+        Returns the rewritten copy of the SVG root, or None if the content
+        can't be rewritten and keeps the transform.
+        """
+        self.baked_count[1] += 1
+        baked_root = copy.deepcopy(svg_root)
+        try:
+            bake.bake_transform(baked_root, parse_transform(svg_transform),
+                                self.conf.get('svg_precision',
+                                              minify.DEFAULT_PRECISION))
+        except bake.BakeError as e:
+            logger.debug("Keeping the transform of %s: %s", filepath, e)
+            return None
+        self.baked_count[0] += 1
+        return baked_root
+
+    def minify_svg(self, svg_root, glyph_ids):
+        """
+        Minify the color SVG at the configured level and track the savings.
+        """
+        level = self.conf.get('svg_minify', 0)
+        if not level:
+            return
 
-        logger.debug("Found regular Glyph: %s", glyph_name)
-        return self.font.getGlyphID(glyph_name)
+        size = len(ET.tostring(svg_root, encoding='UTF-8'))
+        minify.minify(svg_root, level,
+                      self.conf.get('svg_precision', minify.DEFAULT_PRECISION))
+        minified_size = len(ET.tostring(svg_root, encoding='UTF-8'))
+        logger.debug("Minified glyph %s from %d to %d bytes, saved %d bytes",
+                     glyph_ids[0], size, minified_size, size - minified_size)
+
+        self.minified_size[0] += size
+        self.minified_size[1] += minified_size
 
     def get_uids_for_glyph_names(self):
         """
@@ -193,9 +757,10 @@ class Builder(object):
         Generate the transform for the color SVG.
         """
         svg_transform = ""
-        if 'color_transform' in self.conf:
-            svg_transform = "{} ".format(self.conf['color_transform'])
-        svg_height, _ = util.get_dimensions(filepath)
+        color_transform = util.get_color_transform(self.conf)
+        if color_transform is not None:
+            svg_transform = "{} ".format(color_transform)
+        svg_height, _ = self.svg_index.get_dimensions(filepath)
 
         # Find the scale multiplier based on current height verses intended
         # height (aka font EM). Whatever the SVG is, it needs to be scaled to
@@ -234,17 +799,19 @@ class Builder(object):
             fullname = "{} {}".format(tn['family'], tn['subfamily'])
         self.add_name_records(fullname, NR.FULL_NAME)
 
-        # Add the build date to the version
-        now = time.strftime('%Y%m%d')
-        version = "{} {}".format(tn['version'], now)
+        # Add the build date to the version, a reproducible build without
+        # SOURCE_DATE_EPOCH has no date.
+        now = reproducible.get_build_date(self.conf)
+        version = tn['version']
+        if now is not None:
+            version = "{} {}".format(version, now)
         self.add_name_records(version, NR.VERSION)
 
         # Add the build date to the unique id
-        unique_id = ''
-        if 'unique_id' in tn:
-            unique_id = "{} {}".format(tn['unique_id'], now)
-        else:
-            unique_id = now
+        unique_id = ' '.join(str(value) for value in
+                             (tn.get('unique_id'), now) if value is not None)
+        if not unique_id:
+            unique_id = "{} {}".format(fullname, version)
         self.add_name_records(unique_id, NR.UNIQUE_ID)
 
         # Set the values that don't always exist
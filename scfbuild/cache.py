@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+# SCFBuild is released under the GNU General Public License v3.
+# See LICENSE.txt in the project root directory.
+'''
+Content addressed on-disk cache for processed glyph data
+'''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+from . import __version__
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = '.scfbuild-cache'
+# Megabytes
+DEFAULT_CACHE_MAX_SIZE = 512
+
+# Kinds of cached data, each is stored in its own sub directory.
+OUTLINES = 'outlines'
+SVG_DOCS = 'svg'
+SOURCES = 'sources'
+COLR_LAYERS = 'colr'
+RENDER_COSTS = 'cost'
+
+
+def open_cache(conf):
+    """
+    Create the build cache from the config, or None if it is disabled.
+    """
+    memory = conf.get('cache_memory', False)
+    cache_dir = conf.get('cache_dir', DEFAULT_CACHE_DIR)
+    if not conf.get('cache', True):
+        if not memory:
+            logger.debug("Build cache disabled")
+            return None
+        cache_dir = None
+
+    max_size = conf.get('cache_max_size', DEFAULT_CACHE_MAX_SIZE)
+    return Cache(cache_dir, int(max_size * 1024 * 1024), memory)
+
+
+def make_key(*parts):
+    """
+    Create a cache key from the file digest and any config values that
+    affect the cached result.
+    """
+    # The scfbuild version is part of every key, so a new release never
+    # reuses data created by different code.
+    key = json.dumps([__version__] + list(parts), sort_keys=True)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+class Cache(object):
+    """
+    Cache entries on disk in cache_dir. With memory=True the entries used by
+    the last build are also kept in memory for repeated builds in the same
+    process. A cache_dir of None only uses memory.
+    """
+
+    def __init__(self, cache_dir, max_size, memory=False):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.memory = {} if memory else None
+        self.used = set()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, kind, key):
+        """
+        Return the cached bytes for key, or None if they don't exist.
+        """
+        if self.memory is not None:
+            self.used.add((kind, key))
+            try:
+                data = self.memory[(kind, key)]
+                self.hits += 1
+                return data
+            except KeyError:
+                pass
+
+        if self.cache_dir is None:
+            self.misses += 1
+            return None
+
+        path = self._path(kind, key)
+        try:
+            f = open(path, 'rb')
+        except IOError:
+            self.misses += 1
+            return None
+        data = f.read()
+        f.close()
+
+        # Mark as recently used for eviction.
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+        self.hits += 1
+        if self.memory is not None:
+            self.memory[(kind, key)] = data
+        return data
+
+    def set(self, kind, key, data):
+        if self.memory is not None:
+            self.used.add((kind, key))
+            self.memory[(kind, key)] = data
+        if self.cache_dir is None:
+            return
+
+        path = self._path(kind, key)
+        dirname = os.path.dirname(path)
+        if not os.path.isdir(dirname):
+            try:
+                os.makedirs(dirname)
+            except OSError:
+                # Created by another process
+                pass
+
+        # Write to a temp file and rename, so a parallel or interrupted build
+        # never reads a partial entry.
+        fd, tmp_path = tempfile.mkstemp(dir=dirname)
+        f = os.fdopen(fd, 'wb')
+        f.write(data)
+        f.close()
+        os.rename(tmp_path, path)
+
+    def get_json(self, kind, key):
+        data = self.get(kind, key)
+        if data is None:
+            return None
+        return json.loads(data.decode('utf-8'))
+
+    def set_json(self, kind, key, value):
+        self.set(kind, key, json.dumps(value).encode('utf-8'))
+
+    def prune(self):
+        """
+        Remove the least recently used entries until the cache fits in
+        max_size. Entries in memory that were not used by the last build are
+        removed.
+        """
+        logger.debug("Build cache: %d hits, %d misses", self.hits, self.misses)
+        self.hits = 0
+        self.misses = 0
+
+        if self.memory is not None:
+            for entry in list(self.memory):
+                if entry not in self.used:
+                    del self.memory[entry]
+            self.used = set()
+            logger.debug("Build cache: %d entries in memory", len(self.memory))
+
+        if self.cache_dir is None:
+            return
+
+        entries = []
+        total = 0
+        for dirpath, _, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        logger.debug("Build cache: %d bytes on disk", total)
+        if total <= self.max_size:
+            return
+
+        removed = 0
+        for _, size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+            if total <= self.max_size:
+                break
+        logger.info("Removed %d old entries from the build cache", removed)
+
+    def _path(self, kind, key):
+        return os.path.join(self.cache_dir, kind, key[:2], key)
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+# SCFBuild is released under the GNU General Public License v3.
+# See LICENSE.txt in the project root directory.
+'''
+Validate the build configuration and SVG files without building the font
+
+Only the root element of each SVG is read and FontForge is not imported,
+so this is fast enough for a pre-commit hook.
+'''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import logging
+import os
+import xml.etree.ElementTree as ET
+
+from . import util
+from .ligatures import create_sequence_trie
+from .sources import SourceFinder, drop_duplicates
+from .svg_index import read_svg_info
+from .xref import GlyphXref
+
+logger = logging.getLogger(__name__)
+
+# The highest Unicode code point.
+MAX_CODEPOINT = 0x10FFFF
+
+
+def check_conf(conf, build=True):
+    """
+    Return a list of errors in the configuration. The output file is only
+    required to build.
+    """
+    from . import render_cost
+
+    errors = []
+    if build and 'output_file' not in conf:
+        errors.append('--output is required.')
+    try:
+        util.get_output_types(conf)
+    except ValueError as e:
+        errors.append(str(e))
+    if conf.get('backend', util.DEFAULT_BACKEND) not in util.BACKENDS:
+        errors.append('Unknown backend: {}'.format(conf['backend']))
+    if conf.get('color_format', util.DEFAULT_COLOR_FORMAT) not in \
+            util.COLOR_FORMATS:
+        errors.append('Unknown color format: {}'.format(conf['color_format']))
+    if conf.get('render_budget_action', render_cost.DEFAULT_BUDGET_ACTION) \
+            not in render_cost.BUDGET_ACTIONS:
+        errors.append('Unknown render budget action: {}'.format(
+            conf['render_budget_action']))
+    for name in conf.get('render_budget') or {}:
+        if name not in render_cost.RenderCost._fields:
+            errors.append('Unknown render budget: {}'.format(name))
+    for subset_conf in conf.get('subsets') or []:
+        try:
+            subset_conf['name']
+            util.parse_unicode_range(subset_conf['unicode_range'])
+        except (KeyError, TypeError):
+            errors.append('Each subset needs a name and unicode_range.')
+        except ValueError as e:
+            errors.append(str(e))
+    if conf.get('subset_frequency') and \
+            not os.path.isfile(conf['subset_frequency']):
+        errors.append('Subset frequency file not found: {}'.format(
+            conf['subset_frequency']))
+    if os.environ.get('SOURCE_DATE_EPOCH', '').strip():
+        try:
+            int(os.environ['SOURCE_DATE_EPOCH'])
+        except ValueError:
+            errors.append('SOURCE_DATE_EPOCH is not a Unix time: {}'.format(
+                os.environ['SOURCE_DATE_EPOCH']))
+    if conf.get('subset_count') is not None and not (
+            isinstance(conf['subset_count'], int) and
+            conf['subset_count'] >= 1):
+        errors.append('--subset-count must be at least 1: {}'.format(
+            conf['subset_count']))
+    if conf.get('input_file') and not os.path.isfile(conf['input_file']):
+        errors.append('--input not found: {}'.format(conf['input_file']))
+    for key, option in (('glyph_svg_dir', '--glyph-svg-dir'),
+                        ('color_svg_dir', '--color-svg-dir')):
+        if key == 'glyph_svg_dir' and conf.get('input_file'):
+            # The input font has the regular glyphs.
+            continue
+        if key not in conf:
+            errors.append('{} is required. (currently)'.format(option))
+        elif not build and not os.path.exists(conf[key]):
+            errors.append('{} not found: {}'.format(option, conf[key]))
+    return errors
+
+
+def check_svg(filepath):
+    """
+    Check the filename and dimensions of a SVG file. Returns the SvgInfo of
+    the file, or None, and a list of errors.
+    """
+    (filename, _) = os.path.splitext(os.path.basename(filepath))
+    for u_id in filename.split('-'):
+        try:
+            codepoint = int(u_id, 16)
+        except ValueError:
+            return (None, ["Filename is not a hex code point sequence"])
+        if codepoint > MAX_CODEPOINT:
+            return (None, ["Code point out of range: {}".format(u_id)])
+
+    try:
+        svg_info = read_svg_info(filepath)
+    except ET.ParseError as e:
+        return (None, ["Invalid XML: {}".format(e)])
+
+    if svg_info.height is None:
+        return (svg_info, ["No height/width or viewBox found"])
+    if not svg_info.height or not svg_info.width:
+        return (svg_info, ["Height or width is zero"])
+    return (svg_info, [])
+
+
+def check(conf):
+    """
+    Check the configuration and both SVG directories, logging every error.
+    The color SVGs are checked against the glyphs of the --input font
+    instead of the regular SVGs if there is one. Returns 0 if there are
+    none, otherwise 1.
+    """
+    errors = check_conf(conf, build=False)
+    for error in errors:
+        logger.error(error)
+    if errors:
+        return 1
+
+    count = 0
+    xref = GlyphXref(create_sequence_trie(conf))
+    sources = [(conf['color_svg_dir'], False)]
+    if conf.get('input_file'):
+        from fontTools.ttLib import TTFont
+        font = TTFont(conf['input_file'], lazy=True)
+        xref.add_font(font)
+        font.close()
+    else:
+        sources.insert(0, (conf['glyph_svg_dir'], True))
+
+    finder = SourceFinder(conf)
+    for source, regular in sources:
+        for filepath in drop_duplicates(finder.find(source)):
+            if not os.path.isfile(filepath):
+                logger.error("%s: File not found", filepath)
+                count += 1
+                continue
+            (svg_info, file_errors) = check_svg(filepath)
+            for error in file_errors:
+                logger.error("%s: %s", filepath, error)
+            count += len(file_errors)
+            if svg_info is None:
+                continue
+
+            if regular:
+                xref.add_glyph(filepath, svg_info)
+            else:
+                xref.add_color(filepath, svg_info)
+
+    for error in xref.errors():
+        logger.error(error)
+        count += 1
+
+    if count:
+        logger.error("Found %d errors", count)
+        return 1
+    logger.info("No errors found")
+    return 0
@@ -0,0 +1,521 @@
+# -*- coding: utf-8 -*-
+# SCFBuild is released under the GNU General Public License v3.
+# See LICENSE.txt in the project root directory.
+'''
+Conversion of flat color SVGs to COLR layer glyphs with a CPAL palette
+
+Each filled shape becomes a layer glyph painted with a palette color, or
+with a linear or radial gradient in COLRv1. SVGs using anything else, such
+as strokes, clip paths, masks, filters, images, text or style sheets, can't
+be converted and stay in the SVG table.
+'''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+import json
+import logging
+import math
+import re
+
+from fontTools.colorLib.builder import buildCOLR, buildCPAL
+from fontTools.misc.transform import Transform
+from fontTools.pens.boundsPen import BoundsPen
+from fontTools.pens.cu2quPen import Cu2QuPen
+from fontTools.pens.recordingPen import RecordingPen
+from fontTools.pens.transformPen import TransformPen
+from fontTools.pens.ttGlyphPen import TTGlyphPen
+from fontTools.ttLib.tables import otTables as ot
+
+from .ftools import (CU2QU_MAX_ERR, MAX_USE_DEPTH, SHAPE_ELEMENTS,
+                     draw_outline, draw_shape)
+from .minify import XLINK_NS, split_tag
+from .svg_path import parse_transform
+
+logger = logging.getLogger(__name__)
+
+# Elements that are not drawn where they are defined.
+DEFINITION_ELEMENTS = frozenset([
+    'defs', 'clipPath', 'mask', 'pattern', 'symbol', 'marker',
+    'linearGradient', 'radialGradient', 'metadata', 'title', 'desc',
+])
+# Elements that can't be converted to layers.
+UNSUPPORTED_ELEMENTS = frozenset(['style', 'text', 'image', 'line',
+                                  'foreignObject', 'switch'])
+# Attributes with effects that can't be converted to layers.
+UNSUPPORTED_ATTRIBS = ('clip-path', 'mask', 'filter')
+# Inherited presentation attributes used by the conversion.
+INHERITED_ATTRIBS = frozenset(['fill', 'fill-opacity', 'fill-rule', 'stroke',
+                               'stroke-width', 'stroke-opacity', 'color',
+                               'visibility'])
+GRADIENT_ELEMENTS = frozenset(['linearGradient', 'radialGradient'])
+SPREAD_METHODS = frozenset(['pad', 'reflect', 'repeat'])
+
+# CSS basic color keywords
+NAMED_COLORS = {
+    'black': (0, 0, 0), 'silver': (192, 192, 192), 'gray': (128, 128, 128),
+    'grey': (128, 128, 128), 'white': (255, 255, 255),
+    'maroon': (128, 0, 0), 'red': (255, 0, 0), 'purple': (128, 0, 128),
+    'fuchsia': (255, 0, 255), 'magenta': (255, 0, 255),
+    'green': (0, 128, 0), 'lime': (0, 255, 0), 'olive': (128, 128, 0),
+    'yellow': (255, 255, 0), 'navy': (0, 0, 128), 'blue': (0, 0, 255),
+    'teal': (0, 128, 128), 'aqua': (0, 255, 255), 'cyan': (0, 255, 255),
+    'orange': (255, 165, 0),
+}
+
+HEX_COLOR_RE = re.compile(r'^#([0-9a-f]{3,4}|[0-9a-f]{6}|[0-9a-f]{8})$',
+                          re.IGNORECASE)
+RGB_COLOR_RE = re.compile(r'^rgba?\(([^)]*)\)$', re.IGNORECASE)
+NUMBER_RE = re.compile(r'^([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)'
+                       r'(%|px)?$')
+URL_RE = re.compile(r'^url\(\s*[\'"]?#([^\'")\s]+)[\'"]?\s*\)')
+
+# Layer glyph names, followed by a number.
+LAYER_GLYPH_PREFIX = 'layer'
+# Tables with data for each glyph that FontForge may create, they would be
+# invalid with the added layer glyphs.
+PER_GLYPH_TABLES = ('hdmx', 'LTSH', 'VDMX')
+
+
+class UnsupportedSvgError(Exception):
+    pass
+
+
+def parse_number(value):
+    """
+    Parse a number, a percentage is returned as a fraction.
+    """
+    match = NUMBER_RE.match(value.strip())
+    if match is None:
+        raise UnsupportedSvgError('Invalid number: {}'.format(value))
+    number = float(match.group(1))
+    if match.group(2) == '%':
+        number /= 100
+    return number
+
+
+def parse_color(value):
+    """
+    Parse a CSS color to (r, g, b, a) from 0 to 255.
+    """
+    value = value.strip()
+    match = HEX_COLOR_RE.match(value)
+    if match:
+        digits = match.group(1)
+        if len(digits) <= 4:
+            digits = ''.join(digit * 2 for digit in digits)
+        rgba = [int(digits[i:i + 2], 16) for i in range(0, len(digits), 2)]
+        return tuple(rgba + [255] * (4 - len(rgba)))
+
+    match = RGB_COLOR_RE.match(value)
+    if match:
+        parts = [part for part in re.split(r'[\s,/]+', match.group(1))
+                 if part]
+        if len(parts) not in (3, 4):
+            raise UnsupportedSvgError('Invalid color: {}'.format(value))
+        rgb = [parse_number(part) * 255 if part.endswith('%')
+               else parse_number(part) for part in parts[:3]]
+        alpha = parse_number(parts[3]) if len(parts) == 4 else 1
+        return tuple(int(round(min(max(c, 0), 255))) for c in
+                     rgb + [alpha * 255])
+
+    if value.lower() == 'transparent':
+        return (0, 0, 0, 0)
+    try:
+        return NAMED_COLORS[value.lower()] + (255,)
+    except KeyError:
+        raise UnsupportedSvgError('Unsupported color: {}'.format(value))
+
+
+def with_alpha(rgba, alpha):
+    return rgba[:3] + (int(round(rgba[3] * min(max(alpha, 0), 1))),)
+
+
+def get_style(element):
+    """
+    Get the presentation attributes of an element, the style attribute
+    overrides them.
+    """
+    style = dict((name, value) for name, value in element.items()
+                 if split_tag(name)[0] is None)
+    for declaration in style.pop('style', '').split(';'):
+        (name, _, value) = declaration.partition(':')
+        if value.strip():
+            style[name.strip()] = value.strip()
+    return style
+
+
+def check_range(values):
+    """
+    Coordinates in the glyph and COLR tables are 16 bit.
+    """
+    for value in values:
+        if not -0x8000 <= value <= 0x7FFF:
+            raise UnsupportedSvgError('Coordinate out of range')
+
+
+def count_contours(outline):
+    return len([operator for operator, _ in outline if operator == 'moveTo'])
+
+
+def convert_svg(svg_root, transform, gradients=False):
+    """
+    Convert the filled shapes of a color SVG to layers in font units.
+    Returns a list of (outline, paint), where paint is one of:
+    ['solid', rgba]
+    ['linear', extend, stops, [x0, y0, x1, y1, x2, y2]]
+    ['radial', extend, stops, [x0, y0, r0, x1, y1, r1], transform]
+    Raises UnsupportedSvgError if the SVG can't be converted.
+    """
+    for element in svg_root.iter():
+        if isinstance(element.tag, str) and \
+                split_tag(element.tag)[1] == 'style':
+            raise UnsupportedSvgError('<style> element')
+
+    converter = LayerConverter(svg_root, gradients)
+    try:
+        converter.convert(svg_root, transform, {}, 0)
+    except ValueError as e:
+        raise UnsupportedSvgError(str(e))
+    if not converter.layers:
+        raise UnsupportedSvgError('No filled shapes')
+    return converter.layers
+
+
+class LayerConverter(object):
+
+    def __init__(self, svg_root, gradients):
+        self.ids = dict((element.get('id'), element)
+                        for element in svg_root.iter()
+                        if element.get('id') is not None)
+        self.root = svg_root
+        self.gradients = gradients
+        self.layers = []
+
+    def convert(self, element, transform, inherited, depth):
+        if not isinstance(element.tag, str):
+            return
+        tag = split_tag(element.tag)[1]
+        if tag in UNSUPPORTED_ELEMENTS or \
+                (tag == 'svg' and element is not self.root):
+            raise UnsupportedSvgError('<{}> element'.format(tag))
+        if tag in DEFINITION_ELEMENTS:
+            return
+
+        style = get_style(element)
+        if style.get('display') == 'none':
+            return
+        for name in UNSUPPORTED_ATTRIBS:
+            if style.get(name, 'none') != 'none':
+                raise UnsupportedSvgError('{} attribute'.format(name))
+        inherited = dict(inherited)
+        inherited.update((name, value) for name, value in style.items()
+                         if name in INHERITED_ATTRIBS and value != 'inherit')
+        opacity = parse_number(style.get('opacity', '1'))
+
+        if element.get('transform') is not None:
+            transform = transform.transform(
+                parse_transform(element.get('transform')))
+
+        if tag in SHAPE_ELEMENTS:
+            self.convert_shape(element, tag, transform, inherited, opacity)
+            return
+        if opacity < 1:
+            # The layers of a group would be blended separately.
+            raise UnsupportedSvgError('Group opacity')
+
+        if tag == 'use':
+            href = element.get('{%s}href' % XLINK_NS, element.get('href', ''))
+            target = self.ids.get(href[1:]) if href.startswith('#') else None
+            if target is None or depth >= MAX_USE_DEPTH:
+                raise UnsupportedSvgError('<use> of {}'.format(href))
+            transform = transform.translate(float(element.get('x', 0)),
+                                            float(element.get('y', 0)))
+            if split_tag(target.tag)[1] == 'symbol':
+                for child in target:
+                    self.convert(child, transform, inherited, depth + 1)
+            else:
+                self.convert(target, transform, inherited, depth + 1)
+        else:
+            for child in element:
+                self.convert(child, transform, inherited, depth)
+
+    def convert_shape(self, element, tag, transform, inherited, opacity):
+        if inherited.get('visibility') in ('hidden', 'collapse'):
+            return
+        if inherited.get('stroke', 'none') != 'none' and \
+                parse_number(inherited.get('stroke-width', '1')) > 0 and \
+                parse_number(inherited.get('stroke-opacity', '1')) > 0:
+            raise UnsupportedSvgError('Stroke')
+        fill = inherited.get('fill', 'black')
+        if fill == 'none':
+            return
+
+        pen = RecordingPen()
+        draw_shape(element, tag, TransformPen(pen, transform))
+        outline = [(operator, [list(point) for point in points])
+                   for operator, points in pen.value]
+        if not outline:
+            return
+        check_range(c for _, points in outline for point in points
+                    for c in point)
+        # Glyph outlines are filled with the nonzero rule.
+        if inherited.get('fill-rule') == 'evenodd' and \
+                count_contours(outline) > 1:
+            raise UnsupportedSvgError('Even-odd fill rule')
+
+        alpha = opacity * parse_number(inherited.get('fill-opacity', '1'))
+        paint = self.create_paint(fill, element, tag, transform, inherited,
+                                  alpha)
+        if paint is not None:
+            self.layers.append((outline, paint))
+
+    def create_paint(self, fill, element, tag, transform, inherited, alpha):
+        match = URL_RE.match(fill)
+        if match is None:
+            if fill == 'currentColor':
+                fill = inherited.get('color', 'black')
+            return ['solid', with_alpha(parse_color(fill), alpha)]
+
+        gradient = self.ids.get(match.group(1))
+        if gradient is None or \
+                split_tag(gradient.tag)[1] not in GRADIENT_ELEMENTS:
+            raise UnsupportedSvgError('Fill {}'.format(fill))
+        if not self.gradients:
+            raise UnsupportedSvgError('Gradient fill')
+        return self.create_gradient(gradient, element, tag, transform, alpha)
+
+    def gradient_chain(self, gradient):
+        """
+        The gradient and the gradients it inherits from with href.
+        """
+        chain = [gradient]
+        while len(chain) <= MAX_USE_DEPTH:
+            href = chain[-1].get('{%s}href' % XLINK_NS,
+                                 chain[-1].get('href', ''))
+            parent = self.ids.get(href[1:]) if href.startswith('#') else None
+            if parent is None or parent in chain or \
+                    split_tag(parent.tag)[1] not in GRADIENT_ELEMENTS:
+                break
+            chain.append(parent)
+        return chain
+
+    def gradient_stops(self, chain, alpha):
+        """
+        Get the [offset, rgba] color stops of the first gradient in the
+        chain that has any.
+        """
+        for gradient in chain:
+            elements = [child for child in gradient
+                        if isinstance(child.tag, str) and
+                        split_tag(child.tag)[1] == 'stop']
+            if elements:
+                break
+        else:
+            return []
+
+        stops = []
+        last_offset = 0
+        for element in elements:
+            style = get_style(element)
+            offset = min(max(parse_number(style.get('offset', '0')), 0), 1)
+            last_offset = max(offset, last_offset)
+            color = style.get('stop-color', 'black')
+            if color == 'currentColor':
+                color = style.get('color', 'black')
+            stop_alpha = alpha * parse_number(style.get('stop-opacity', '1'))
+            stops.append([last_offset, with_alpha(parse_color(color),
+                                                  stop_alpha)])
+        return stops
+
+    def create_gradient(self, gradient, element, tag, transform, alpha):
+        chain = self.gradient_chain(gradient)
+
+        def attrib(name, default=None):
+            for item in chain:
+                if item.get(name) is not None:
+                    return item.get(name)
+            return default
+
+        stops = self.gradient_stops(chain, alpha)
+        if not stops:
+            return None
+        if len(stops) == 1:
+            return ['solid', stops[0][1]]
+
+        units = attrib('gradientUnits', 'objectBoundingBox')
+        if units == 'objectBoundingBox':
+            pen = BoundsPen(None)
+            draw_shape(element, tag, pen)
+            if pen.bounds is None:
+                return None
+            (x_min, y_min, x_max, y_max) = pen.bounds
+            if x_min == x_max or y_min == y_max:
+                return None
+            transform = transform.transform(
+                Transform(x_max - x_min, 0, 0, y_max - y_min, x_min, y_min))
+        elif units != 'userSpaceOnUse':
+            raise UnsupportedSvgError('gradientUnits {}'.format(units))
+        if attrib('gradientTransform') is not None:
+            transform = transform.transform(
+                parse_transform(attrib('gradientTransform')))
+
+        def length(name, default):
+            value = attrib(name, default)
+            number = parse_number(value)
+            if number and value.strip().endswith('%') and \
+                    units != 'objectBoundingBox':
+                # Relative to the viewport, which is removed.
+                raise UnsupportedSvgError('Gradient percentage')
+            return number
+
+        extend = attrib('spreadMethod', 'pad')
+        if extend not in SPREAD_METHODS:
+            extend = 'pad'
+
+        if split_tag(gradient.tag)[1] == 'linearGradient':
+            (x1, y1) = (length('x1', '0%'), length('y1', '0%'))
+            (x2, y2) = (length('x2', '100%'), length('y2', '0%'))
+            if (x1, y1) == (x2, y2):
+                return ['solid', stops[-1][1]]
+            # The colors are constant along lines at a right angle to the
+            # gradient vector, through x2/y2 after the transform.
+            points = [transform.transformPoint(point) for point in
+                      ((x1, y1), (x2, y2), (x1 - (y2 - y1), y1 + (x2 - x1)))]
+            points = [int(round(c)) for point in points for c in point]
+            check_range(points)
+            return ['linear', extend, stops, points]
+
+        (cx, cy) = (attrib('cx', '50%'), attrib('cy', '50%'))
+        circles = [length('fx', cx), length('fy', cy), length('fr', '0%'),
+                   length('cx', '50%'), length('cy', '50%'),
+                   length('r', '50%')]
+        (xx, xy, yx, yy, _, _) = transform
+        scale = math.sqrt(abs(xx * yy - xy * yx))
+        if not scale or circles[5] <= 0:
+            return ['solid', stops[-1][1]]
+        # The circles are scaled to font units, so they can be rounded,
+        # and the rest of the transform is a PaintTransform.
+        circles = [int(round(c * scale)) for c in circles]
+        check_range(circles + list(transform)[4:])
+        return ['radial', extend, stops, circles,
+                list(transform.scale(1 / scale))]
+
+
+class ColorGlyphs(object):
+    """
+    The COLR glyphs of a font, with one CPAL palette of all colors and one
+    layer glyph for each distinct layer outline.
+    """
+
+    def __init__(self):
+        # {rgba: palette index}
+        self.palette = collections.OrderedDict()
+        # {outline key: (glyph name, outline)}
+        self.layer_glyphs = collections.OrderedDict()
+        self.color_glyphs = {}
+
+    def palette_index(self, rgba):
+        rgba = tuple(rgba)
+        if rgba not in self.palette:
+            self.palette[rgba] = len(self.palette)
+        return self.palette[rgba]
+
+    def layer_glyph(self, outline):
+        key = json.dumps([(operator, [[round(c, 2) for c in point]
+                                      for point in points])
+                          for operator, points in outline])
+        if key not in self.layer_glyphs:
+            name = "{}{}".format(LAYER_GLYPH_PREFIX, len(self.layer_glyphs))
+            self.layer_glyphs[key] = (name, outline)
+        return self.layer_glyphs[key][0]
+
+    def add_glyph(self, glyph_name, layers):
+        """
+        Add the layers from convert_svg() as the color glyph of glyph_name.
+        Glyphs with only solid colors are COLRv0 glyphs.
+        """
+        if all(paint[0] == 'solid' for _, paint in layers):
+            self.color_glyphs[glyph_name] = [
+                (self.layer_glyph(outline), self.palette_index(paint[1]))
+                for outline, paint in layers]
+            return
+
+        paints = [{
+            'Format': ot.PaintFormat.PaintGlyph,
+            'Glyph': self.layer_glyph(outline),
+            'Paint': self.create_paint(paint),
+        } for outline, paint in layers]
+        if len(paints) == 1:
+            self.color_glyphs[glyph_name] = paints[0]
+        else:
+            self.color_glyphs[glyph_name] = {
+                'Format': ot.PaintFormat.PaintColrLayers,
+                'Layers': paints,
+            }
+
+    def create_paint(self, paint):
+        if paint[0] == 'solid':
+            return {'Format': ot.PaintFormat.PaintSolid,
+                    'PaletteIndex': self.palette_index(paint[1]),
+                    'Alpha': 1.0}
+
+        color_line = {
+            'Extend': paint[1],
+            'ColorStop': [{'StopOffset': offset,
+                           'PaletteIndex': self.palette_index(rgba),
+                           'Alpha': 1.0} for offset, rgba in paint[2]],
+        }
+        if paint[0] == 'linear':
+            (x0, y0, x1, y1, x2, y2) = paint[3]
+            return {'Format': ot.PaintFormat.PaintLinearGradient,
+                    'ColorLine': color_line, 'x0': x0, 'y0': y0,
+                    'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2}
+
+        # SVG gradients go from the focal circle to the outer circle.
+        (x0, y0, r0, x1, y1, r1) = paint[3]
+        (xx, yx, xy, yy, dx, dy) = paint[4]
+        return {
+            'Format': ot.PaintFormat.PaintTransform,
+            'Transform': {'xx': xx, 'yx': yx, 'xy': xy, 'yy': yy,
+                          'dx': dx, 'dy': dy},
+            'Paint': {'Format': ot.PaintFormat.PaintRadialGradient,
+                      'ColorLine': color_line, 'x0': x0, 'y0': y0,
+                      'r0': r0, 'x1': x1, 'y1': y1, 'r1': r1},
+        }
+
+    def build(self, font):
+        """
+        Add the layer glyphs and the COLR and CPAL tables to the font.
+        """
+        add_layer_glyphs(font, self.layer_glyphs.values())
+        font['CPAL'] = buildCPAL([[tuple(c / 255 for c in rgba)
+                                   for rgba in self.palette]])
+        font['COLR'] = buildCOLR(self.color_glyphs,
+                                 glyphMap=font.getReverseGlyphMap())
+
+
+def add_layer_glyphs(font, layer_glyphs):
+    """
+    Add (name, outline) glyphs after the glyphs of the font.
+    """
+    for tag in PER_GLYPH_TABLES:
+        if tag in font:
+            del font[tag]
+
+    # Load the glyf table first, so it follows the new glyph order.
+    glyf = font['glyf']
+    hmtx = font['hmtx']
+    layer_glyphs = list(layer_glyphs)
+    font.setGlyphOrder(font.getGlyphOrder() +
+                       [name for name, _ in layer_glyphs])
+    for name, outline in layer_glyphs:
+        pen = TTGlyphPen(None)
+        draw_outline(outline, Cu2QuPen(pen, CU2QU_MAX_ERR))
+        glyph = pen.glyph()
+        glyph.recalcBounds(glyf)
+        glyf[name] = glyph
+        hmtx[name] = (0, getattr(glyph, 'xMin', 0))
+    # The intermediate font is opened without recalculating the bounds.
+    font['maxp'].recalc(font)
@@ -8,13 +8,16 @@ Utility functions using FontForge
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 import logging
+import multiprocessing
 import fontforge
 import psMat
-import sys
+import timeit
 
 from . import util
+from .cache import OUTLINES, make_key
+from .svg_index import SvgIndex
 from .util import FONT_EM, DEFAULT_GLYPH_WIDTH
-from .unicode import ZWJ_INT, VS16_INT, ZWJ_SEQUENCES
+from .unicode import ZWJ_INT, VS16_INT
 
 logger = logging.getLogger(__name__)
 
@@ -30,17 +33,6 @@ def create_font(conf):
 
     font.em = FONT_EM
 
-    # TODO: Make ligatures optional
-    # Forcing strings to stop TypeError: Bad type for argument due to
-    # unicode_literals
-    liga = str('liga')
-    latn = str('latn')
-    dflt = str('dflt')
-    feature_script_lang = ((liga, ((latn, (dflt)),)),)
-    # Set up ligatures
-    font.addLookup('liga', 'gsub_ligature', (), feature_script_lang)
-    font.addLookupSubtable('liga', 'liga')
-
     # Add all recommended font characters
     # Reference: https://www.microsoft.com/typography/otspec/recom.htm
     glyph = font.createChar(-1, '.notdef')
@@ -64,76 +56,181 @@ def create_font(conf):
     return font
 
 
-def add_glyphs(font, svg_filepaths, conf):
+def add_glyphs(font, svg_filepaths, conf, cache=None, svg_index=None,
+               metrics=None):
     """
     Loop through all files and create regular or ligature glyphs for each.
     """
-    for filepath in svg_filepaths:
-        (codepoint, filename) = util.codepoint_from_filepath(filepath)
-
-        # If code point is -1, then the final name is not a simple unicode id
-        # so make a glyph for use with ligatures
-        if codepoint == -1:
-            # Example: 1f441-1f5e8.svg
-
-            # Create a gylph without a defined code point
-            glyph = font.createChar(-1, filename)
-            logger.debug("Creating ligature glyph %s", filename)
-
-            # Creates a list of Unicode IDs from a string of hyphen separated
-            # Unicode IDs.
-            u_ids = [int(u_id, 16) for u_id in filename.split("-")]
-            # Example: (0x1f441, 0x1f5e8)
-
-            if sys.version_info.major == 2:
-                # Python 2
-                u_str = ''.join(map(unichr, u_ids))
-            else:
-                u_str = ''.join(map(chr, u_ids))
-            # Example: "U\0001f441U\0001f5e8"
-
-            # Replace sequences with correct ZWJ/VS16 versions as needed
-            try:
-                u_str = ZWJ_SEQUENCES[u_str]
-                u_ids = map(ord, u_str)
-            except KeyError:
-                pass
-
-            # Create a tuple of glyph names
-            liga_glyphs = tuple(map(fontforge.nameFromUnicode, u_ids))
-            # Add the new ligature to the glyph
-            glyph.addPosSub('liga', liga_glyphs)
-            logger.debug("Adding substitution %s", liga_glyphs)
-
-            if VS16_INT in u_ids:
-                # Create a list of IDs without the emoji variation selector.
-                u_ids = [u_id for u_id in u_ids if u_id != VS16_INT]
-                liga_glyphs = tuple(map(fontforge.nameFromUnicode, u_ids))
-                glyph.addPosSub('liga', liga_glyphs)
-                logger.debug("Adding substitution %s", liga_glyphs)
-
+    if svg_index is None:
+        svg_index = SvgIndex()
+
+    outlines = [None] * len(svg_filepaths)
+    # Seconds spent cleaning outlines in the worker processes.
+    clean_times = [0] * len(svg_filepaths)
+    cache_keys = [None] * len(svg_filepaths)
+    if cache is not None:
+        for index, filepath in enumerate(svg_filepaths):
+            cache_keys[index] = outline_cache_key(
+                svg_index.digest(filepath), conf)
+            outlines[index] = cache.get_json(OUTLINES, cache_keys[index])
+
+    missing = [index for index, contours in enumerate(outlines)
+               if contours is None]
+    jobs = util.get_jobs(conf)
+    if jobs > 1 and len(missing) > 1:
+        logger.info("Cleaning %d glyph outlines with %d jobs",
+                    len(missing), jobs)
+        cleaned = clean_outlines_parallel(
+            [svg_filepaths[index] for index in missing], conf, jobs)
+        for index, (contours, seconds) in zip(missing, cleaned):
+            outlines[index] = contours
+            clean_times[index] = seconds
+            if cache is not None:
+                cache.set_json(OUTLINES, cache_keys[index], contours)
+
+    # Glyphs are always created serially in the order of svg_filepaths so the
+    # output is the same no matter how the outlines were cleaned.
+    for index, filepath in enumerate(svg_filepaths):
+        start = timeit.default_timer()
+        glyph = create_glyph(font, filepath, svg_index)
+
+        if outlines[index] is None:
+            clean_outlines(glyph, filepath, conf)
+            if cache is not None:
+                cache.set_json(OUTLINES, cache_keys[index],
+                               get_contours(glyph))
         else:
-            # Normal single character glyph
-            # Example: 1f914.svg
-            glyph = font.createChar(codepoint)
-            logger.debug("Creating glyph at 0x%x for %s", codepoint, filepath)
+            set_contours(glyph, outlines[index])
 
-        glyph.importOutlines(filepath)
-        glyph.width = util.get_glyph_width(filepath)
+        glyph.width = svg_index.get_glyph_width(filepath)
         logger.debug("Set glyph width/height (%d/%d)", glyph.width, FONT_EM)
-        glyph.removeOverlap()
-        glyph.simplify()
-        glyph.addExtrema()
-
-        try:
-            trans = psMat.translate(
-                conf['glyph_translate_x'],
-                conf['glyph_translate_y'])
-            glyph.transform(trans)
-            logger.debug("Translate glyph (%d, %d)",
-                         conf['glyph_translate_x'],
-                         conf['glyph_translate_y'])
-        except KeyError:
-            pass
+
+        if metrics is not None:
+            metrics.glyph('add_glyphs', filepath, clean_times[index] +
+                          timeit.default_timer() - start)
 
     return font
+
+
+def create_glyph(font, filepath, svg_index):
+    """
+    Create a regular or ligature glyph for the SVG filepath.
+    """
+    svg_info = svg_index.get(filepath)
+    (codepoint, filename) = (svg_info.codepoint, svg_info.name)
+
+    # If code point is -1, then the final name is not a simple unicode id
+    # so make a glyph for use with ligatures
+    if codepoint == -1:
+        # Example: 1f441-1f5e8.svg
+
+        # Create a gylph without a defined code point
+        glyph = font.createChar(-1, filename)
+        # The ligature substitutions are added to the generated font by
+        # the Builder, see ligatures.py
+        logger.debug("Creating ligature glyph %s", filename)
+    else:
+        # Normal single character glyph
+        # Example: 1f914.svg
+        glyph = font.createChar(codepoint)
+        logger.debug("Creating glyph at 0x%x for %s", codepoint, filepath)
+
+    return glyph
+
+
+def clean_outlines(glyph, filepath, conf):
+    """
+    Import the SVG outlines into the glyph, clean them up and apply the
+    configured glyph translation.
+    """
+    glyph.importOutlines(filepath)
+    glyph.removeOverlap()
+    glyph.simplify()
+    glyph.addExtrema()
+
+    try:
+        trans = psMat.translate(
+            conf['glyph_translate_x'],
+            conf['glyph_translate_y'])
+        glyph.transform(trans)
+        logger.debug("Translate glyph (%d, %d)",
+                     conf['glyph_translate_x'],
+                     conf['glyph_translate_y'])
+    except KeyError:
+        pass
+
+
+def outline_cache_key(digest, conf):
+    """
+    Cache key for the cleaned outlines of an SVG file.
+    """
+    return make_key(OUTLINES, digest,
+                    conf.get('glyph_translate_x'),
+                    conf.get('glyph_translate_y'))
+
+
+def clean_outlines_parallel(svg_filepaths, conf, jobs):
+    """
+    Clean the outlines of all SVGs across a process pool. Returns a list of
+    (contours, seconds) in the same order as svg_filepaths.
+    """
+    tasks = [(filepath, conf) for filepath in svg_filepaths]
+    chunksize = max(1, len(tasks) // (jobs * 4))
+
+    pool = multiprocessing.Pool(processes=jobs, initializer=_init_worker)
+    try:
+        # Pool.map() keeps the order of the tasks.
+        return pool.map(_clean_outlines_worker, tasks, chunksize)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def get_contours(glyph):
+    """
+    Get the foreground contours of a glyph as plain picklable data.
+    Format: [(closed, is_quadratic, [(x, y, on_curve), ...]), ...]
+    """
+    contours = []
+    for contour in glyph.foreground:
+        points = [(point.x, point.y, bool(point.on_curve))
+                  for point in contour]
+        contours.append((bool(contour.closed), bool(contour.is_quadratic),
+                         points))
+    return contours
+
+
+def set_contours(glyph, contours):
+    """
+    Replace the foreground of a glyph with contours from get_contours()
+    """
+    layer = fontforge.layer()
+    for closed, is_quadratic, points in contours:
+        contour = fontforge.contour()
+        contour.is_quadratic = is_quadratic
+        for x, y, on_curve in points:
+            contour += fontforge.point(x, y, on_curve)
+        contour.closed = closed
+        layer += contour
+    glyph.foreground = layer
+
+
+# Each pool worker cleans outlines in its own scratch font.
+_worker_font = None
+
+
+def _init_worker():
+    global _worker_font
+    _worker_font = fontforge.font()
+    _worker_font.em = FONT_EM
+
+
+def _clean_outlines_worker(task):
+    (filepath, conf) = task
+    start = timeit.default_timer()
+    glyph = _worker_font.createChar(-1, str('scratch'))
+    glyph.clear()
+    clean_outlines(glyph, filepath, conf)
+    contours = get_contours(glyph)
+    glyph.clear()
+    return (contours, timeit.default_timer() - start)
@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+# SCFBuild is released under the GNU General Public License v3.
+# See LICENSE.txt in the project root directory.
+'''
+Utility functions using fontTools instead of FontForge
+'''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+import logging
+import multiprocessing
+import timeit
+import xml.etree.ElementTree as ET
+
+from fontTools.agl import UV2AGL
+from fontTools.fontBuilder import FontBuilder
+from fontTools.misc.transform import Transform
+from fontTools.pens.cu2quPen import Cu2QuPen
+from fontTools.pens.recordingPen import RecordingPen
+from fontTools.pens.transformPen import TransformPen
+from fontTools.pens.ttGlyphPen import TTGlyphPen
+from fontTools.svgLib.path import parse_path
+from fontTools.svgLib.path.shapes import PathBuilder
+
+from . import util
+from .cache import OUTLINES, make_key
+from .minify import XLINK_NS, split_tag
+from .svg_index import MissingDimensionsException, SvgIndex
+from .svg_path import parse_transform
+from .util import FONT_EM, DEFAULT_GLYPH_WIDTH
+from .unicode import ZWJ_INT, VS16_INT
+
+logger = logging.getLogger(__name__)
+
+# Same vertical metrics as a new FontForge font.
+ASCENT = int(round(FONT_EM * 0.8))
+DESCENT = FONT_EM - ASCENT
+
+# Maximum distance in font units between the cubic curves of the SVG and
+# the quadratic curves of the glyph.
+CU2QU_MAX_ERR = 1.0
+
+SHAPE_ELEMENTS = frozenset(['path', 'rect', 'circle', 'ellipse', 'polygon',
+                            'polyline'])
+# Elements that are not drawn where they are defined.
+NON_RENDERING_ELEMENTS = frozenset([
+    'defs', 'clipPath', 'mask', 'pattern', 'symbol', 'marker',
+    'linearGradient', 'radialGradient', 'style', 'metadata', 'title', 'desc',
+    'text', 'image', 'line',
+])
+# Limit for nested <use> references.
+MAX_USE_DEPTH = 16
+
+
+Glyph = collections.namedtuple('Glyph', ['codepoint', 'width', 'outline'])
+
+
+class OutlineFont(object):
+    """
+    The glyphs of a font, compiled to a TTFont with FontBuilder by
+    generate(). The ligatures are added by the Builder.
+    """
+
+    def __init__(self):
+        self.glyphs = collections.OrderedDict()
+
+    def add_glyph(self, name, codepoint, width, outline=None):
+        self.glyphs[name] = Glyph(codepoint, width, outline or [])
+
+    def glyph_order(self):
+        """
+        .notdef first, then the encoded glyphs by code point and then the
+        ligature glyphs, the same order FontForge uses.
+        """
+        encoded = sorted((glyph.codepoint, name)
+                         for name, glyph in self.glyphs.items()
+                         if glyph.codepoint is not None)
+        unencoded = [name for name, glyph in self.glyphs.items()
+                     if glyph.codepoint is None and name != '.notdef']
+        return ['.notdef'] + [name for _, name in encoded] + unencoded
+
+    def generate(self):
+        """
+        Compile the glyphs into a new TTFont.
+        """
+        glyph_order = self.glyph_order()
+        font_builder = FontBuilder(FONT_EM, isTTF=True)
+        font_builder.setupGlyphOrder(glyph_order)
+        font_builder.setupCharacterMap(dict(
+            (glyph.codepoint, name) for name, glyph in self.glyphs.items()
+            if glyph.codepoint is not None))
+
+        tt_glyphs = {}
+        for name in glyph_order:
+            pen = TTGlyphPen(None)
+            draw_outline(self.glyphs[name].outline,
+                         Cu2QuPen(pen, CU2QU_MAX_ERR))
+            tt_glyphs[name] = pen.glyph()
+        font_builder.setupGlyf(tt_glyphs)
+        remove_overlaps(font_builder.font)
+
+        glyf = font_builder.font['glyf']
+        metrics = {}
+        for name in glyph_order:
+            glyph = glyf[name]
+            glyph.recalcBounds(glyf)
+            metrics[name] = (self.glyphs[name].width,
+                             getattr(glyph, 'xMin', 0))
+        font_builder.setupHorizontalMetrics(metrics)
+        font_builder.setupHorizontalHeader(ascent=ASCENT, descent=-DESCENT)
+        font_builder.setupOS2(sTypoAscender=ASCENT, sTypoDescender=-DESCENT,
+                              usWinAscent=ASCENT, usWinDescent=DESCENT)
+        font_builder.setupPost()
+        # The name table is added by the Builder.
+        font_builder.setupNameTable({})
+        return font_builder.font
+
+
+def create_font(conf):
+    """
+    Create font with some default options
+    """
+    font = OutlineFont()
+
+    # Add all recommended font characters
+    # Reference: https://www.microsoft.com/typography/otspec/recom.htm
+    font.add_glyph('.notdef', None, 0)
+    font.add_glyph('.null', 0x0, DEFAULT_GLYPH_WIDTH)
+    font.add_glyph('CR', 0xD, DEFAULT_GLYPH_WIDTH)
+    width_space = conf.get('width_space', DEFAULT_GLYPH_WIDTH)
+    font.add_glyph('space', 0x20, width_space)
+    logger.debug("Space character width: %d", width_space)
+    font.add_glyph(glyph_name(ZWJ_INT), ZWJ_INT, 0)
+    font.add_glyph(glyph_name(VS16_INT), VS16_INT, 0)
+
+    return font
+
+
+def glyph_name(codepoint):
+    """
+    Glyph name for a code point, the same as fontforge.nameFromUnicode()
+    """
+    try:
+        return UV2AGL[codepoint]
+    except KeyError:
+        if codepoint > 0xFFFF:
+            return "u{:X}".format(codepoint)
+        return "uni{:04X}".format(codepoint)
+
+
+def add_glyphs(font, svg_filepaths, conf, cache=None, svg_index=None,
+               metrics=None):
+    """
+    Loop through all files and create regular or ligature glyphs for each.
+    """
+    if svg_index is None:
+        svg_index = SvgIndex()
+
+    outlines = [None] * len(svg_filepaths)
+    draw_times = [0] * len(svg_filepaths)
+    cache_keys = [None] * len(svg_filepaths)
+    if cache is not None:
+        for index, filepath in enumerate(svg_filepaths):
+            cache_keys[index] = outline_cache_key(
+                svg_index.digest(filepath), conf)
+            outlines[index] = cache.get_json(OUTLINES, cache_keys[index])
+
+    missing = [index for index, outline in enumerate(outlines)
+               if outline is None]
+    tasks = [(svg_filepaths[index], svg_index.get(svg_filepaths[index]), conf)
+             for index in missing]
+    jobs = util.get_jobs(conf)
+    if jobs > 1 and len(tasks) > 1:
+        logger.info("Drawing %d glyph outlines with %d jobs",
+                    len(tasks), jobs)
+        drawn = draw_glyphs_parallel(tasks, jobs)
+    else:
+        drawn = [_draw_glyph_worker(task) for task in tasks]
+
+    for index, (outline, seconds) in zip(missing, drawn):
+        outlines[index] = outline
+        draw_times[index] = seconds
+        if cache is not None:
+            cache.set_json(OUTLINES, cache_keys[index], outline)
+
+    for index, filepath in enumerate(svg_filepaths):
+        svg_info = svg_index.get(filepath)
+        width = svg_index.get_glyph_width(filepath)
+
+        if svg_info.codepoint == -1:
+            # Example: 1f441-1f5e8.svg
+            font.add_glyph(svg_info.name, None, width, outlines[index])
+            logger.debug("Creating ligature glyph %s", svg_info.name)
+        else:
+            # Example: 1f914.svg
+            font.add_glyph(glyph_name(svg_info.codepoint),
+                           svg_info.codepoint, width, outlines[index])
+            logger.debug("Creating glyph at 0x%x for %s",
+                         svg_info.codepoint, filepath)
+        logger.debug("Set glyph width/height (%d/%d)", width, FONT_EM)
+
+        if metrics is not None:
+            metrics.glyph('add_glyphs', filepath, draw_times[index])
+
+    return font
+
+
+def outline_cache_key(digest, conf):
+    """
+    Cache key for the outlines of an SVG file.
+    """
+    return make_key(OUTLINES, 'fonttools', digest,
+                    conf.get('glyph_translate_x'),
+                    conf.get('glyph_translate_y'))
+
+
+def draw_glyphs_parallel(tasks, jobs):
+    """
+    Draw the outlines of the SVGs across a process pool. Returns a list of
+    (outline, seconds) in the same order as tasks.
+    """
+    chunksize = max(1, len(tasks) // (jobs * 4))
+    pool = multiprocessing.Pool(processes=jobs)
+    try:
+        return pool.map(_draw_glyph_worker, tasks, chunksize)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _draw_glyph_worker(task):
+    (filepath, svg_info, conf) = task
+    start = timeit.default_timer()
+    outline = draw_glyph(filepath, svg_info, conf)
+    return (outline, timeit.default_timer() - start)
+
+
+def draw_glyph(filepath, svg_info, conf):
+    """
+    Draw the SVG in font units. Returns the outline as a list of pen
+    operations [(operator, points), ...]
+    """
+    if svg_info.height is None:
+        raise MissingDimensionsException(
+            'No height/width or viewBox found in {}'.format(filepath))
+
+    # The glyph translation is in font units.
+    transform = Transform().translate(
+        conf.get('glyph_translate_x', 0),
+        conf.get('glyph_translate_y', 0)).transform(svg_transform(svg_info))
+    pen = RecordingPen()
+    draw_svg(ET.parse(filepath).getroot(), TransformPen(pen, transform))
+    return [(operator, [list(point) for point in points])
+            for operator, points in pen.value]
+
+
+def svg_transform(svg_info):
+    """
+    Transform from SVG user units to font units. The SVG height is scaled
+    to the em, with the top of the SVG at the ascent.
+    """
+    (min_x, min_y) = (0, 0)
+    (scale_x, scale_y) = (1, 1)
+    if svg_info.view_box is not None:
+        view_box = [float(n) for n in
+                    svg_info.view_box.replace(',', ' ').split()]
+        (min_x, min_y) = view_box[:2]
+        # The viewBox is stretched to the width/height of the SVG.
+        scale_x = svg_info.width / view_box[2]
+        scale_y = svg_info.height / view_box[3]
+
+    scale = FONT_EM / svg_info.height
+    # Translate to the top left of the viewBox, then scale and flip the y
+    # axis.
+    return Transform(scale * scale_x, 0, 0, -scale * scale_y,
+                     0, ASCENT).translate(-min_x, -min_y)
+
+
+def draw_svg(svg_root, pen):
+    """
+    Draw the filled shapes of a SVG document to a pen.
+    """
+    ids = dict((element.get('id'), element) for element in svg_root.iter()
+               if element.get('id') is not None)
+    _draw_element(svg_root, pen, Transform(), ids, 0)
+
+
+def _draw_element(element, pen, transform, ids, depth):
+    if not isinstance(element.tag, str):
+        return
+    tag = split_tag(element.tag)[1]
+    if tag in NON_RENDERING_ELEMENTS or element.get('display') == 'none':
+        return
+
+    if element.get('transform') is not None:
+        transform = transform.transform(
+            parse_transform(element.get('transform')))
+
+    if tag in SHAPE_ELEMENTS:
+        draw_shape(element, tag, TransformPen(pen, transform))
+    elif tag == 'use':
+        href = element.get('{%s}href' % XLINK_NS, element.get('href', ''))
+        target = ids.get(href[1:]) if href.startswith('#') else None
+        if target is None or depth >= MAX_USE_DEPTH:
+            logger.warning("Skipping <use> of %s", href)
+            return
+        transform = transform.translate(float(element.get('x', 0)),
+                                        float(element.get('y', 0)))
+        if split_tag(target.tag)[1] == 'symbol':
+            for child in target:
+                _draw_element(child, pen, transform, ids, depth + 1)
+        else:
+            _draw_element(target, pen, transform, ids, depth + 1)
+    else:
+        for child in element:
+            _draw_element(child, pen, transform, ids, depth)
+
+
+def draw_shape(element, tag, pen):
+    """
+    Draw a path or basic shape element to a pen.
+    """
+    if tag == 'path':
+        path = element.get('d', '')
+    else:
+        # The transform is already applied, svgLib only reads matrix().
+        attrib = dict((k, v) for k, v in element.items() if k != 'transform')
+        path_builder = PathBuilder()
+        path_builder.add_path_from_element(ET.Element(tag, attrib))
+        path = ''.join(path_builder.paths)
+    if path:
+        parse_path(path, pen)
+
+
+def draw_outline(outline, pen):
+    """
+    Replay an outline from draw_glyph() on a pen.
+    """
+    for operator, points in outline:
+        getattr(pen, operator)(*[tuple(point) for point in points])
+
+
+def remove_overlaps(font):
+    """
+    Merge overlapping contours like FontForge removeOverlap(), only when the
+    optional skia-pathops module is installed.
+    """
+    try:
+        from fontTools.ttLib.removeOverlaps import removeOverlaps
+    except ImportError:
+        logger.debug("skia-pathops not found, overlapping contours are kept")
+        return
+    removeOverlaps(font)
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+# SCFBuild is released under the GNU General Public License v3.
+# See LICENSE.txt in the project root directory.
+'''
+Emoji sequence data and compilation of the ligature GSUB table
+'''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import io
+import logging
+
+from .unicode import ZWJ_INT, VS16_INT, ZWJ_SEQUENCES
+
+logger = logging.getLogger(__name__)
+
+# Code points that may be left out of a filename, the full sequence is found
+# in the SequenceTrie.
+OPTIONAL_CODEPOINTS = (ZWJ_INT, VS16_INT)
+
+# Key of the full sequence in a trie node.
+_SEQUENCE = None
+
+
+class SequenceTrie(object):
+    """
+    Prefix trie of emoji sequences by code point.
+    """
+
+    def __init__(self):
+        self.root = {}
+        self.count = 0
+
+    def add(self, sequence):
+        node = self.root
+        for codepoint in sequence:
+            node = node.setdefault(codepoint, {})
+        if _SEQUENCE not in node:
+            self.count += 1
+        node[_SEQUENCE] = tuple(sequence)
+
+    def load(self, filepath):
+        """
+        Add the sequences of a Unicode emoji data file such as
+        emoji-zwj-sequences.txt or emoji-sequences.txt. Single code points
+        and ranges are skipped.
+        Line format: 1F468 200D 1F469 200D 1F466 ; RGI_Emoji_ZWJ_Sequence ; ...
+        """
+        count = self.count
+        f = io.open(filepath, 'rt', encoding='utf-8')
+        try:
+            for line in f:
+                field = line.split('#', 1)[0].split(';', 1)[0].strip()
+                if not field or '..' in field:
+                    continue
+                sequence = [int(u_id, 16) for u_id in field.split()]
+                if len(sequence) > 1:
+                    self.add(sequence)
+        finally:
+            f.close()
+        logger.debug("Loaded %d emoji sequences from %s",
+                     self.count - count, filepath)
+        return self
+
+    def find(self, u_ids):
+        """
+        Find the full sequence for code points that may be missing the ZWJ
+        and variation selector characters, None if there is no match.
+        """
+        return self._find(self.root, u_ids, 0)
+
+    def _find(self, node, u_ids, pos):
+        if pos == len(u_ids):
+            if _SEQUENCE in node:
+                return node[_SEQUENCE]
+        else:
+            child = node.get(u_ids[pos])
+            if child is not None:
+                sequence = self._find(child, u_ids, pos + 1)
+                if sequence is not None:
+                    return sequence
+
+        # Try the sequences with an optional character the input skipped.
+        for codepoint in OPTIONAL_CODEPOINTS:
+            child = node.get(codepoint)
+            if child is not None and \
+                    (pos == len(u_ids) or u_ids[pos] != codepoint):
+                sequence = self._find(child, u_ids, pos)
+                if sequence is not None:
+                    return sequence
+        return None
+
+
+def create_sequence_trie(conf):
+    """
+    Create the trie from the configured Unicode emoji data files, or the
+    built-in ZWJ sequences if there are none.
+    """
+    trie = SequenceTrie()
+    filepaths = conf.get('emoji_sequences') or []
+    if not isinstance(filepaths, (list, tuple)):
+        filepaths = [filepaths]
+    for filepath in filepaths:
+        trie.load(filepath)
+    if not filepaths:
+        for u_str in ZWJ_SEQUENCES.values():
+            trie.add([ord(u_chr) for u_chr in u_str])
+    return trie
+
+
+def ligature_sequences(filename, trie):
+    """
+    Code point sequences substituted by the ligature glyph of a filename
+    such as 1f441-1f5e8. A sequence with the emoji variation selector is
+    also added without it.
+    """
+    u_ids = [int(u_id, 16) for u_id in filename.split("-")]
+
+    # Replace sequences with correct ZWJ/VS16 versions as needed
+    u_ids = list(trie.find(u_ids) or u_ids)
+
+    sequences = [u_ids]
+    if VS16_INT in u_ids:
+        sequences.append([u_id for u_id in u_ids if u_id != VS16_INT])
+    return sequences
+
+
+def build_ligatures(ligature_names, cmap, trie):
+    """
+    Map the components of every ligature glyph in ligature_names to the
+    ligature. Ligatures with a code point that is not in the cmap are
+    skipped, they would make the whole lookup invalid.
+    """
+    ligatures = {}
+    for name in ligature_names:
+        for u_ids in ligature_sequences(name, trie):
+            missing = [u_id for u_id in u_ids if u_id not in cmap]
+            if missing:
+                logger.warning("Skipping ligature %s, no glyph for: %s", name,
+                               ' '.join("{:x}".format(u) for u in missing))
+                continue
+            components = tuple(cmap[u_id] for u_id in u_ids)
+            ligatures[components] = name
+            logger.debug("Adding substitution %s", components)
+    return ligatures
+
+
+def build_gsub(ligatures):
+    """
+    Create a GSUB table with one liga lookup from {components: name}. The
+    ligatures are grouped by their first glyph and the longest are matched
+    first.
+    """
+    # fontTools is only imported to build, check reads the sequences.
+    from fontTools.otlLib import builder as otl
+    from fontTools.ttLib import newTable
+    from fontTools.ttLib.tables import otTables
+
+    lookup = otl.buildLookup([otl.buildLigatureSubstSubtable(ligatures)])
+
+    gsub = otTables.GSUB()
+    gsub.Version = 0x00010000
+    gsub.LookupList = otTables.LookupList()
+    gsub.LookupList.Lookup = [lookup]
+
+    feature = otTables.Feature()
+    feature.FeatureParams = None
+    feature.LookupListIndex = [0]
+    feature_record = otTables.FeatureRecord()
+    feature_record.FeatureTag = 'liga'
+    feature_record.Feature = feature
+    gsub.FeatureList = otTables.FeatureList()
+    gsub.FeatureList.FeatureRecord = [feature_record]
+
+    lang_sys = otTables.LangSys()
+    lang_sys.LookupOrder = None
+    lang_sys.ReqFeatureIndex = 0xFFFF
+    lang_sys.FeatureIndex = [0]
+    script = otTables.Script()
+    script.DefaultLangSys = lang_sys
+    script.LangSysRecord = []
+    script_record = otTables.ScriptRecord()
+    script_record.ScriptTag = 'latn'
+    script_record.Script = script
+    gsub.ScriptList = otTables.ScriptList()
+    gsub.ScriptList.ScriptRecord = [script_record]
+
+    table = newTable('GSUB')
+    table.table = gsub
+    return table
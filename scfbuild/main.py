@@ -12,30 +12,226 @@ from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
 import argparse
-import yaml
+import logging
 
 from . import __version__
-from .builder import Builder
+from . import util
+
+# The build modules import fontTools and FontForge, they are only imported
+# by the commands that need them so --version and check start fast.
+COMMANDS = ('build', 'check', 'hash')
 
 
 def main():
     parser = argparse.ArgumentParser(description=__doc__.format(__version__))
 
+    parser.add_argument('command',
+                        nargs='?',
+                        choices=COMMANDS,
+                        default='build',
+                        help='build the font, check the configuration and '
+                        'SVG files without building, or print the hash of '
+                        'the build inputs. default: build')
+
     parser.add_argument('-o', '--output',
                         dest='output',
                         help='output font file')
+    parser.add_argument('-i', '--input',
+                        dest='input_file',
+                        metavar='FILE',
+                        help='existing font to rebuild the color glyphs and '
+                        'name table of, its outlines and ligatures are kept. '
+                        'The regular glyph SVGs are not needed')
+    parser.add_argument('-t', '--type',
+                        dest='output_types',
+                        metavar='TYPES',
+                        help='comma separated output types: ttf, woff, woff2. '
+                        'With several types the output file extension is '
+                        'replaced by each type. default: ttf')
     parser.add_argument('-g', '--glyph-svg-dir',
                         dest='glyph_svg_dir',
                         metavar='DIR',
-                        help='directory of regular no-color SVG glyphs to add to the font')
+                        help='directory of regular no-color SVG glyphs to add to the font, '
+                        'or a manifest file with one SVG path per line')
     parser.add_argument('-s', '--color-svg-dir',
                         dest='color_svg_dir',
                         metavar='DIR',
-                        help='directory of SVGinOT color SVG glyphs to add to the font.')
+                        help='directory of SVGinOT color SVG glyphs to add to the font, '
+                        'or a manifest file with one SVG path per line')
+    parser.add_argument('-r', '--recursive',
+                        dest='recursive',
+                        action='store_true',
+                        help='also search the sub directories of the SVG '
+                        'directories')
+    parser.add_argument('--include',
+                        dest='include',
+                        action='append',
+                        metavar='PATTERN',
+                        help='only use the SVG files matching a pattern, can '
+                        'be given more than once. Patterns with a / match the '
+                        'path in the SVG directory. default: *.svg')
+    parser.add_argument('--exclude',
+                        dest='exclude',
+                        action='append',
+                        metavar='PATTERN',
+                        help='skip the files and sub directories matching a '
+                        'pattern, can be given more than once')
     parser.add_argument('--transform',
                         dest='transform',
                         help='add a transform to the <svg> tag of each color SVG. '
                         'Example "translate(0 -1638) scale(2.048)"')
+    parser.add_argument('--emoji-sequences',
+                        dest='emoji_sequences',
+                        action='append',
+                        metavar='FILE',
+                        help='Unicode emoji-zwj-sequences.txt or '
+                        'emoji-sequences.txt used to find the full sequence '
+                        'of ligature filenames without ZWJ or variation '
+                        'selectors, can be given more than once. default: '
+                        'built-in ZWJ sequences')
+    parser.add_argument('--remove-unused',
+                        dest='remove_unused',
+                        action='store_true',
+                        help='remove the glyphs that can\'t be reached from '
+                        'a code point or a ligature of reachable glyphs, '
+                        'with their ligatures and color SVGs')
+    parser.add_argument('--subset',
+                        dest='subsets',
+                        action='append',
+                        metavar='NAME=RANGES',
+                        help='also save a subset font with the code points '
+                        'in a CSS unicode-range and a CSS file of all '
+                        'subsets, can be given more than once. Example: '
+                        '"faces=U+1F600-1F64F"')
+    parser.add_argument('--subset-frequency',
+                        dest='subset_frequency',
+                        metavar='FILE',
+                        help='split the font into subsets by the code point '
+                        'usage counts in FILE, one "CODEPOINT COUNT" per line')
+    parser.add_argument('--subset-count',
+                        dest='subset_count',
+                        type=int,
+                        metavar='N',
+                        help='number of subsets with --subset-frequency. '
+                        'default: 4')
+    parser.add_argument('--subset-css',
+                        dest='subset_css',
+                        metavar='FILE',
+                        help='CSS @font-face file of the subsets. default: '
+                        'the output file with a .css extension')
+    parser.add_argument('--minify',
+                        dest='minify',
+                        type=int,
+                        choices=[0, 1, 2],
+                        metavar='LEVEL',
+                        help='minify color SVGs. 1: remove editor data, '
+                        'metadata and whitespace, 2: also round numbers and '
+                        'collapse groups. default: 0')
+    parser.add_argument('--precision',
+                        dest='precision',
+                        type=int,
+                        metavar='N',
+                        help='decimal places kept by --minify 2 and '
+                        '--bake-transform. default: 2')
+    parser.add_argument('--bake-transform',
+                        dest='bake_transform',
+                        action='store_true',
+                        help='apply the size transform of the color SVGs to '
+                        'their coordinates, rounded to --precision, instead '
+                        'of adding a transform group. SVGs with content '
+                        'that can\'t be rewritten keep the group')
+    parser.add_argument('--pack-svg',
+                        dest='pack_svg',
+                        action='store_true',
+                        help='pack the color SVGs of consecutive glyphs into '
+                        'multi-glyph documents with shared definitions')
+    parser.add_argument('--pack-max-size',
+                        dest='pack_max_size',
+                        type=int,
+                        metavar='BYTES',
+                        help='maximum size of a packed SVG document. '
+                        'default: 65536')
+    parser.add_argument('--compress-svg',
+                        dest='compress_svg',
+                        action='store_true',
+                        help='gzip the documents in the SVG table')
+    parser.add_argument('--color-format',
+                        dest='color_format',
+                        choices=util.COLOR_FORMATS,
+                        help='table of the color glyphs. colrv0 converts SVGs '
+                        'with solid fills to COLR layers, colrv1 also '
+                        'converts gradients, other SVGs use the SVG table. '
+                        'default: ' + util.DEFAULT_COLOR_FORMAT)
+    parser.add_argument('--render-report',
+                        dest='render_report',
+                        type=int,
+                        nargs='?',
+                        const=10,
+                        metavar='N',
+                        help='print the estimated render cost of the N most '
+                        'expensive color SVGs. default N: 10')
+    parser.add_argument('--render-budget-action',
+                        dest='render_budget_action',
+                        choices=('warn', 'fail'),
+                        help='warn about or fail the build on color SVGs '
+                        'over the render_budget of the config file. '
+                        'default: warn')
+    parser.add_argument('--stream-svg',
+                        dest='stream_svg',
+                        action='store_true',
+                        help='write the SVG documents to a temporary file in '
+                        'the tmp dir as they are created, instead of '
+                        'keeping them in memory')
+    parser.add_argument('--reproducible',
+                        dest='reproducible',
+                        action='store_true',
+                        help='build byte-identical fonts from the same '
+                        'inputs. The date is taken from SOURCE_DATE_EPOCH, '
+                        'or left out of the name table without it. Also '
+                        'enabled by setting SOURCE_DATE_EPOCH')
+    parser.add_argument('-b', '--backend',
+                        dest='backend',
+                        choices=util.BACKENDS,
+                        help='library used to create the glyph outlines, '
+                        'fonttools does not need FontForge. default: '
+                        + util.DEFAULT_BACKEND)
+    parser.add_argument('-j', '--jobs',
+                        dest='jobs',
+                        type=int,
+                        metavar='N',
+                        help='number of processes used to clean up glyph '
+                        'outlines, 0 for one per CPU. default: 1')
+    parser.add_argument('--cache-dir',
+                        dest='cache_dir',
+                        metavar='DIR',
+                        help='directory of the incremental build cache. '
+                        'default: .scfbuild-cache')
+    parser.add_argument('--no-cache',
+                        dest='no_cache',
+                        action='store_true',
+                        help='do not read or write the build cache')
+    parser.add_argument('--tmp-dir',
+                        dest='tmp_dir',
+                        metavar='DIR',
+                        help='directory for the intermediate font file and '
+                        'SVG spool file, such as a tmpfs. default: system '
+                        'temp directory')
+    parser.add_argument('--metrics-json',
+                        dest='metrics_json',
+                        metavar='FILE',
+                        help='write the time, CPU and peak memory of each '
+                        'build stage and the slowest glyphs to a JSON file')
+    parser.add_argument('--profile',
+                        dest='profile_dir',
+                        metavar='DIR',
+                        help='save a cProfile report of each build stage to '
+                        'DIR/STAGE.prof')
+    parser.add_argument('--slowest',
+                        dest='metrics_slowest',
+                        type=int,
+                        metavar='N',
+                        help='number of slowest glyphs per stage in the '
+                        'metrics. default: 10')
     default_family = 'Untitled'
     parser.add_argument('--font-family',
                         dest='family',
@@ -55,6 +251,23 @@ def main():
                         dest='yaml_conf',
                         help='yaml build configuration, overridden by command '
                         'line options.')
+    parser.add_argument('--batch',
+                        dest='batch',
+                        metavar='MANIFEST',
+                        help='build every font listed in the yaml manifest, '
+                        'sharing the SVG processing between them. -j sets '
+                        'the number of fonts built in parallel')
+    parser.add_argument('-w', '--watch',
+                        dest='watch',
+                        action='store_true',
+                        help='rebuild the font whenever the SVG directories '
+                        'change, keeping processed glyphs in memory')
+    parser.add_argument('--watch-interval',
+                        dest='watch_interval',
+                        type=float,
+                        metavar='SECONDS',
+                        help='how often to check for changes in watch mode. '
+                        'default: 1')
     parser.add_argument('-v', '--verbose',
                         dest='verbose',
                         action='store_true',
@@ -66,9 +279,6 @@ def main():
                         help='print version information')
 
     # TODO: Options
-    # -i --input - Input file instead of making a new one.
-    # -t --type TTF/WOFF
-    # --remove-unused
     # --generate-conf
 
     args = parser.parse_args()
@@ -77,14 +287,33 @@ def main():
         print(__doc__.format(__version__))
         return 0
 
+    if args.batch and args.yaml_conf:
+        parser.error('--batch and --yaml-conf can not be used together, the '
+                     'manifest is the yaml build configuration.')
+        return 1
+
     # Load the YAML config if it is available
-    if args.yaml_conf:
-        f = open(args.yaml_conf)
-        conf = yaml.safe_load(f)
+    yaml_conf = args.batch or args.yaml_conf
+    if yaml_conf:
+        import yaml
+        f = open(yaml_conf)
+        conf = yaml.safe_load(f) or {}
         f.close()
     else:
         conf = {}
 
+    # Settings of each font in a batch manifest
+    fonts = conf.pop('fonts', None)
+    if args.batch and not fonts:
+        parser.error('No fonts found in the batch manifest.')
+        return 1
+
+    # color_svg_transform is an alias, a font of a batch can override the
+    # transform of the manifest with either key.
+    for c in [conf] + (fonts or []):
+        if 'color_svg_transform' in c:
+            c.setdefault('color_transform', c.pop('color_svg_transform'))
+
     if 'table_name' not in conf:
         conf['table_name'] = {}
     if 'verbose' not in conf:
@@ -93,12 +322,76 @@ def main():
     # Command line options override YAML
     if args.output:
         conf['output_file'] = args.output
+    if args.input_file:
+        conf['input_file'] = args.input_file
+    if args.output_types:
+        conf['output_types'] = args.output_types
     if args.glyph_svg_dir:
         conf['glyph_svg_dir'] = args.glyph_svg_dir
     if args.color_svg_dir:
         conf['color_svg_dir'] = args.color_svg_dir
+    if args.recursive:
+        conf['svg_recursive'] = True
+    if args.include:
+        conf['svg_include'] = args.include
+    if args.exclude:
+        conf['svg_exclude'] = args.exclude
     if args.transform:
-        conf['color_svg_transform'] = args.transform
+        conf['color_transform'] = args.transform
+    if args.emoji_sequences:
+        conf['emoji_sequences'] = args.emoji_sequences
+    if args.subsets:
+        conf['subsets'] = []
+        for subset in args.subsets:
+            (name, _, unicode_range) = subset.partition('=')
+            conf['subsets'].append({'name': name,
+                                    'unicode_range': unicode_range})
+    if args.remove_unused:
+        conf['remove_unused'] = True
+    if args.subset_frequency:
+        conf['subset_frequency'] = args.subset_frequency
+    if args.subset_count is not None:
+        conf['subset_count'] = args.subset_count
+    if args.subset_css:
+        conf['subset_css'] = args.subset_css
+    if args.minify is not None:
+        conf['svg_minify'] = args.minify
+    if args.precision is not None:
+        conf['svg_precision'] = args.precision
+    if args.bake_transform:
+        conf['svg_bake_transform'] = True
+    if args.pack_svg:
+        conf['svg_pack'] = True
+    if args.pack_max_size is not None:
+        conf['svg_pack_max_size'] = args.pack_max_size
+    if args.compress_svg:
+        conf['svg_compress'] = True
+    if args.color_format:
+        conf['color_format'] = args.color_format
+    if args.render_report is not None:
+        conf['render_report'] = args.render_report
+    if args.render_budget_action:
+        conf['render_budget_action'] = args.render_budget_action
+    if args.stream_svg:
+        conf['svg_stream'] = True
+    if args.reproducible:
+        conf['reproducible'] = True
+    if args.backend:
+        conf['backend'] = args.backend
+    if args.jobs is not None:
+        conf['jobs'] = args.jobs
+    if args.cache_dir:
+        conf['cache_dir'] = args.cache_dir
+    if args.no_cache:
+        conf['cache'] = False
+    if args.tmp_dir:
+        conf['tmp_dir'] = args.tmp_dir
+    if args.metrics_json:
+        conf['metrics_json'] = args.metrics_json
+    if args.profile_dir:
+        conf['profile_dir'] = args.profile_dir
+    if args.metrics_slowest is not None:
+        conf['metrics_slowest'] = args.metrics_slowest
     if args.verbose:
         conf['verbose'] = True
 
@@ -110,17 +403,42 @@ def main():
     if 'version' not in conf['table_name'] or args.font_version is not default_version:
         conf['table_name']['version'] = args.font_version
 
-    if 'output_file' not in conf:
-        parser.error('--output is required.')
-        return 1
-    if 'glyph_svg_dir' not in conf:
-        parser.error('--glyph-svg-dir is required. (currently)')
-        return 1
-    if 'color_svg_dir' not in conf:
-        parser.error('--color-svg-dir is required. (currently)')
-        return 1
+    confs = [conf]
+    if args.batch:
+        from .batch import merge_conf
+        confs = [merge_conf(conf, font_conf) for font_conf in fonts]
+
+    if args.command == 'check':
+        logging.basicConfig(level=logging.INFO)
+        if conf['verbose']:
+            logging.getLogger().setLevel(logging.DEBUG)
+        from .check import check
+        return max(check(c) for c in confs)
+
+    from .check import check_conf
+    for c in confs:
+        errors = check_conf(c, build=args.command == 'build')
+        if errors:
+            parser.error(errors[0])
+            return 1
+
+    if args.command == 'hash':
+        from .reproducible import print_input_hash
+        return max(print_input_hash(c) for c in confs)
+
+    if args.batch:
+        if args.watch:
+            parser.error('--watch can not be used with --batch.')
+            return 1
+        from .batch import Batch
+        return Batch(confs).run(util.get_jobs(conf))
 
+    from .builder import Builder
     builder = Builder(conf)
+    if args.watch:
+        from .watch import DEFAULT_INTERVAL, watch
+        conf['cache_memory'] = True
+        return watch(builder, args.watch_interval or DEFAULT_INTERVAL)
     return builder.run()
 
 if __name__ == '__main__':
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+# SCFBuild is released under the GNU General Public License v3.
+# See LICENSE.txt in the project root directory.
+'''
+Build instrumentation: wall time, CPU time and peak memory per stage
+'''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import contextlib
+import heapq
+import json
+import logging
+import os
+import sys
+import timeit
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SLOWEST = 10
+
+
+def peak_rss(who=None):
+    """
+    Peak resident set size of the process in bytes, None if unknown.
+    """
+    if resource is None:
+        return None
+    if who is None:
+        who = resource.RUSAGE_SELF
+    rss = resource.getrusage(who).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    if sys.platform != 'darwin':
+        rss *= 1024
+    return rss
+
+
+def stage_peak_rss():
+    """
+    Peak resident set size in bytes since reset_peak_rss(), None if the
+    peak can't be reset on this system.
+    """
+    try:
+        f = open('/proc/self/status')
+    except (IOError, OSError):
+        return None
+    try:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) * 1024
+    finally:
+        f.close()
+    return None
+
+
+def reset_peak_rss():
+    """
+    Reset the peak resident set size to the current size. Linux only,
+    returns False if it isn't supported.
+    """
+    try:
+        f = open('/proc/self/clear_refs', 'w')
+        try:
+            f.write('5')
+        finally:
+            f.close()
+    except (IOError, OSError):
+        return False
+    return True
+
+
+def cpu_time():
+    """
+    CPU time of the process and its finished child processes (the outline
+    workers) in seconds.
+    """
+    times = os.times()
+    return (times[0] + times[1], times[2] + times[3])
+
+
+class Metrics(object):
+    """
+    Records the stages of a build. With profile_dir set, each top level
+    stage is run under cProfile and saved as profile_dir/STAGE.prof.
+    """
+
+    def __init__(self, profile_dir=None, slowest=DEFAULT_SLOWEST):
+        self.profile_dir = profile_dir
+        self.slowest = slowest
+        self.stages = []
+        self.glyphs = {}
+        self._profiling = False
+        # Peak RSS of the open stages, the peak of a nested stage is also a
+        # peak of the stages around it.
+        self._peaks = []
+        # Resetting the stage peak also resets the peak of the process.
+        self._cumulative_peak = None
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        profiler = None
+        if self.profile_dir is not None and not self._profiling:
+            import cProfile
+            profiler = cProfile.Profile()
+            self._profiling = True
+
+        start_peak = peak_rss()
+        self._update_cumulative_peak(start_peak)
+        if self._peaks:
+            # Keep the peak of the outer stage before it is reset.
+            self._peaks[-1] = max(self._peaks[-1], stage_peak_rss() or 0)
+        can_reset = reset_peak_rss()
+        self._peaks.append(0)
+        (cpu, cpu_children) = cpu_time()
+        start = timeit.default_timer()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                self._profiling = False
+            wall = timeit.default_timer() - start
+            (end_cpu, end_cpu_children) = cpu_time()
+            cumulative_peak = peak_rss()
+            self._update_cumulative_peak(cumulative_peak)
+            if can_reset:
+                stage_peak = max(self._peaks.pop(), stage_peak_rss() or 0)
+            else:
+                self._peaks.pop()
+                # Without a reset the peak is only known when the stage
+                # raised the peak of the process.
+                stage_peak = None
+                if cumulative_peak is not None and \
+                        cumulative_peak > start_peak:
+                    stage_peak = cumulative_peak
+            if self._peaks and stage_peak is not None:
+                self._peaks[-1] = max(self._peaks[-1], stage_peak)
+            self._update_cumulative_peak(stage_peak)
+            record = {
+                'stage': name,
+                'wall': wall,
+                'cpu': end_cpu - cpu,
+                'cpu_children': end_cpu_children - cpu_children,
+                # The peak during this stage
+                'peak_rss': stage_peak,
+                # The peak so far, it includes all previous stages.
+                'cumulative_peak_rss': self._cumulative_peak,
+            }
+            if resource is not None:
+                record['peak_rss_children'] = peak_rss(
+                    resource.RUSAGE_CHILDREN)
+            self.stages.append(record)
+            logger.debug("Stage %s: %.3fs wall, %.3fs CPU", name, wall,
+                         record['cpu'] + record['cpu_children'])
+
+            if profiler is not None:
+                self._save_profile(profiler, name)
+
+    def _update_cumulative_peak(self, rss):
+        if rss is not None:
+            self._cumulative_peak = max(self._cumulative_peak or 0, rss)
+
+    def glyph(self, stage, name, seconds):
+        """
+        Record the time spent on one glyph, only the slowest are kept.
+        """
+        heap = self.glyphs.setdefault(stage, [])
+        if len(heap) < self.slowest:
+            heapq.heappush(heap, (seconds, name))
+        elif seconds > heap[0][0]:
+            heapq.heapreplace(heap, (seconds, name))
+
+    def report(self):
+        slowest = {}
+        for stage, heap in self.glyphs.items():
+            slowest[stage] = [{'glyph': name, 'seconds': seconds}
+                              for seconds, name in sorted(heap, reverse=True)]
+        return {
+            'stages': self.stages,
+            'total_wall': sum(record['wall'] for record in self.stages),
+            'slowest_glyphs': slowest,
+        }
+
+    def write_json(self, filepath):
+        f = open(filepath, 'w')
+        json.dump(self.report(), f, indent=2, sort_keys=True)
+        f.close()
+        logger.info("Wrote build metrics to %s", filepath)
+
+    def _save_profile(self, profiler, name):
+        if not os.path.isdir(self.profile_dir):
+            os.makedirs(self.profile_dir)
+        filepath = os.path.join(self.profile_dir, "{}.prof".format(name))
+        profiler.dump_stats(filepath)
+        logger.info("Wrote %s profile to %s", name, filepath)
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+# SCFBuild is released under the GNU General Public License v3.
+# See LICENSE.txt in the project root directory.
+'''
+Minification of color SVGs before they are added to the SVG table
+
+Levels:
+    0 - Disabled
+    1 - Remove non-rendering elements and attributes, editor data and
+        whitespace
+    2 - Also round numbers, collapse redundant groups and remove unused ids
+'''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import logging
+import re
+
+from . import svg_path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRECISION = 2
+
+SVG_NS = 'http://www.w3.org/2000/svg'
+XLINK_NS = 'http://www.w3.org/1999/xlink'
+
+# Namespaces of design tools and document metadata, nothing in them is
+# rendered.
+EDITOR_NAMESPACES = frozenset([
+    'http://www.inkscape.org/namespaces/inkscape',
+    'http://sodipodi.sourceforge.net/DTD/sodipodi-0.dtd',
+    'http://www.bohemiancoding.com/sketch/ns',
+    'http://ns.adobe.com/AdobeIllustrator/10.0/',
+    'http://ns.adobe.com/AdobeSVGViewerExtensions/3.0/',
+    'http://ns.adobe.com/Extensibility/1.0/',
+    'http://ns.adobe.com/Graphs/1.0/',
+    'http://ns.adobe.com/SaveForWeb/1.0/',
+    'http://ns.adobe.com/Variables/1.0/',
+    'http://ns.adobe.com/ImageReplacement/1.0/',
+    'http://www.w3.org/1999/02/22-rdf-syntax-ns#',
+    'http://creativecommons.org/ns#',
+    'http://purl.org/dc/elements/1.1/',
+    'http://www.serif.com/',
+    'http://www.figma.com/figma/ns',
+])
+
+NON_RENDERING_ELEMENTS = frozenset(['metadata', 'title', 'desc'])
+NON_RENDERING_ATTRIBS = frozenset(['data-name', 'version', 'baseProfile',
+                                   'enable-background'])
+
+# Whitespace is significant in these elements.
+TEXT_ELEMENTS = frozenset(['text', 'tspan', 'textPath', 'style'])
+
+# Attributes holding only numbers and separators. Transform lists are not
+# rounded, the precision of coordinates would turn small scales into 0.
+NUMBER_ATTRIBS = frozenset([
+    'x', 'y', 'x1', 'y1', 'x2', 'y2', 'cx', 'cy', 'r', 'rx', 'ry', 'fx',
+    'fy', 'fr', 'width', 'height', 'points', 'offset', 'stroke-width',
+])
+
+# Inherited presentation attributes that can move from a group to its only
+# child.
+INHERITED_ATTRIBS = frozenset([
+    'fill', 'fill-opacity', 'fill-rule', 'stroke', 'stroke-width',
+    'stroke-opacity', 'stroke-linecap', 'stroke-linejoin',
+    'stroke-miterlimit', 'stroke-dasharray', 'stroke-dashoffset', 'color',
+    'clip-rule', 'visibility',
+])
+
+REFERENCE_RE = re.compile(r'url\(\s*[\'"]?#([^\'")\s]+)')
+
+
+def split_tag(tag):
+    """
+    Split an ElementTree tag or attribute name into (namespace, name).
+    """
+    if tag[:1] == '{':
+        namespace, name = tag[1:].split('}', 1)
+        return (namespace, name)
+    return (None, tag)
+
+
+def minify(svg_root, level, precision=DEFAULT_PRECISION):
+    """
+    Minify the SVG ElementTree in place.
+    """
+    if level < 1:
+        return
+    strip_non_rendering(svg_root)
+    if level < 2:
+        return
+    round_numbers(svg_root, precision)
+    collapse_groups(svg_root)
+    remove_unused_ids(svg_root)
+
+
+def strip_non_rendering(element, keep_whitespace=False):
+    for child in list(element):
+        if not isinstance(child.tag, str) or _is_non_rendering(child.tag):
+            # Comments, processing instructions and editor elements. Keep
+            # the text that follows the removed element.
+            _remove_child(element, child)
+            continue
+        _, name = split_tag(child.tag)
+        strip_non_rendering(child,
+                            keep_whitespace or name in TEXT_ELEMENTS)
+
+    for attrib in list(element.attrib):
+        namespace, name = split_tag(attrib)
+        if namespace in EDITOR_NAMESPACES or (
+                namespace is None and name in NON_RENDERING_ATTRIBS):
+            del element.attrib[attrib]
+
+    if not keep_whitespace:
+        if element.text is not None and not element.text.strip():
+            element.text = None
+        for child in element:
+            if child.tail is not None and not child.tail.strip():
+                child.tail = None
+
+
+def round_numbers(element, precision):
+    for attrib, value in element.items():
+        _, name = split_tag(attrib)
+        try:
+            if name == 'd':
+                segments = svg_path.parse_path(value)
+                element.set(attrib, svg_path.format_path(segments, precision))
+            elif name in NUMBER_ATTRIBS and '%' not in value:
+                element.set(attrib, svg_path.round_numbers(value, precision))
+        except svg_path.PathSyntaxError:
+            logger.debug("Not rounding invalid path data: %s", value)
+    for child in element:
+        round_numbers(child, precision)
+
+
+def collapse_groups(element):
+    """
+    Replace groups without attributes by their children and move
+    presentation attributes of single child groups to the child.
+    """
+    for child in list(element):
+        collapse_groups(child)
+        if child.tag != '{%s}g' % SVG_NS or child.text:
+            continue
+
+        if len(child) == 1 and set(child.keys()) <= INHERITED_ATTRIBS:
+            grandchild = child[0]
+            for name, value in child.items():
+                if name not in grandchild.attrib:
+                    grandchild.set(name, value)
+            child.attrib.clear()
+
+        if not child.attrib:
+            index = list(element).index(child)
+            tail = child.tail
+            element.remove(child)
+            for offset, grandchild in enumerate(list(child)):
+                element.insert(index + offset, grandchild)
+            if tail:
+                _append_text(element, index + len(child) - 1, tail)
+
+
+def remove_unused_ids(svg_root):
+    """
+    Remove id attributes that are not referenced, the root id is kept.
+    """
+    referenced = set()
+    for element in svg_root.iter():
+        for attrib, value in element.items():
+            _, name = split_tag(attrib)
+            if name == 'href' and value.startswith('#'):
+                referenced.add(value[1:])
+            else:
+                referenced.update(REFERENCE_RE.findall(value))
+        if split_tag(element.tag)[1] == 'style' and element.text:
+            referenced.update(REFERENCE_RE.findall(element.text))
+            # Selectors can't be checked without a CSS parser, keep all ids.
+            return
+
+    for element in svg_root.iter():
+        if element is svg_root:
+            continue
+        if element.get('id') is not None and \
+                element.get('id') not in referenced:
+            del element.attrib['id']
+
+
+def _is_non_rendering(tag):
+    namespace, name = split_tag(tag)
+    return namespace in EDITOR_NAMESPACES or (
+        namespace == SVG_NS and name in NON_RENDERING_ELEMENTS)
+
+
+def _remove_child(parent, child):
+    index = list(parent).index(child)
+    if child.tail and child.tail.strip():
+        _append_text(parent, index - 1, child.tail)
+    parent.remove(child)
+
+
+def _append_text(parent, index, text):
+    """
+    Add text after the child at index, or to the parent text if index is -1.
+    """
+    if index < 0:
+        parent.text = (parent.text or '') + text
+    else:
+        sibling = parent[index]
+        sibling.tail = (sibling.tail or '') + text
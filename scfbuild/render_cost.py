@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+# SCFBuild is released under the GNU General Public License v3.
+# See LICENSE.txt in the project root directory.
+'''
+Estimate the cost of rendering each color SVG and check it against budgets
+
+The score is a weighted sum of the features that make SVG glyphs slow to
+render. It is only meant to rank the glyphs of a font against each other,
+the budgets catch the outliers:
+
+    render_budget:
+      score: 2000
+      path_commands: 5000
+      image_bytes: 65536
+    render_budget_action: fail
+'''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+import logging
+import re
+import xml.etree.ElementTree as ET
+
+from . import svg_path
+from .minify import XLINK_NS, split_tag
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REPORT_COUNT = 10
+BUDGET_ACTIONS = ('warn', 'fail')
+DEFAULT_BUDGET_ACTION = 'warn'
+
+# Score of each feature
+WEIGHTS = collections.OrderedDict([
+    ('elements', 1.0),
+    ('path_commands', 0.1),
+    ('filters', 50.0),
+    ('blurs', 200.0),
+    ('masks', 50.0),
+    ('clip_paths', 20.0),
+    ('gradient_stops', 2.0),
+    ('image_bytes', 1 / 256),
+])
+
+# Points of a polygon or polyline
+POINTS_RE = re.compile(svg_path.NUMBER)
+DATA_URI_RE = re.compile(r'^data:[^,]*?(;base64)?,', re.IGNORECASE)
+
+RenderCost = collections.namedtuple('RenderCost',
+                                    ['score'] + list(WEIGHTS))
+
+
+def count_path_commands(d):
+    try:
+        return len(svg_path.parse_path(d))
+    except svg_path.PathSyntaxError:
+        return len(svg_path.COMMAND_RE.findall(d))
+
+
+def image_bytes(href):
+    """
+    Size of the data embedded in a data: URI.
+    """
+    match = DATA_URI_RE.match(href)
+    if match is None:
+        return 0
+    size = len(href) - match.end()
+    if match.group(1):
+        size = size * 3 // 4
+    return size
+
+
+def uses_effect(element, name):
+    """
+    Does the attribute or style property reference an effect?
+    """
+    value = element.get(name)
+    if value is None:
+        for declaration in element.get('style', '').split(';'):
+            (key, _, style_value) = declaration.partition(':')
+            if key.strip() == name:
+                value = style_value
+    return value is not None and value.strip() != 'none'
+
+
+def analyze_svg(svg_root):
+    """
+    Count the features of a color SVG and score them.
+    """
+    counts = dict((name, 0) for name in WEIGHTS)
+    for element in svg_root.iter():
+        if not isinstance(element.tag, str):
+            continue
+        tag = split_tag(element.tag)[1]
+        counts['elements'] += 1
+        if tag == 'path':
+            counts['path_commands'] += count_path_commands(
+                element.get('d', ''))
+        elif tag in ('polygon', 'polyline'):
+            counts['path_commands'] += len(POINTS_RE.findall(
+                element.get('points', ''))) // 2
+        elif tag == 'stop':
+            counts['gradient_stops'] += 1
+        elif tag == 'feGaussianBlur':
+            counts['blurs'] += 1
+        elif tag == 'image':
+            counts['image_bytes'] += image_bytes(
+                element.get('{%s}href' % XLINK_NS, element.get('href', '')))
+
+        # Effects cost each time they are used.
+        if uses_effect(element, 'filter'):
+            counts['filters'] += 1
+        if uses_effect(element, 'mask'):
+            counts['masks'] += 1
+        if uses_effect(element, 'clip-path'):
+            counts['clip_paths'] += 1
+
+    score = sum(WEIGHTS[name] * count for name, count in counts.items())
+    return RenderCost(score=round(score, 1), **counts)
+
+
+def analyze_file(filepath):
+    return analyze_svg(ET.parse(filepath).getroot())
+
+
+def over_budget(cost, budget):
+    """
+    Get the (name, value, limit) of each budget the cost exceeds.
+    """
+    exceeded = []
+    for name in RenderCost._fields:
+        limit = budget.get(name)
+        if limit is not None and getattr(cost, name) > limit:
+            exceeded.append((name, getattr(cost, name), limit))
+    return exceeded
+
+
+def check_budget(costs, budget):
+    """
+    Get a message for each color SVG over the budget, costs is a list of
+    (filepath, RenderCost).
+    """
+    messages = []
+    for filepath, cost in costs:
+        for name, value, limit in over_budget(cost, budget):
+            messages.append("{}: Render cost {} is {:g}, the budget is "
+                            "{:g}".format(filepath, name, value, limit))
+    return messages
+
+
+def print_report(costs, count=DEFAULT_REPORT_COUNT):
+    """
+    Print the most expensive color SVGs.
+    """
+    ranked = sorted(costs, key=lambda item: (-item[1].score, item[0]))
+    print("Render cost of the {} most expensive of {} color SVGs:".format(
+        min(count, len(ranked)), len(ranked)))
+    print("{:>8} {:>8} {:>8} {:>7} {:>6} {:>9}  {}".format(
+        'score', 'elements', 'commands', 'effects', 'stops', 'images',
+        'file'))
+    for filepath, cost in ranked[:count]:
+        effects = cost.filters + cost.blurs + cost.masks + cost.clip_paths
+        print("{:>8.1f} {:>8} {:>8} {:>7} {:>6} {:>9}  {}".format(
+            cost.score, cost.elements, cost.path_commands, effects,
+            cost.gradient_stops, cost.image_bytes, filepath))
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+# SCFBuild is released under the GNU General Public License v3.
+# See LICENSE.txt in the project root directory.
+'''
+Reproducible builds and the content hash of the build inputs
+
+When SOURCE_DATE_EPOCH is set, the build date in the name table and the
+head timestamps come from it instead of the clock. The FontForge FFTM
+timestamp table is also left out, so builds from the same inputs are
+byte-identical. --reproducible does the same without SOURCE_DATE_EPOCH,
+with no date in the name table.
+
+The input hash covers the settings and the contents of every file read by
+the build. A CI cache can skip the fonts whose inputs didn't change.
+'''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import hashlib
+import json
+import os
+import time
+
+from fontTools import version as fonttools_version
+from fontTools.misc.timeTools import timestampSinceEpoch
+
+from . import __version__
+from . import util
+
+# Settings that only change the diagnostics, resources or speed of the
+# build, not the output. A render budget can stop the build, but the
+# fonts it builds are the same.
+NON_OUTPUT_KEYS = frozenset([
+    'verbose', 'jobs', 'cache', 'cache_dir', 'cache_max_size',
+    'cache_memory', 'tmp_dir', 'svg_stream', 'metrics_json', 'profile_dir',
+    'metrics_slowest', 'render_report', 'render_budget',
+    'render_budget_action',
+])
+# Settings with files read by the build, their contents are hashed
+# instead of the paths.
+SOURCE_KEYS = ('glyph_svg_dir', 'color_svg_dir')
+FILE_KEYS = ('input_file', 'subset_frequency')
+# Tables with the time the font was generated.
+TIMESTAMP_TABLES = ('FFTM',)
+
+
+def source_date_epoch():
+    """
+    Get the SOURCE_DATE_EPOCH Unix time, None if it is not set.
+    """
+    value = os.environ.get('SOURCE_DATE_EPOCH', '').strip()
+    if not value:
+        return None
+    return int(value)
+
+
+def is_reproducible(conf):
+    return conf.get('reproducible', False) or source_date_epoch() is not None
+
+
+def get_build_date(conf):
+    """
+    Get the build date added to the version and unique ID, None for a
+    reproducible build without SOURCE_DATE_EPOCH.
+    """
+    epoch = source_date_epoch()
+    if epoch is not None:
+        return time.strftime('%Y%m%d', time.gmtime(epoch))
+    if conf.get('reproducible', False):
+        return None
+    return time.strftime('%Y%m%d')
+
+
+def set_timestamps(font, conf):
+    """
+    Set the head timestamps of a reproducible build and keep them when the
+    font is saved.
+    """
+    if not is_reproducible(conf):
+        return
+    timestamp = timestampSinceEpoch(source_date_epoch() or 0)
+    font['head'].created = timestamp
+    font['head'].modified = timestamp
+    font.recalcTimestamp = False
+    for tag in TIMESTAMP_TABLES:
+        if tag in font:
+            del font[tag]
+
+
+def source_base(source):
+    """
+    Directory the SVG paths of a source are relative to.
+    """
+    if os.path.isfile(source):
+        return os.path.dirname(source)
+    return source
+
+
+def input_hash(conf, svg_index):
+    """
+    Hash the settings, the SVG files and the other files read by the
+    build. The SVG paths are relative to their source, so the hash is the
+    same in every checkout.
+    """
+    settings = dict((key, value) for key, value in conf.items()
+                    if key not in NON_OUTPUT_KEYS and
+                    key not in SOURCE_KEYS and key not in FILE_KEYS and
+                    key != 'emoji_sequences')
+    settings['backend'] = conf.get('backend', util.DEFAULT_BACKEND)
+    settings.pop('color_svg_transform', None)
+    settings['color_transform'] = util.get_color_transform(conf)
+    # Only the filename is in the font files, the subset CSS links to it.
+    if 'output_file' in settings:
+        settings['output_file'] = os.path.basename(settings['output_file'])
+
+    sources = []
+    for key in SOURCE_KEYS:
+        if key not in conf:
+            continue
+        base = source_base(conf[key])
+        sources.append([key, [
+            [os.path.relpath(filepath, base).replace(os.sep, '/'),
+             svg_index.digest(filepath)]
+            for filepath in svg_index.filepaths(conf[key])]])
+
+    files = [[key, util.file_digest(conf[key])] for key in FILE_KEYS
+             if conf.get(key)]
+    files.extend(['emoji_sequences', util.file_digest(filepath)]
+                 for filepath in conf.get('emoji_sequences') or [])
+
+    data = json.dumps([__version__, fonttools_version, source_date_epoch(),
+                       settings, sources, files], sort_keys=True,
+                      default=str)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def print_input_hash(conf):
+    """
+    Print the input hash and the output file like sha1sum.
+    """
+    from .cache import open_cache
+    from .svg_index import SvgIndex
+
+    svg_index = SvgIndex(conf, open_cache(conf))
+    print("{}  {}".format(input_hash(conf, svg_index),
+                          conf.get('output_file', '-')))
+    svg_index.save()
+    return 0
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+# SCFBuild is released under the GNU General Public License v3.
+# See LICENSE.txt in the project root directory.
+'''
+Discovery of the SVG source files in directories or manifest files
+
+A source is either a directory, searched with the include and exclude
+patterns, or a manifest file with one SVG path per line.
+'''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import fnmatch
+import io
+import logging
+import os
+
+from . import util
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INCLUDE = ('*.svg',)
+
+
+def get_patterns(value, default=()):
+    """
+    Patterns from the config, a single pattern or a list of them.
+    """
+    if not value:
+        return list(default)
+    if not isinstance(value, (list, tuple)):
+        return [value]
+    return list(value)
+
+
+def match_any(relpath, patterns):
+    """
+    Patterns with a / match the path relative to the source directory,
+    other patterns match the file or directory name.
+    """
+    name = relpath.rsplit('/', 1)[-1]
+    for pattern in patterns:
+        if fnmatch.fnmatchcase(relpath if '/' in pattern else name, pattern):
+            return True
+    return False
+
+
+def read_manifest(filepath):
+    """
+    Read the SVG paths of a manifest file. Relative paths are relative to
+    the manifest, lines starting with # are comments.
+    """
+    base_dir = os.path.dirname(filepath)
+    filepaths = []
+    f = io.open(filepath, 'rt', encoding='utf-8')
+    try:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                filepaths.append(os.path.join(base_dir, line))
+    finally:
+        f.close()
+    return filepaths
+
+
+def glyph_key(filepath):
+    """
+    Regular glyphs match by code point, ligatures by filename.
+    """
+    (codepoint, name) = util.codepoint_from_filepath(filepath)
+    if codepoint == -1:
+        return name.lower()
+    return codepoint
+
+
+def drop_duplicates(filepaths):
+    """
+    Warn about files for the same glyph, only the first is used. Files
+    with invalid names are kept to be reported where they are used.
+    """
+    found = {}
+    unique = []
+    for filepath in filepaths:
+        try:
+            key = glyph_key(filepath)
+        except ValueError:
+            unique.append(filepath)
+            continue
+        if key in found:
+            logger.warning("Duplicate glyph %s, using %s instead of %s",
+                           os.path.splitext(os.path.basename(filepath))[0],
+                           found[key], filepath)
+            continue
+        found[key] = filepath
+        unique.append(filepath)
+    return unique
+
+
+class SourceFinder(object):
+    """
+    Find the SVG files of sources. The listing of each directory is kept
+    with its mtime, a directory is only listed again when files were
+    added, removed or renamed in it.
+    """
+
+    def __init__(self, conf):
+        self.recursive = conf.get('svg_recursive', False)
+        self.include = get_patterns(conf.get('svg_include'), DEFAULT_INCLUDE)
+        self.exclude = get_patterns(conf.get('svg_exclude'))
+        # {dirpath: [mtime, filenames, dirnames]}
+        self.listings = {}
+        self.changed = False
+
+    def options(self):
+        """
+        The settings that change the files found.
+        """
+        return [self.recursive, self.include, self.exclude]
+
+    def find(self, source):
+        """
+        Get the sorted SVG filepaths of a directory or manifest file.
+        """
+        if os.path.isfile(source):
+            return read_manifest(source)
+        filepaths = []
+        self._walk(source, '', filepaths)
+        return filepaths
+
+    def _walk(self, dirpath, relpath, filepaths):
+        (filenames, dirnames) = self._list(dirpath)
+        for filename in filenames:
+            path = relpath + filename
+            if match_any(path, self.include) and \
+                    not match_any(path, self.exclude):
+                filepaths.append(os.path.join(dirpath, filename))
+        if not self.recursive:
+            return
+        for dirname in dirnames:
+            path = relpath + dirname
+            # Excluded directories aren't scanned at all.
+            if not match_any(path, self.exclude):
+                self._walk(os.path.join(dirpath, dirname), path + '/',
+                           filepaths)
+
+    def _list(self, dirpath):
+        mtime = os.stat(dirpath).st_mtime
+        listing = self.listings.get(dirpath)
+        if listing is not None and listing[0] == mtime:
+            return (listing[1], listing[2])
+
+        filenames = []
+        dirnames = []
+        for entry in os.scandir(dirpath):
+            if entry.is_dir():
+                dirnames.append(entry.name)
+            elif entry.is_file():
+                filenames.append(entry.name)
+        filenames.sort()
+        dirnames.sort()
+        self.listings[dirpath] = [mtime, filenames, dirnames]
+        self.changed = True
+        return (filenames, dirnames)
@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+# SCFBuild is released under the GNU General Public License v3.
+# See LICENSE.txt in the project root directory.
+'''
+Unicode range subsets of the font for web delivery, with a CSS manifest,
+and removal of the unused glyphs of the font
+'''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import io
+import logging
+import os
+import re
+
+from fontTools import subset as ft_subset
+from fontTools.ttLib import TTFont
+from fontTools.ttLib.tables.S_V_G_ import table_S_V_G_
+
+from . import util
+from .svg_table import SpooledSVGTable, coalesce_ranges
+from .unicode import ZWJ_INT, VS16_INT
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SUBSET_COUNT = 4
+# Code points in every subset, they are not assigned to one.
+COMMON_CODEPOINTS = frozenset([0x0, 0xD, 0x20, ZWJ_INT, VS16_INT])
+# Common code points added to the unicode-range of the subsets with
+# sequences using them. A space in the range would make browsers download
+# every subset.
+SEQUENCE_CODEPOINTS = frozenset([ZWJ_INT, VS16_INT])
+# Name of the subset with the code points not in any configured range.
+REST_SUBSET = 'rest'
+
+# CSS format() of each output type, in order of preference.
+CSS_FORMATS = (('woff2', 'woff2'), ('woff', 'woff'), ('ttf', 'truetype'))
+
+
+def format_unicode_range(codepoints):
+    """
+    Format code points as a CSS unicode-range value.
+    """
+    parts = []
+    for start, end in coalesce_ranges(sorted(codepoints)):
+        if start == end:
+            parts.append("U+{:X}".format(start))
+        else:
+            parts.append("U+{:X}-{:X}".format(start, end))
+    return ", ".join(parts)
+
+
+def read_frequency_file(filepath):
+    """
+    Read code points in order of use. Each line has a code point in hex
+    and an optional count, lines without a count keep the file order.
+    Format: 1f602 20451
+    """
+    entries = []
+    f = io.open(filepath, 'rt', encoding='utf-8')
+    try:
+        for line in f:
+            fields = line.split('#', 1)[0].split()
+            if not fields:
+                continue
+            codepoint = int(re.sub(r'^[Uu]\+', '', fields[0]), 16)
+            count = float(fields[1]) if len(fields) > 1 else 0
+            entries.append((-count, len(entries), codepoint))
+    finally:
+        f.close()
+    return [codepoint for _, _, codepoint in sorted(entries)]
+
+
+def assign_subsets(conf, codepoints):
+    """
+    Split the code points of the font into [(name, codepoints), ...] by
+    the configured Unicode ranges or usage frequency. Code points that
+    are not covered go to a last subset.
+    """
+    remaining = set(codepoints)
+    subsets = []
+    if conf.get('subsets'):
+        for subset_conf in conf['subsets']:
+            covered = util.parse_unicode_range(subset_conf['unicode_range'])
+            subsets.append((subset_conf['name'], remaining & covered))
+            remaining -= covered
+    else:
+        used = [codepoint for codepoint in
+                read_frequency_file(conf['subset_frequency'])
+                if codepoint in remaining]
+        count = conf.get('subset_count', DEFAULT_SUBSET_COUNT)
+        size = max(1, -(-len(used) // count))
+        for index in range(count):
+            chunk = set(used[index * size:(index + 1) * size])
+            subsets.append(("{}".format(index + 1), chunk))
+            remaining -= chunk
+
+    if remaining:
+        subsets.append((REST_SUBSET, remaining))
+    return [(name, chunk) for name, chunk in subsets if chunk]
+
+
+def ligature_components(font):
+    """
+    Map the first code point of every ligature to the code points of all
+    of its components.
+    """
+    components = {}
+    if 'GSUB' not in font:
+        return components
+
+    codepoints = dict((name, codepoint) for codepoint, name
+                      in font.getBestCmap().items())
+    for lookup in font['GSUB'].table.LookupList.Lookup:
+        for subtable in lookup.SubTable:
+            if getattr(subtable, 'ligatures', None) is None:
+                continue
+            for first, ligature_list in subtable.ligatures.items():
+                if first not in codepoints:
+                    continue
+                needed = components.setdefault(codepoints[first], set())
+                for ligature in ligature_list:
+                    needed.update(codepoints[name]
+                                  for name in ligature.Component
+                                  if name in codepoints)
+    return components
+
+
+def quiet_subsetter(conf):
+    if not conf.get('verbose'):
+        # The subsetter logs every table at the INFO level.
+        logging.getLogger('fontTools.subset').setLevel(logging.WARNING)
+
+
+def count_ligatures(font):
+    """
+    Count the ligature substitutions in the GSUB table.
+    """
+    count = 0
+    if 'GSUB' not in font:
+        return count
+    for lookup in font['GSUB'].table.LookupList.Lookup:
+        for subtable in lookup.SubTable:
+            for ligature_list in getattr(subtable, 'ligatures', {}).values():
+                count += len(ligature_list)
+    return count
+
+
+def create_options():
+    """
+    Subsetter options that keep all layout features and names.
+    """
+    options = ft_subset.Options()
+    options.layout_features = ['*']
+    options.name_IDs = ['*']
+    options.name_languages = ['*']
+    options.notdef_outline = True
+    options.recalc_timestamp = False
+    return options
+
+
+def remove_unused(data):
+    """
+    Remove the glyphs of the compiled font that can't be reached from the
+    cmap, directly or through ligatures whose components are all
+    reachable, and renumber the glyph IDs. Empty lookups are removed with
+    them. Returns the font and the names of the removed glyphs.
+    """
+    options = create_options()
+    options.glyph_names = True
+    options.passthrough_tables = True
+    options.prune_unicode_ranges = False
+
+    font = TTFont(io.BytesIO(data), recalcBBoxes=False)
+    glyph_order = font.getGlyphOrder()
+    subsetter = ft_subset.Subsetter(options)
+    subsetter.populate(unicodes=font.getBestCmap().keys())
+    subsetter.subset(font)
+    kept = set(font.getGlyphOrder())
+    return (font, [name for name in glyph_order if name not in kept])
+
+
+def subset_doc_list(doc_list, glyph_ids):
+    """
+    Keep the document records of the glyph IDs, split into the ranges of
+    the glyphs that remain. Records of one document keep sharing its data.
+    """
+    subset = []
+    for data, start, end in doc_list:
+        kept = [glyph_id for glyph_id in range(start, end + 1)
+                if glyph_id in glyph_ids]
+        for range_start, range_end in coalesce_ranges(kept):
+            subset.append([data, range_start, range_end])
+    return subset
+
+
+def subset_font(data, codepoints, svg_table):
+    """
+    Create a subset of the compiled font with the glyphs of the code points
+    and their ligatures. The SVG records are copied from svg_table.
+    """
+    options = create_options()
+    # The SVG documents refer to the glyph IDs, keeping them lets the
+    # records be copied as is. The subsetter would need lxml to rewrite
+    # the documents.
+    options.retain_gids = True
+
+    # The subsets have the timestamps of the font, so they are as
+    # reproducible as it is.
+    font = TTFont(io.BytesIO(data), recalcTimestamp=False)
+    if 'SVG ' in font:
+        del font['SVG ']
+    subsetter = ft_subset.Subsetter(options)
+    subsetter.populate(unicodes=codepoints)
+    subsetter.subset(font)
+
+    if svg_table is None:
+        return font
+    glyph_ids = set(font.getGlyphID(name)
+                    for name in subsetter.glyphs_retained)
+    doc_list = subset_doc_list(svg_table.docList, glyph_ids)
+    # A subset without color glyphs has no SVG table.
+    if doc_list:
+        if isinstance(svg_table, SpooledSVGTable):
+            # Share the spool file of the documents.
+            font['SVG '] = svg_table.copy(doc_list)
+        else:
+            font['SVG '] = table_S_V_G_()
+            font['SVG '].docList = doc_list
+            font['SVG '].colorPalettes = None
+    return font
+
+
+def subset_filepath(output_file, name):
+    (base, ext) = os.path.splitext(output_file)
+    return "{}.{}{}".format(base, name, ext)
+
+
+def save_subsets(data, conf, svg_table, write_outputs):
+    """
+    Write a subset font for each subset as every output type, and a CSS
+    file with a @font-face rule for each.
+    """
+    quiet_subsetter(conf)
+
+    font = TTFont(io.BytesIO(data), lazy=True)
+    codepoints = set(font.getBestCmap())
+    components = ligature_components(font)
+    font.close()
+
+    common = codepoints & COMMON_CODEPOINTS
+
+    output_types = util.get_output_types(conf)
+    rules = []
+    for name, assigned in assign_subsets(conf, codepoints - common):
+        needed = assigned | common
+        # Browsers only use the ligatures of a face for text it covers, the
+        # ZWJ and VS16 of its sequences are added to the range. Components
+        # assigned to other subsets are left to those.
+        covered = set(assigned)
+        for codepoint in assigned:
+            needed.update(components.get(codepoint, ()))
+            covered.update(SEQUENCE_CODEPOINTS.intersection(
+                components.get(codepoint, ())))
+
+        subset = subset_font(data, needed, svg_table)
+        buf = io.BytesIO()
+        subset.save(buf)
+        subset.close()
+
+        outputs = util.get_output_filepaths(
+            subset_filepath(conf['output_file'], name), output_types)
+        write_outputs(buf.getvalue(), outputs)
+        logger.info("Subset %s: %d code points, %d with common and "
+                    "ligature code points", name, len(assigned), len(needed))
+        rules.append((covered, outputs))
+
+    css_file = conf.get('subset_css') or \
+        os.path.splitext(conf['output_file'])[0] + '.css'
+    write_css(css_file, conf['table_name']['family'], rules)
+
+
+def write_css(filepath, family, rules):
+    """
+    Write a @font-face rule for each subset, browsers only download the
+    subsets with characters in their unicode-range.
+    """
+    css_dir = os.path.dirname(os.path.abspath(filepath))
+    lines = []
+    for codepoints, outputs in rules:
+        filepaths = dict(outputs)
+        sources = []
+        for output_type, css_format in CSS_FORMATS:
+            if output_type in filepaths:
+                url = os.path.relpath(os.path.abspath(filepaths[output_type]),
+                                      css_dir).replace(os.sep, '/')
+                sources.append("url('{}') format('{}')".format(url,
+                                                               css_format))
+        lines.append("@font-face {")
+        lines.append("  font-family: '{}';".format(family))
+        lines.append("  src: {};".format(",\n       ".join(sources)))
+        lines.append("  unicode-range: {};".format(
+            format_unicode_range(codepoints)))
+        lines.append("}")
+        lines.append("")
+
+    f = io.open(filepath, 'wt', encoding='utf-8')
+    f.write("\n".join(lines))
+    f.close()
+    logger.info("Saving subset CSS file: %s", filepath)
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+# SCFBuild is released under the GNU General Public License v3.
+# See LICENSE.txt in the project root directory.
+'''
+Index of SVG metadata, read once and shared by all build stages
+'''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+import logging
+import os
+
+from . import util
+from .cache import SOURCES, make_key
+from .sources import SourceFinder, drop_duplicates
+
+logger = logging.getLogger(__name__)
+
+# height/width are None when the SVG has neither height/width nor a viewBox,
+# codepoint is None when the filename is not a hex code point.
+SvgInfo = collections.namedtuple(
+    'SvgInfo', ['height', 'width', 'view_box', 'codepoint', 'name'])
+
+
+class MissingDimensionsException(Exception):
+    pass
+
+
+def read_svg_info(filepath):
+    """
+    Create the SvgInfo record for a SVG file from its root element.
+    """
+    try:
+        (codepoint, name) = util.codepoint_from_filepath(filepath)
+    except ValueError:
+        # Reported with the other filename errors by the xref.
+        (codepoint, name) = (None, os.path.splitext(
+            os.path.basename(filepath))[0])
+    attrib = util.read_root_attrib(filepath)
+
+    try:
+        (height, width) = util.dimensions_from_attrib(attrib)
+    except (KeyError, IndexError, ValueError):
+        (height, width) = (None, None)
+
+    return SvgInfo(height, width, attrib.get('viewBox'), codepoint, name)
+
+
+class SvgIndex(object):
+    """
+    With a cache, the directory listings, stats, records and digests are
+    saved between builds, so the next build only lists the directories and
+    reads the files that changed.
+    """
+
+    def __init__(self, conf=None, cache=None):
+        self.records = {}
+        self.digests = {}
+        self.stats = {}
+        self.dirs = {}
+        self.finder = SourceFinder(conf or {})
+        self.cache = cache
+        self.loaded = set()
+        self.changed = False
+
+    def scan(self, sources):
+        """
+        Index every SVG in the source directories or manifest files.
+        Scanning again only reads the files that changed since the last
+        scan.
+        """
+        for source in sources:
+            self.load(source)
+            filepaths = drop_duplicates(self.finder.find(source))
+            for filepath in filepaths:
+                self.update(filepath)
+            self.dirs[source] = filepaths
+            logger.debug("Indexed %d SVG files in %s", len(filepaths), source)
+        return self
+
+    def update(self, filepath):
+        """
+        Drop the cached data of a file if its size or mtime changed.
+        """
+        stat = util.file_stat(filepath)
+        if self.stats.get(filepath) != stat:
+            self.records.pop(filepath, None)
+            self.digests.pop(filepath, None)
+            self.stats[filepath] = stat
+        return self.get(filepath)
+
+    def filepaths(self, source):
+        """
+        Get the SVG filepaths of a source, scanning it if needed.
+        """
+        if source not in self.dirs:
+            self.scan([source])
+        return self.dirs[source]
+
+    def get(self, filepath):
+        try:
+            return self.records[filepath]
+        except KeyError:
+            record = read_svg_info(filepath)
+            self.records[filepath] = record
+            self.changed = True
+            return record
+
+    def digest(self, filepath):
+        """
+        Get the digest of the file contents, read once per change.
+        """
+        try:
+            return self.digests[filepath]
+        except KeyError:
+            digest = util.file_digest(filepath)
+            self.digests[filepath] = digest
+            self.changed = True
+            return digest
+
+    def _cache_key(self, source):
+        return make_key(SOURCES, source, os.path.abspath(source),
+                        self.finder.options())
+
+    def load(self, source):
+        """
+        Load the index of a source saved by an earlier build.
+        """
+        if self.cache is None or source in self.loaded:
+            return
+        self.loaded.add(source)
+        saved = self.cache.get_json(SOURCES, self._cache_key(source))
+        if saved is None:
+            return
+        for dirpath, listing in saved['dirs'].items():
+            self.finder.listings.setdefault(dirpath, listing)
+        for filepath, (stat, record, digest) in saved['files'].items():
+            if filepath in self.stats:
+                continue
+            self.stats[filepath] = tuple(stat)
+            if record is not None:
+                self.records[filepath] = SvgInfo(*record)
+            if digest is not None:
+                self.digests[filepath] = digest
+        logger.debug("Loaded the saved index of %d files in %s",
+                     len(saved['files']), source)
+
+    def save(self):
+        """
+        Save the index of every scanned source if anything changed.
+        """
+        if self.cache is None or not (self.changed or self.finder.changed):
+            return
+        for source, filepaths in self.dirs.items():
+            prefix = os.path.join(source, '')
+            dirs = dict((dirpath, listing) for dirpath, listing
+                        in self.finder.listings.items()
+                        if dirpath == source or dirpath.startswith(prefix))
+            files = dict((filepath, [self.stats[filepath],
+                                     self.records.get(filepath),
+                                     self.digests.get(filepath)])
+                         for filepath in filepaths)
+            self.cache.set_json(SOURCES, self._cache_key(source),
+                                {'dirs': dirs, 'files': files})
+        self.changed = False
+        self.finder.changed = False
+
+    def get_dimensions(self, filepath):
+        """
+        Return the height and width of the SVG.
+        """
+        record = self.get(filepath)
+        if record.height is None:
+            raise MissingDimensionsException(
+                'No height/width or viewBox found in {}'.format(filepath))
+        logger.debug("Found SVG width/height (%.2f/%.2f)",
+                     record.width, record.height)
+        return (record.height, record.width)
+
+    def get_glyph_width(self, filepath):
+        """
+        Given the filepath of a SVG, find the glyph width.
+        """
+        return util.glyph_width(*self.get_dimensions(filepath))
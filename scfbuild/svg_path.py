@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+# SCFBuild is released under the GNU General Public License v3.
+# See LICENSE.txt in the project root directory.
+'''
+Parsing and formatting of SVG path data and number lists
+'''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import math
+import re
+
+NUMBER = r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?'
+NUMBER_RE = re.compile(NUMBER)
+COMMAND_RE = re.compile(r'[MmZzLlHhVvCcSsQqTtAa]')
+SEPARATOR_RE = re.compile(r'[\s,]*')
+FLAG_RE = re.compile(r'[01]')
+TRANSFORM_RE = re.compile(r'\s*(matrix|translate|scale|rotate|skewX|skewY)'
+                          r'\s*\(([^)]*)\)\s*,?')
+
+# Number of arguments for each path command.
+ARG_COUNTS = {
+    'M': 2, 'L': 2, 'H': 1, 'V': 1, 'C': 6, 'S': 4, 'Q': 4, 'T': 2, 'A': 7,
+    'Z': 0,
+}
+# Axis of each path command argument, 0 for x, 1 for y and None for the
+# arc radii, rotation and flags.
+PATH_AXES = {
+    'M': (0, 1), 'L': (0, 1), 'H': (0,), 'V': (1,), 'C': (0, 1) * 3,
+    'S': (0, 1) * 2, 'Q': (0, 1) * 2, 'T': (0, 1),
+    'A': (None,) * 5 + (0, 1),
+}
+
+
+class PathSyntaxError(ValueError):
+    pass
+
+
+class TransformSyntaxError(ValueError):
+    pass
+
+
+def parse_path(d):
+    """
+    Parse path data into a list of (command, [numbers]) with one entry per
+    command segment. Implicit repeated commands are split into separate
+    entries, except a moveto continues as a lineto as the spec describes.
+    """
+    segments = []
+    pos = SEPARATOR_RE.match(d, 0).end()
+    command = None
+    while pos < len(d):
+        match = COMMAND_RE.match(d, pos)
+        if match:
+            command = match.group()
+            pos = SEPARATOR_RE.match(d, match.end()).end()
+            if command in 'Zz':
+                segments.append((command, []))
+                continue
+        elif command is None or command in 'Zz':
+            raise PathSyntaxError("Expected a path command at {}: {}".format(
+                pos, d))
+        elif command == 'M':
+            command = 'L'
+        elif command == 'm':
+            command = 'l'
+
+        args = []
+        is_arc = command in 'Aa'
+        for index in range(ARG_COUNTS[command.upper()]):
+            # Arc flags may be written without a separator, e.g. "a1 1 0 01 5 5"
+            if is_arc and index in (3, 4):
+                match = FLAG_RE.match(d, pos)
+            else:
+                match = NUMBER_RE.match(d, pos)
+            if not match:
+                raise PathSyntaxError("Expected a number at {}: {}".format(
+                    pos, d))
+            args.append(float(match.group()))
+            pos = SEPARATOR_RE.match(d, match.end()).end()
+        segments.append((command, args))
+
+    return segments
+
+
+def format_number(value, precision=None):
+    """
+    Format a number as short as possible, optionally rounded to precision
+    decimal places.
+    """
+    if precision is not None:
+        value = round(value, precision)
+    if value == int(value):
+        text = str(int(value))
+    else:
+        text = repr(value) if precision is None else '{:.{}f}'.format(
+            value, precision)
+        if 'e' not in text and '.' in text:
+            text = text.rstrip('0').rstrip('.')
+    if text.startswith('0.'):
+        text = text[1:]
+    elif text.startswith('-0.'):
+        text = '-' + text[2:]
+    elif text == '-0':
+        text = '0'
+    return text
+
+
+def join_numbers(numbers):
+    """
+    Join formatted numbers with the fewest separators needed.
+    """
+    text = ''
+    for number in numbers:
+        if text and not (
+                number.startswith('-') or
+                (number.startswith('.') and _has_fraction(text))):
+            text += ' '
+        text += number
+    return text
+
+
+def format_path(segments, precision=None):
+    """
+    Format (command, [numbers]) segments from parse_path as path data.
+    Relative coordinates are rounded against the rounded position of the
+    previous segments, so the rounding error doesn't add up along the path.
+    """
+    parts = []
+    previous = None
+    if precision is not None:
+        segments = _round_segments(segments, precision)
+    for command, args in segments:
+        numbers = [format_number(arg, precision) for arg in args]
+        if command in 'Aa':
+            # Rounding can turn an arc into a zero length arc, which is not
+            # drawn at all, e.g. the full circle "a1 1 0 1 0 .0001 0"
+            numbers[5:] = [format_number(arg) for arg in args[5:]]
+        # A repeated command can be left out, except a moveto which would
+        # turn into a lineto.
+        if command == previous and command not in 'MmZz':
+            parts.append(join_numbers([parts.pop()] + numbers))
+        else:
+            parts.append(command + join_numbers(numbers))
+        previous = command
+    return ''.join(parts)
+
+
+def _round_segments(segments, precision):
+    """
+    Round the coordinates of the segments to precision decimal places as
+    absolute positions. Relative coordinates become the difference of the
+    rounded positions.
+    """
+    rounded = []
+    # Current point and subpath start, exact and as written
+    exact = [0.0, 0.0]
+    written = [0.0, 0.0]
+    start = ([0.0, 0.0], [0.0, 0.0])
+    for command, args in segments:
+        upper = command.upper()
+        if upper == 'Z':
+            exact = list(start[0])
+            written = list(start[1])
+            rounded.append((command, args))
+            continue
+        relative = command != upper
+        args = list(args)
+        end = (list(exact), list(written))
+        for index, axis in enumerate(PATH_AXES[upper]):
+            if axis is None:
+                continue
+            target = exact[axis] + args[index] if relative else args[index]
+            if upper == 'A':
+                # The arc end point is kept as is, see format_path().
+                position = written[axis] + args[index] if relative \
+                    else args[index]
+            else:
+                position = round(target, precision)
+                args[index] = position - written[axis] if relative \
+                    else position
+            # The last coordinate of each axis is the end point.
+            end[0][axis] = target
+            end[1][axis] = position
+        (exact, written) = end
+        if upper == 'M':
+            start = (list(exact), list(written))
+        rounded.append((command, args))
+    return rounded
+
+
+def round_numbers(text, precision):
+    """
+    Round all numbers in an attribute value like a transform or points
+    list, keeping everything else as is.
+    """
+    def replace(match):
+        number = format_number(float(match.group()), precision)
+        start = match.start()
+        # Keep numbers that were written without a separator apart.
+        if start > 0 and text[start - 1] in '0123456789.' and \
+                not number.startswith('-'):
+            return ' ' + number
+        return number
+    return NUMBER_RE.sub(replace, text)
+
+
+def _has_fraction(text):
+    """
+    Does the last number in text contain a decimal point?
+    """
+    last = re.split(r'[^0-9.eE]', text)[-1]
+    return '.' in last or 'e' in last or 'E' in last
+
+
+def parse_transform(text):
+    """
+    Parse a transform attribute into a fontTools Transform.
+    """
+    # Imported here so check can count path commands without fontTools.
+    from fontTools.misc.transform import Identity
+
+    transform = Identity
+    pos = 0
+    text = text.strip()
+    while pos < len(text):
+        match = TRANSFORM_RE.match(text, pos)
+        if match is None:
+            raise TransformSyntaxError(
+                "Invalid transform at {}: {}".format(pos, text))
+        name = match.group(1)
+        args = [float(number) for number in NUMBER_RE.findall(match.group(2))]
+        transform = transform.transform(_transform_function(name, args))
+        pos = match.end()
+    return transform
+
+
+def _transform_function(name, args):
+    from fontTools.misc.transform import Identity, Transform
+
+    try:
+        if name == 'matrix':
+            return Transform(*args)
+        if name == 'translate':
+            # ty is optional, defaults to 0
+            return Identity.translate(args[0], (args[1:] or [0])[0])
+        if name == 'scale':
+            # sy is optional, defaults to sx
+            return Identity.scale(args[0], (args[1:] or args)[0])
+        if name == 'rotate':
+            rotate = Identity.rotate(math.radians(args[0]))
+            if len(args) == 3:
+                # Rotate around the point (cx, cy)
+                return Identity.translate(args[1], args[2]).transform(
+                    rotate).translate(-args[1], -args[2])
+            return rotate
+        if name == 'skewX':
+            return Identity.skew(math.radians(args[0]), 0)
+        return Identity.skew(0, math.radians(args[0]))
+    except (IndexError, TypeError):
+        raise TransformSyntaxError(
+            "Invalid arguments for {}: {}".format(name, args))
@@ -0,0 +1,384 @@
+# -*- coding: utf-8 -*-
+# SCFBuild is released under the GNU General Public License v3.
+# See LICENSE.txt in the project root directory.
+'''
+Assembly of the SVGinOT SVG table document list
+'''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+import copy
+import gzip
+import io
+import logging
+import re
+import struct
+import tempfile
+import xml.etree.ElementTree as ET
+
+from fontTools.ttLib.tables.S_V_G_ import table_S_V_G_
+
+from .minify import SVG_NS, XLINK_NS, split_tag
+
+logger = logging.getLogger(__name__)
+
+# Bytes
+DEFAULT_PACK_MAX_SIZE = 65536
+
+# Definitions that are shared between the glyphs of a packed document. Their
+# coordinates are in the user space of the referencing element, so they can
+# move out of the glyph's transformed group.
+SHARED_DEFS = frozenset(['linearGradient', 'radialGradient', 'clipPath'])
+
+# Attributes of the SVG root that don't apply to the glyph content.
+ROOT_ONLY_ATTRIBS = frozenset(['id', 'x', 'y', 'version', 'baseProfile',
+                               'preserveAspectRatio', 'viewBox', 'width',
+                               'height'])
+
+# SVG table header: version, offset to the document index, reserved
+SVG_HEADER_FORMAT = '>HLL'
+# Document index entry: start and end glyph ID, offset and length
+SVG_ENTRY_FORMAT = '>HHLL'
+
+GLYPH_ID_RE = re.compile(r'glyph\d+$')
+URL_RE = re.compile(r'(url\(\s*[\'"]?#)([^\'")\s]+)')
+
+
+def coalesce_ranges(glyph_ids):
+    """
+    Split sorted glyph IDs into (start, end) ranges of consecutive IDs.
+    """
+    ranges = []
+    for glyph_id in glyph_ids:
+        if ranges and ranges[-1][1] + 1 == glyph_id:
+            ranges[-1][1] = glyph_id
+        else:
+            ranges.append([glyph_id, glyph_id])
+    return [(start, end) for start, end in ranges]
+
+
+def compress_document(data):
+    """
+    Gzip a SVG document, allowed by the OpenType SVG table spec.
+    """
+    buf = io.BytesIO()
+    # mtime=0 keeps the output the same for the same input.
+    f = gzip.GzipFile(fileobj=buf, mode='wb', mtime=0)
+    f.write(data)
+    f.close()
+    return buf.getvalue()
+
+
+def create_doc_list(documents, compress=False):
+    """
+    Create the SVG table docList from (data, glyph_ids) documents. Each
+    document gets one [data, start_glyph_id, end_glyph_id] record per range
+    of consecutive glyph IDs, sorted by glyph ID as required by the spec.
+    Records of the same document share one data object.
+    """
+    doc_list = []
+    size = 0
+    compressed_size = 0
+    for data, glyph_ids in documents:
+        size += len(data)
+        if compress:
+            data = compress_document(data)
+        compressed_size += len(data)
+
+        for start, end in coalesce_ranges(sorted(glyph_ids)):
+            doc_list.append([data, start, end])
+
+    doc_list.sort(key=lambda record: record[1])
+
+    if compress:
+        logger.info("Compressed SVG documents from %d to %d bytes",
+                    size, compressed_size)
+    return doc_list
+
+
+# Location of a document in the spool file of a SpooledSVGTable
+SpooledDocument = collections.namedtuple('SpooledDocument',
+                                         ['offset', 'length'])
+
+
+class SpooledSVGTable(table_S_V_G_):
+    """
+    SVG table with the documents in a temporary file instead of memory.
+    Documents are written to the file as they are added and only read back
+    to compile the table, so building it takes about the memory of one
+    document. The docList records are [SpooledDocument, start, end].
+    """
+
+    def __init__(self, tmp_dir=None, compress=False, spool=None):
+        table_S_V_G_.__init__(self, 'SVG ')
+        self.docList = []
+        self.colorPalettes = None
+        self.compress = compress
+        if spool is None:
+            spool = tempfile.TemporaryFile(prefix='scfbuild-svg-',
+                                           dir=tmp_dir)
+        self.spool = spool
+        self.size = 0
+        self.compressed_size = 0
+
+    def add_document(self, data, glyph_ids):
+        """
+        Write a document for the glyph IDs to the spool file.
+        """
+        self.size += len(data)
+        if self.compress:
+            data = compress_document(data)
+        self.compressed_size += len(data)
+
+        self.spool.seek(0, io.SEEK_END)
+        document = SpooledDocument(self.spool.tell(), len(data))
+        self.spool.write(data)
+        for start, end in coalesce_ranges(sorted(glyph_ids)):
+            self.docList.append([document, start, end])
+
+    def read_document(self, document):
+        self.spool.seek(document.offset)
+        return self.spool.read(document.length)
+
+    def copy(self, doc_list):
+        """
+        Create a table with other records of the same spooled documents.
+        """
+        table = SpooledSVGTable(compress=self.compress, spool=self.spool)
+        table.docList = doc_list
+        return table
+
+    def compile(self, ttFont):
+        # Same layout as table_S_V_G_.compile(), each document is copied
+        # from the spool once and records of the same document share it.
+        records = sorted(self.docList, key=lambda record: record[1])
+        header_size = struct.calcsize(SVG_HEADER_FORMAT)
+        offset = 2 + struct.calcsize(SVG_ENTRY_FORMAT) * len(records)
+        entries = [struct.pack('>H', len(records))]
+        documents = []
+        offsets = {}
+        for document, start, end in records:
+            if document not in offsets:
+                offsets[document] = offset
+                offset += document.length
+                documents.append(document)
+            entries.append(struct.pack(SVG_ENTRY_FORMAT, start, end,
+                                       offsets[document], document.length))
+
+        buf = io.BytesIO()
+        buf.write(struct.pack(SVG_HEADER_FORMAT, 0, header_size, 0))
+        for entry in entries:
+            buf.write(entry)
+        for document in documents:
+            buf.write(self.read_document(document))
+        return buf.getvalue()
+
+    def close(self):
+        self.spool.close()
+
+
+def rewrite_references(element, mapping):
+    """
+    Rewrite url(#id) and href="#id" references to renamed ids.
+    """
+    if not mapping:
+        return
+
+    def replace(match):
+        return match.group(1) + mapping.get(match.group(2), match.group(2))
+
+    for child in element.iter():
+        for attrib, value in child.items():
+            if split_tag(attrib)[1] == 'href':
+                if value[:1] == '#' and value[1:] in mapping:
+                    child.set(attrib, '#' + mapping[value[1:]])
+            elif 'url(' in value:
+                child.set(attrib, URL_RE.sub(replace, value))
+
+
+def can_pack(svg_root):
+    """
+    Style sheets apply to the whole document, so SVGs with a <style>
+    element must stay in their own document.
+    """
+    for element in svg_root.iter():
+        if isinstance(element.tag, str) and \
+                split_tag(element.tag)[1] == 'style':
+            return False
+    return True
+
+
+class DocumentPacker(object):
+    """
+    Pack the color SVGs of consecutive glyph IDs into multi-glyph documents.
+    Each glyph is a <g id="glyphN"> element, identical gradients and clip
+    paths are stored once per document in a shared <defs>.
+    """
+
+    def __init__(self, max_size=DEFAULT_PACK_MAX_SIZE):
+        self.max_size = max_size
+        self.documents = []
+        self.document_count = 0
+        self.glyph_count = 0
+        self._start_document()
+
+    def can_reference(self, glyph_id, source_id):
+        """
+        Can the glyph be added as a reference to a glyph in the document?
+        """
+        return source_id in self.glyph_ids and \
+            self.glyph_ids[-1] + 1 == glyph_id
+
+    def add_reference(self, glyph_id, source_id):
+        """
+        Add a glyph drawn the same as a glyph already in the document.
+        """
+        self._check_range(glyph_id)
+        ET.SubElement(self.root, '{%s}use' % SVG_NS, {
+            'id': "glyph{}".format(glyph_id),
+            '{%s}href' % XLINK_NS: "#glyph{}".format(source_id),
+        })
+        self.glyph_ids.append(glyph_id)
+
+    def add_glyph(self, glyph_id, svg_root):
+        """
+        Add the processed SVG root of a glyph.
+        """
+        size = len(ET.tostring(svg_root, encoding='UTF-8'))
+        if not can_pack(svg_root):
+            self._finish_document()
+            self._add_glyph(glyph_id, svg_root)
+            self._finish_document()
+            return
+
+        self._check_range(glyph_id)
+        if self.glyph_ids and self.size + size > self.max_size:
+            self._finish_document()
+        self._add_glyph(glyph_id, svg_root)
+        self.size += size
+
+    def pop_documents(self):
+        """
+        Return the documents finished so far and forget them.
+        """
+        documents = self.documents
+        self.documents = []
+        return documents
+
+    def finish(self):
+        """
+        Return the remaining documents as a list of (data, glyph_ids).
+        """
+        self._finish_document()
+        logger.info("Packed %d glyphs into %d SVG documents",
+                    self.glyph_count, self.document_count)
+        return self.pop_documents()
+
+    def _check_range(self, glyph_id):
+        # A document record covers a range of glyph IDs, the document must
+        # have an element for every glyph in the range.
+        if self.glyph_ids and self.glyph_ids[-1] + 1 != glyph_id:
+            self._finish_document()
+
+    def _start_document(self):
+        self.root = ET.Element('{%s}svg' % SVG_NS)
+        self.defs = ET.SubElement(self.root, '{%s}defs' % SVG_NS)
+        self.glyph_ids = []
+        self.ids = set()
+        self.defs_by_key = {}
+        self.size = 0
+
+    def _finish_document(self):
+        if not self.glyph_ids:
+            return
+        if not len(self.defs):
+            self.root.remove(self.defs)
+        data = ET.tostring(self.root, encoding='UTF-8')
+        self.documents.append((data, self.glyph_ids))
+        self.document_count += 1
+        self.glyph_count += len(self.glyph_ids)
+        self._start_document()
+
+    def _add_glyph(self, glyph_id, svg_root):
+        # Use the sizing group as the glyph element, the presentation
+        # attributes of the root still apply to the content.
+        if len(svg_root) == 1 and split_tag(svg_root[0].tag)[1] == 'g':
+            glyph = svg_root[0]
+        else:
+            glyph = ET.Element('{%s}g' % SVG_NS)
+            glyph.extend(list(svg_root))
+        for attrib, value in svg_root.items():
+            namespace, name = split_tag(attrib)
+            if namespace is None and name not in ROOT_ONLY_ATTRIBS and \
+                    attrib not in glyph.attrib:
+                glyph.set(attrib, value)
+
+        self._rename_conflicting_ids(glyph)
+        self._share_defs(glyph)
+
+        for element in glyph.iter():
+            if element.get('id') is not None:
+                self.ids.add(element.get('id'))
+        glyph.set('id', "glyph{}".format(glyph_id))
+        self.root.append(glyph)
+        self.glyph_ids.append(glyph_id)
+
+    def _rename_conflicting_ids(self, glyph):
+        mapping = {}
+        for element in glyph.iter():
+            old_id = element.get('id')
+            if old_id is None:
+                continue
+            if old_id not in self.ids and not GLYPH_ID_RE.match(old_id):
+                continue
+            count = 1
+            new_id = "{}-{}".format(old_id, count)
+            while new_id in self.ids or new_id in mapping.values():
+                count += 1
+                new_id = "{}-{}".format(old_id, count)
+            mapping[old_id] = new_id
+            element.set('id', new_id)
+        rewrite_references(glyph, mapping)
+
+    def _share_defs(self, glyph):
+        """
+        Move gradients and clip paths to the shared <defs>, replacing
+        identical definitions with the existing one.
+        """
+        mapping = {}
+        for parent in list(glyph.iter()):
+            if not isinstance(parent.tag, str) or \
+                    split_tag(parent.tag)[1] != 'defs':
+                continue
+            for element in list(parent):
+                if not isinstance(element.tag, str) or \
+                        split_tag(element.tag)[1] not in SHARED_DEFS or \
+                        element.get('id') is None:
+                    continue
+                rewrite_references(element, mapping)
+                key = self._defs_key(element)
+                parent.remove(element)
+                if key in self.defs_by_key:
+                    mapping[element.get('id')] = self.defs_by_key[key]
+                else:
+                    self.defs_by_key[key] = element.get('id')
+                    self.ids.add(element.get('id'))
+                    element.tail = None
+                    self.defs.append(element)
+        rewrite_references(glyph, mapping)
+
+        # Remove the defs that are now empty
+        for parent in list(glyph.iter()):
+            for element in list(parent):
+                if isinstance(element.tag, str) and \
+                        split_tag(element.tag)[1] == 'defs' and \
+                        not len(element):
+                    parent.remove(element)
+
+    def _defs_key(self, element):
+        element = copy.deepcopy(element)
+        del element.attrib['id']
+        element.tail = None
+        return ET.tostring(element, encoding='UTF-8')
@@ -5,10 +5,11 @@
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
-import glob
+import hashlib
 import os
 import re
 import logging
+import multiprocessing
 import xml.etree.ElementTree as ET
 
 logger = logging.getLogger(__name__)
@@ -20,6 +21,112 @@ DEFAULT_GLYPH_WIDTH = 512
 SVG_TRANSFORM_SCALE = 2.048
 
 
+OUTPUT_TYPES = ('ttf', 'woff', 'woff2')
+
+UNICODE_RANGE_RE = re.compile(r'^(?:U\+)?([0-9A-F?]+)(?:-([0-9A-F]+))?$',
+                              re.IGNORECASE)
+
+# Libraries that can create the glyph outlines.
+BACKENDS = ('fontforge', 'fonttools')
+DEFAULT_BACKEND = 'fontforge'
+
+# Tables the color glyphs are stored in, COLR glyphs that can't be
+# converted are stored in the SVG table.
+COLOR_FORMATS = ('svg', 'colrv0', 'colrv1')
+DEFAULT_COLOR_FORMAT = 'svg'
+
+
+def get_color_transform(conf):
+    """
+    Get the transform added to the color SVGs, color_svg_transform is an
+    alias of color_transform.
+    """
+    return conf.get('color_transform', conf.get('color_svg_transform'))
+
+
+def get_output_types(conf):
+    """
+    Get the list of output types from a comma separated string or list.
+    """
+    output_types = conf.get('output_types', ['ttf'])
+    if not isinstance(output_types, (list, tuple)):
+        output_types = output_types.split(',')
+    output_types = [t.strip().lower() for t in output_types if t.strip()]
+    for output_type in output_types:
+        if output_type not in OUTPUT_TYPES:
+            raise ValueError("Unknown output type: {}".format(output_type))
+    return output_types
+
+
+def get_output_filepaths(output_file, output_types):
+    """
+    Get (output_type, filepath) for each output type. A single output type
+    is written to output_file as is, otherwise the file extension is
+    replaced by the output type.
+    """
+    if len(output_types) == 1:
+        return [(output_types[0], output_file)]
+
+    (base, ext) = os.path.splitext(output_file)
+    if ext[1:].lower() not in OUTPUT_TYPES:
+        base = output_file
+    return [(output_type, "{}.{}".format(base, output_type))
+            for output_type in output_types]
+
+
+def parse_version(version):
+    """
+    Convert a version string such as 4.5.0 or 2.5b1 to a tuple of ints for
+    comparison.
+    """
+    numbers = []
+    for part in version.split('.'):
+        match = re.match(r'\d+', part)
+        if match is None:
+            break
+        numbers.append(int(match.group()))
+        if match.end() != len(part):
+            # Pre-release suffix such as b1 or dev0
+            break
+    return tuple(numbers)
+
+
+def parse_unicode_range(text):
+    """
+    Parse a CSS unicode-range value such as "U+0-FF, U+1F6??" into a set
+    of code points.
+    """
+    codepoints = set()
+    for part in text.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        match = UNICODE_RANGE_RE.match(part)
+        if match is None:
+            raise ValueError("Invalid unicode range: {}".format(part))
+        (start, end) = match.groups()
+        if end is None:
+            # Wildcards cover all values of the digit.
+            end = start.replace('?', 'F')
+            start = start.replace('?', '0')
+        elif '?' in start:
+            raise ValueError("Invalid unicode range: {}".format(part))
+        codepoints.update(range(int(start, 16), int(end, 16) + 1))
+    return codepoints
+
+
+def get_jobs(conf):
+    """
+    Number of worker processes to use, 0 means one per CPU.
+    """
+    jobs = conf.get('jobs', 1)
+    if jobs is None:
+        return 1
+    if jobs < 1:
+        return multiprocessing.cpu_count()
+    return jobs
+
+
 def codepoint_from_filepath(filepath):
     (filename, _) = os.path.splitext(os.path.basename(filepath))
 
@@ -32,8 +139,22 @@ def codepoint_from_filepath(filepath):
     return (codepoint, filename)
 
 
-def get_svg_filepaths(svg_dir):
-    return [filename for filename in glob.glob(os.path.join(svg_dir, '*.svg'))]
+def file_stat(filepath):
+    """
+    Get the (mtime, size) of a file to detect changes.
+    """
+    stat = os.stat(filepath)
+    return (stat.st_mtime, stat.st_size)
+
+
+def file_digest(filepath):
+    """
+    Get a hex digest of the file contents.
+    """
+    f = open(filepath, "rb")
+    digest = hashlib.sha1(f.read()).hexdigest()
+    f.close()
+    return digest
 
 
 def read_file(file_path):
@@ -43,36 +164,63 @@ def read_file(file_path):
     return data
 
 
-def get_dimensions(svg_filepath):
+def read_root_attrib(svg_filepath):
     """
-    Load and parse the SVG XML. Return the height and width
+    Read only the attributes of the SVG root element. Parsing stops at the
+    first element, so the size of the rest of the document doesn't matter.
     """
-    tree = ET.parse(svg_filepath)
-    root = tree.getroot()
+    f = open(svg_filepath, "rb")
+    try:
+        for _, element in ET.iterparse(f, events=('start',)):
+            return dict(element.attrib)
+    finally:
+        f.close()
+    return {}
+
 
+def dimensions_from_attrib(attrib):
+    """
+    Return the height and width from the SVG root attributes.
+    """
     # Try to get the height/width attribs
     try:
-        height = root.attrib['height']
-        width = root.attrib['width']
+        height = attrib['height']
+        width = attrib['width']
     except KeyError:
         # Try to get the viewBox. Format: 0 0 200 200
         # Todo: Can fail with key error
-        dims = root.attrib['viewBox'].split(' ')
-        height = dims[2]
-        width = dims[3]
+        dims = re.split(r"[\s,]+", attrib['viewBox'].strip())
+        width = dims[2]
+        height = dims[3]
 
     # Strip all non-numbers and convert to float
-    height = float(re.sub("[^0-9\.]", "", height))
-    width = float(re.sub("[^0-9\.]", "", width))
+    height = float(re.sub(r"[^0-9\.]", "", height))
+    width = float(re.sub(r"[^0-9\.]", "", width))
+
+    return (height, width)
+
+
+def get_dimensions(svg_filepath):
+    """
+    Load and parse the SVG XML. Return the height and width
+    """
+    (height, width) = dimensions_from_attrib(read_root_attrib(svg_filepath))
 
     logger.debug("Found SVG width/height (%.2f/%.2f)", width, height)
     return (height, width)
 
 
+def glyph_width(svg_height, svg_width):
+    """
+    Find the glyph width for the SVG dimensions.
+    """
+    glyph_ratio = svg_width / svg_height
+    return int(FONT_EM * glyph_ratio)
+
+
 def get_glyph_width(filepath):
     """
     Given the filepath of a SVG, find the glyph width.
     """
     svg_height, svg_width = get_dimensions(filepath)
-    glyph_ratio = svg_width / svg_height
-    return int(FONT_EM * glyph_ratio)
+    return glyph_width(svg_height, svg_width)
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+# SCFBuild is released under the GNU General Public License v3.
+# See LICENSE.txt in the project root directory.
+'''
+Watch the SVG directories and rebuild the font when they change
+'''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import logging
+import os
+import time
+
+from . import util
+from .sources import SourceFinder
+
+logger = logging.getLogger(__name__)
+
+# Seconds
+DEFAULT_INTERVAL = 1.0
+
+
+def snapshot(finder, sources):
+    """
+    Get the (mtime, size) of every SVG file of the sources, and of the
+    manifest files.
+    """
+    state = {}
+    for source in sources:
+        try:
+            filepaths = finder.find(source)
+        except OSError:
+            # Missing, the build reports it
+            continue
+        if os.path.isfile(source):
+            filepaths = [source] + filepaths
+        for filepath in filepaths:
+            try:
+                state[filepath] = util.file_stat(filepath)
+            except OSError:
+                # Removed while scanning
+                pass
+    return state
+
+
+def changed_files(old_state, new_state):
+    return sorted(filepath for filepath in set(old_state) | set(new_state)
+                  if old_state.get(filepath) != new_state.get(filepath))
+
+
+def watch(builder, interval=DEFAULT_INTERVAL):
+    """
+    Build the font, then poll the SVG directories and rebuild it whenever
+    a file is added, changed or removed. The builder keeps the SVG index
+    and the processed glyphs in memory, so only the changed files are
+    processed again. Runs until interrupted.
+    """
+    sources = [builder.conf[key] for key in ('glyph_svg_dir', 'color_svg_dir')
+               if key in builder.conf]
+    finder = SourceFinder(builder.conf)
+    state = None
+    try:
+        while True:
+            new_state = snapshot(finder, sources)
+            if new_state != state:
+                if state is not None:
+                    for filepath in changed_files(state, new_state):
+                        logger.info("Changed: %s", filepath)
+                state = new_state
+                rebuild(builder)
+                logger.info("Watching for changes, press Ctrl+C to stop")
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def rebuild(builder):
+    start = time.time()
+    try:
+        result = builder.run()
+    except Exception:
+        # Keep watching, the next change may fix the problem.
+        logger.exception("Build failed")
+        result = 1
+    elapsed = time.time() - start
+    if result == 0:
+        print("Built in {:.2f} seconds".format(elapsed))
+    else:
+        print("Build failed after {:.2f} seconds".format(elapsed))
+    return result
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+# SCFBuild is released under the GNU General Public License v3.
+# See LICENSE.txt in the project root directory.
+'''
+Cross reference of the glyphs of the font and the color SVGs drawn for them
+
+The index is created from the SVG files before the outlines, so missing
+regular glyphs and conflicting ligatures stop the build before the
+expensive stages. A rebuild from an existing font resolves the color SVGs
+against the glyphs of that font.
+'''
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+import logging
+
+from .ligatures import ligature_sequences
+from .unicode import ZWJ_INT, VS16_INT
+
+logger = logging.getLogger(__name__)
+
+# Glyphs created by create_font() of both outline backends.
+BUILTIN_CODEPOINTS = (0x0, 0xD, 0x20, ZWJ_INT, VS16_INT)
+
+
+class MissingGlyphException(Exception):
+    pass
+
+
+def format_sequence(sequence):
+    return ' '.join("{:X}".format(codepoint) for codepoint in sequence)
+
+
+class GlyphXref(object):
+    """
+    Glyphs are identified by code point, ligature glyphs by their
+    filename.
+    """
+
+    def __init__(self, trie):
+        self.trie = trie
+        # {code point or ligature name: filepath}, None for built-in glyphs
+        self.glyphs = dict((codepoint, None)
+                           for codepoint in BUILTIN_CODEPOINTS)
+        # {substituted code point sequence: ligature name}
+        self.sequences = {}
+        # {color SVG filepath: code point or ligature name}
+        self.color = collections.OrderedDict()
+        self.orphans = []
+        self.conflicts = []
+        self.invalid = []
+
+    def add_glyph(self, filepath, svg_info):
+        """
+        Add a regular glyph SVG.
+        """
+        if svg_info.codepoint is None:
+            self.invalid.append(filepath)
+            return
+        if svg_info.codepoint != -1:
+            self.glyphs[svg_info.codepoint] = filepath
+            return
+
+        self.glyphs[svg_info.name] = filepath
+        try:
+            sequences = ligature_sequences(svg_info.name, self.trie)
+        except ValueError:
+            self.invalid.append(filepath)
+            return
+        for sequence in sequences:
+            sequence = tuple(sequence)
+            other = self.sequences.setdefault(sequence, svg_info.name)
+            if other != svg_info.name:
+                self.conflicts.append(
+                    "{}: Substitutes {} like {}".format(
+                        filepath, format_sequence(sequence),
+                        self.glyphs[other]))
+
+    def add_font(self, font):
+        """
+        Add the glyphs of an existing font, by code point and glyph name.
+        """
+        for codepoint in font.getBestCmap():
+            self.glyphs.setdefault(codepoint, None)
+        for name in font.getGlyphOrder():
+            self.glyphs.setdefault(name, None)
+
+    def add_color(self, filepath, svg_info):
+        """
+        Resolve a color SVG to its regular glyph.
+        """
+        if svg_info.codepoint is None:
+            self.invalid.append(filepath)
+            return
+        key = svg_info.codepoint
+        if key == -1:
+            key = svg_info.name
+        if key not in self.glyphs:
+            self.orphans.append(filepath)
+            return
+        self.color[filepath] = key
+
+    def errors(self):
+        """
+        Get a message for each orphan, conflict and invalid filename.
+        """
+        errors = ["{}: No regular glyph found, one is required for each "
+                  "color glyph".format(filepath) for filepath in self.orphans]
+        errors.extend("{}: Filename is not a hex code point sequence".format(
+            filepath) for filepath in self.invalid)
+        return errors + self.conflicts
+
+    def remove_missing(self, font, cmap):
+        """
+        Forget the color SVGs of glyphs that are not in the font anymore.
+        Returns their filepaths.
+        """
+        names = set(font.getGlyphOrder())
+        missing = [filepath for filepath, key in self.color.items()
+                   if (cmap.get(key) if isinstance(key, int) else key)
+                   not in names]
+        for filepath in missing:
+            del self.color[filepath]
+        return missing
+
+    def glyph_ids(self, font, cmap):
+        """
+        Get {filepath: glyph ID} of the color SVGs in the generated font.
+        """
+        glyph_ids = {}
+        reverse = font.getReverseGlyphMap()
+        for filepath, key in self.color.items():
+            name = cmap.get(key) if isinstance(key, int) else key
+            try:
+                glyph_ids[filepath] = reverse[name]
+            except KeyError:
+                raise MissingGlyphException(
+                    'No glyph {} in the font for {}'.format(key, filepath))
+        return glyph_ids
+
+
+def create_xref(svg_index, conf, trie, font=None):
+    """
+    Index the regular glyphs, or the glyphs of an existing font, and
+    resolve every color SVG against them.
+    """
+    xref = GlyphXref(trie)
+    if font is not None:
+        xref.add_font(font)
+    else:
+        for filepath in svg_index.filepaths(conf['glyph_svg_dir']):
+            xref.add_glyph(filepath, svg_index.get(filepath))
+    for filepath in svg_index.filepaths(conf['color_svg_dir']):
+        xref.add_color(filepath, svg_index.get(filepath))
+    logger.debug("Resolved %d color SVGs to glyphs, %d orphans, "
+                 "%d conflicts", len(xref.color), len(xref.orphans),
+                 len(xref.conflicts))
+    return xref